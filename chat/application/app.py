@@ -1,8 +1,12 @@
-from fastapi import FastAPI, HTTPException
+import time
+_inicio_import = time.perf_counter()
+
+from fastapi import FastAPI, Header, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from pydantic import BaseModel
-from typing import Optional
+from typing import Dict, List, Optional
+import asyncio
 import sys
 import os
 
@@ -10,6 +14,20 @@ import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from service.llm import LLMService
+from service.cancellation import CancellationToken
+from service.executor import InferenceExecutor, FilaCheiaError, ServicoSobrecarregadoError
+from service.metrics import CONTENT_TYPE as CONTENT_TYPE_METRICAS, METRICAS, MedicaoGeracao
+from service import modes
+from service.bulk import ItemLote, agrupar_por_tamanho, custo_lote, linha_ndjson
+from service.scheduler import CLASSES, Agendamento
+from service.streaming import formatar_sse
+from service.response_cache import ResponseCache, normalizar_pergunta
+from service.semantic_cache import SemanticCache
+from service.prefork import uso_memoria
+from service.runtime import configurar as configurar_runtime, layout as layout_runtime
+
+# Tempo gasto importando FastAPI, torch e transformers
+tempo_import = time.perf_counter() - _inicio_import
 
 # Criar a aplicação FastAPI
 app = FastAPI(
@@ -28,14 +46,32 @@ app.add_middleware(
 )
 
 # Modelos Pydantic para request/response
+class Turn(BaseModel):
+    question: str
+    response: str
+
 class QuestionRequest(BaseModel):
     question: str
-    max_tokens: Optional[int] = 256
+    mode: Optional[str] = None  # fast (sem pensamento, guloso), balanced ou deep; None = LLM_DEFAULT_MODE
+    max_tokens: Optional[int] = None  # None usa o padrão do modo (256 sem modo)
+    do_sample: Optional[bool] = None  # None usa o padrão do modo; False = decodificação gulosa
+    temperature: Optional[float] = None  # sobrescrevem a decodificação do modo
+    top_p: Optional[float] = None
+    top_k: Optional[int] = None
+    repetition_penalty: Optional[float] = None
+    cache: Optional[bool] = None  # True permite cache com amostragem; False ignora o cache
+    speculative: Optional[bool] = None  # decodificação especulativa por n-gramas (None = padrão do servidor)
+    timeout_s: Optional[float] = None  # prazo da requisição; ao expirar a saída parcial é retornada
+    max_thinking_tokens: Optional[int] = None  # limite do pensamento; com ele max_tokens vale só para a resposta
+    session_id: Optional[str] = None  # conversa (ex.: chat_id) cujo cache KV é reaproveitado entre turnos
+    history: Optional[List[Turn]] = None  # turnos anteriores, do mais antigo ao mais recente
+    priority: Optional[str] = None  # interactive, standard ou batch (padrão: pelo endpoint)
     
     class Config:
         json_schema_extra = {
             "example": {
                 "question": "Quem foi a primeira pessoa no espaço?",
+                "mode": "fast",
                 "max_tokens": 256
             }
         }
@@ -44,20 +80,283 @@ class QuestionResponse(BaseModel):
     question: str
     thinking: str
     response: str
+    cached: bool = False
+    speculative: Optional[Dict] = None  # estatísticas de aceitação, quando usada
+    stop_reason: Optional[str] = None  # stop, length, cancelled ou deadline
+    mode: Optional[str] = None
+    thinking_tokens: Optional[int] = None
+    response_tokens: Optional[int] = None
     
     class Config:
         json_schema_extra = {
             "example": {
                 "question": "Quem foi a primeira pessoa no espaço?",
                 "thinking": "Processo de raciocínio do modelo...",
-                "response": "Yuri Gagarin foi a primeira pessoa no espaço..."
+                "response": "Yuri Gagarin foi a primeira pessoa no espaço...",
+                "cached": False
             }
         }
 
-# Inicializar o serviço LLM (carrega o modelo na inicialização)
-print("Inicializando serviço LLM...")
-llm_service = LLMService()
-print("Serviço LLM pronto!")
+class BulkQuestionRequest(BaseModel):
+    questions: List[QuestionRequest]
+    timeout_s: Optional[float] = None  # prazo do lote inteiro (o timeout_s de cada pergunta é ignorado)
+    
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "questions": [
+                    {"question": "Quem foi a primeira pessoa no espaço?", "mode": "fast"},
+                    {"question": "Qual é a capital da Austrália?", "mode": "fast"}
+                ]
+            }
+        }
+
+# Threads intra/inter-op e núcleos deste processo (no modo com vários workers
+# o processo filho já configurou antes de importar a aplicação)
+configurar_runtime()
+
+# Serviço LLM: o modelo é carregado e aquecido em segundo plano (ver iniciar_servico_llm),
+# então o servidor já aceita conexões e /saude responde durante a carga
+# LLM_SERVICE=fake troca o modelo por um substituto determinístico, sem pesos (benchmarks)
+if os.getenv("LLM_SERVICE", "qwen") == "fake":
+    from service.fake_llm import FakeLLMService
+    llm_service = FakeLLMService(carregar=False)
+else:
+    llm_service = LLMService(carregar=False)
+llm_service.tempos_inicializacao["import_s"] = round(tempo_import, 3)
+
+# Executor de inferência: as gerações rodam em threads dedicadas, fora do event loop.
+# Com batching contínuo cada worker ocupa uma vaga do batch compartilhado.
+workers_padrao = llm_service.max_batch_size if llm_service.continuous_batching else 1
+# A fila ordena as tarefas por prioridade, custo e cliente, com envelhecimento (service/scheduler.py)
+inference_executor = InferenceExecutor(
+    max_workers=int(os.getenv("LLM_WORKERS", str(workers_padrao))),
+    max_queue=int(os.getenv("LLM_MAX_QUEUE", "32")),
+    max_wait_s=float(os.getenv("LLM_MAX_WAIT_S", "120")),
+    envelhecimento=float(os.getenv("LLM_SCHED_AGING", "32")),
+    penalidade_cliente=float(os.getenv("LLM_SCHED_CLIENT_PENALTY", "256"))
+)
+
+# Cache de respostas (opcional) na frente do LLMService
+response_cache = None
+if os.getenv("LLM_RESPONSE_CACHE", "1") == "1":
+    response_cache = ResponseCache(
+        max_entries=int(os.getenv("LLM_RESPONSE_CACHE_SIZE", "1024")),
+        ttl_s=float(os.getenv("LLM_RESPONSE_CACHE_TTL_S", "3600"))
+    )
+
+# Cache semântico (opcional): perguntas parecidas reaproveitam a mesma resposta.
+# Depende da dimensão do modelo, então é criado quando o modelo termina de carregar.
+semantic_cache = None
+
+def criar_cache_semantico():
+    global semantic_cache
+    if os.getenv("LLM_SEMANTIC_CACHE", "0") == "1":
+        semantic_cache = SemanticCache(
+            dim=llm_service.dimensao_embedding,
+            capacidade=int(os.getenv("LLM_SEMANTIC_CACHE_SIZE", "2048")),
+            threshold=float(os.getenv("LLM_SEMANTIC_CACHE_THRESHOLD", "0.92")),
+            caminho=os.getenv("LLM_SEMANTIC_CACHE_PATH", "semantic_cache.npz") or None
+        )
+
+# Prazo máximo de uma requisição (0 = sem limite) e intervalo de checagem de desconexão
+TIMEOUT_MAXIMO_S = float(os.getenv("LLM_MAX_REQUEST_TIMEOUT_S", "0")) or None
+INTERVALO_DESCONEXAO_S = 0.5
+
+# Modo das requisições que não escolhem um (vazio = padrões do serviço) e max_tokens sem modo
+MODO_PADRAO = os.getenv("LLM_DEFAULT_MODE", "") or None
+MAX_TOKENS_PADRAO = 256
+
+# Limites do /perguntas-lote: perguntas por requisição, tokens somados (prompts + gerações)
+# de todas elas, linhas de cada lote com padding, tokens de cada lote (linhas x maior
+# prompt + geração) e lotes executando ao mesmo tempo por requisição
+LOTE_MAX_PERGUNTAS = int(os.getenv("LLM_BULK_MAX_QUESTIONS", "512"))
+LOTE_MAX_TOKENS = int(os.getenv("LLM_BULK_MAX_TOKENS", "262144"))
+LOTE_TAMANHO = int(os.getenv("LLM_BULK_BATCH_SIZE", "8"))
+LOTE_MAX_TOKENS_BATCH = int(os.getenv("LLM_BULK_BATCH_TOKENS", "8192"))
+LOTE_SIMULTANEOS = int(os.getenv("LLM_BULK_CONCURRENT_BATCHES", "1"))
+
+def resolver_geracao(request: QuestionRequest) -> Dict:
+    """
+    Valida a pergunta e combina o modo com os parâmetros enviados
+    
+    Recusa com 400 perguntas vazias, modos desconhecidos e valores fora da faixa.
+    
+    Returns:
+        Dict com 'modo', 'max_tokens', 'max_thinking_tokens' e os overrides de 'sampling'
+    """
+    if not request.question or request.question.strip() == "":
+        raise HTTPException(status_code=400, detail="A pergunta não pode estar vazia")
+    try:
+        geracao = modes.resolver(
+            request.mode or MODO_PADRAO,
+            max_tokens=request.max_tokens,
+            max_thinking_tokens=request.max_thinking_tokens,
+            do_sample=request.do_sample,
+            temperature=request.temperature,
+            top_p=request.top_p,
+            top_k=request.top_k,
+            repetition_penalty=request.repetition_penalty
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if geracao["max_tokens"] is None:
+        geracao["max_tokens"] = MAX_TOKENS_PADRAO
+    if geracao["max_thinking_tokens"] is None:
+        geracao["max_thinking_tokens"] = llm_service.max_thinking_tokens
+    return geracao
+
+def chave_de_cache(request: QuestionRequest, geracao: Dict, sampling):
+    """Retorna a chave de cache da requisição, ou None se ela não usa cache"""
+    if response_cache is None and semantic_cache is None:
+        return None
+    if not ResponseCache.pode_armazenar(sampling, request.cache):
+        return None
+    if request.history:
+        # A resposta depende dos turnos anteriores, não só da pergunta
+        return None
+    return ResponseCache.chave(request.question, geracao["max_tokens"], llm_service.identificador, sampling,
+                               geracao["max_thinking_tokens"])
+
+async def consultar_caches(request: QuestionRequest, geracao: Dict, sampling):
+    """
+    Procura a resposta no cache exato e depois no semântico
+    
+    Returns:
+        (resultado ou None, chave do cache, embedding da pergunta ou None)
+    """
+    chave = chave_de_cache(request, geracao, sampling)
+    if chave is None:
+        return None, None, None
+    
+    if response_cache is not None:
+        result = response_cache.get(chave)
+        if result is not None:
+            return result, chave, None
+    
+    vetor = None
+    result = None
+    if semantic_cache is not None:
+        # Fora da fila de admissão: um acerto do cache não espera atrás das gerações
+        vetor = await asyncio.get_running_loop().run_in_executor(
+            None, llm_service.embed, normalizar_pergunta(request.question)
+        )
+        # O escopo é a chave sem a pergunta: mesmo modelo, max_tokens e decodificação
+        result = semantic_cache.buscar(vetor, repr(chave[1:]), pergunta=request.question)
+    return result, chave, vetor
+
+def armazenar_nos_caches(request: QuestionRequest, chave, vetor, result):
+    """Guarda uma resposta recém-gerada nos caches ativos"""
+    if chave is None:
+        return
+    if response_cache is not None:
+        response_cache.put(chave, result)
+    if semantic_cache is not None and vetor is not None:
+        semantic_cache.adicionar(vetor, request.question, result, repr(chave[1:]))
+
+def erro_de_admissao(erro: Exception) -> HTTPException:
+    """Converte a recusa do executor em 429 (fila cheia) ou 503 (espera longa demais)"""
+    status_code = 429 if isinstance(erro, FilaCheiaError) else 503
+    return HTTPException(
+        status_code=status_code,
+        detail=str(erro),
+        headers={"Retry-After": str(erro.retry_after)}
+    )
+
+def registrar_erro(endpoint: str, erro: Exception, medicao: Optional[MedicaoGeracao] = None):
+    """Conta o erro em /metrics por tipo e libera a medição da requisição"""
+    if medicao is not None:
+        if medicao.finalizada:
+            # Erro da própria geração: o serviço já registrou ao falhar
+            return
+        medicao.descartar()
+    if isinstance(erro, FilaCheiaError):
+        tipo = "fila_cheia"
+    elif isinstance(erro, ServicoSobrecarregadoError):
+        tipo = "sobrecarregado"
+    elif isinstance(erro, HTTPException):
+        tipo = {400: "requisicao_invalida", 503: "nao_pronto"}.get(erro.status_code, f"http_{erro.status_code}")
+    else:
+        tipo = "interno"
+    METRICAS.erros.inc(endpoint=endpoint, type=tipo)
+
+def historico(request: QuestionRequest) -> Optional[List[Dict]]:
+    """Turnos anteriores no formato do LLMService"""
+    if not request.history:
+        return None
+    return [turno.model_dump() for turno in request.history]
+
+def identificar_cliente(request, http_request: Request, x_client_id: Optional[str]) -> Optional[str]:
+    """Para a justiça da fila: o chat (session_id), o header X-Client-Id ou o IP"""
+    session_id = getattr(request, "session_id", None)
+    if session_id:
+        return f"sessao:{session_id}"
+    if x_client_id:
+        return f"cliente:{x_client_id}"
+    return f"ip:{http_request.client.host}" if http_request.client else None
+
+async def agendar(request: QuestionRequest, geracao: Dict, classe_padrao: str,
+                  http_request: Request, x_client_id: Optional[str]) -> Agendamento:
+    """
+    Posição da requisição na fila: classe de prioridade, custo estimado
+    (tokens do prompt + limite de tokens novos) e cliente
+
+    A tokenização roda no pool padrão do loop, fora do event loop e sem
+    esperar atrás das gerações no executor de inferência.
+    """
+    classe = request.priority or classe_padrao
+    if classe not in CLASSES:
+        raise HTTPException(status_code=400,
+                            detail=f"Prioridade inválida: {classe}. Opções: {', '.join(CLASSES)}")
+    tokens_prompt, limite = await asyncio.get_running_loop().run_in_executor(
+        None, llm_service.tamanho_geracao,
+        request.question, geracao["max_tokens"], geracao["max_thinking_tokens"], historico(request)
+    )
+    return Agendamento(classe=classe, custo=tokens_prompt + limite,
+                       cliente=identificar_cliente(request, http_request, x_client_id))
+
+def exigir_pronto():
+    """Recusa com 503 enquanto o modelo carrega ou aquece"""
+    if not llm_service.pronto:
+        detalhe = f"Modelo ainda não está pronto (estado: {llm_service.estado})"
+        if llm_service.erro_inicializacao:
+            detalhe += f": {llm_service.erro_inicializacao}"
+        raise HTTPException(status_code=503, detail=detalhe, headers={"Retry-After": "5"})
+
+def criar_cancelamento(request: QuestionRequest, x_request_timeout: Optional[float]) -> CancellationToken:
+    """
+    Token de cancelamento da requisição, com o prazo do header X-Request-Timeout
+    ou do campo timeout_s (vale o menor), limitado por LLM_MAX_REQUEST_TIMEOUT_S
+    """
+    prazos = [p for p in (x_request_timeout, request.timeout_s, TIMEOUT_MAXIMO_S) if p]
+    if any(p < 0 for p in prazos):
+        raise HTTPException(status_code=400, detail="O prazo da requisição deve ser positivo")
+    return CancellationToken(deadline_s=min(prazos) if prazos else None)
+
+async def aguardar_ou_cancelar(http_request: Request, future: asyncio.Future, cancelamento: CancellationToken):
+    """
+    Aguarda a geração verificando se o cliente desconectou
+    
+    Na desconexão a geração é cancelada e termina no próximo passo; o
+    resultado parcial ainda é aguardado para liberar o worker de forma limpa.
+    """
+    while True:
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), timeout=INTERVALO_DESCONEXAO_S)
+        except asyncio.TimeoutError:
+            if not cancelamento.cancelado and await http_request.is_disconnected():
+                cancelamento.cancel()
+
+# Ciclo de vida
+
+@app.on_event("startup")
+def iniciar_servico_llm():
+    """Dispara a carga e o aquecimento do modelo sem atrasar o bind da porta"""
+    llm_service.iniciar(
+        aquecimento=int(os.getenv("LLM_WARMUP", "2")),
+        max_tokens_aquecimento=int(os.getenv("LLM_WARMUP_TOKENS", "16")),
+        ao_ficar_pronto=criar_cache_semantico
+    )
 
 # Rotas da API
 
@@ -69,88 +368,203 @@ async def root():
         "versao": "1.0.0",
         "modelo": llm_service.model_name,
         "endpoints": {
-            "saude": "/saude (GET) - Verifica status da API",
+            "saude": "/saude (GET) - Verifica se a API está no ar (liveness)",
+            "pronto": "/pronto (GET) - Verifica se o modelo está pronto (readiness)",
             "pergunta": "/pergunta (POST) - Envia pergunta ao modelo",
+            "perguntas_lote": "/perguntas-lote (POST) - Envia várias perguntas; resultados em NDJSON",
             "modelo": "/modelo (GET) - Informações do modelo",
+            "metrics": "/metrics (GET) - Métricas no formato do Prometheus",
             "documentacao": "/docs - Documentação interativa"
         }
     }
 
 @app.get("/saude")
 async def verificar_saude():
-    """Verifica se a API e o modelo estão funcionando"""
+    """
+    Liveness: o processo está de pé e o event loop responde
+    
+    Responde 200 mesmo durante a carga do modelo; para saber se já dá para
+    enviar perguntas use /pronto.
+    """
     try:
         is_loaded = llm_service.model is not None and llm_service.tokenizer is not None
         return {
-            "status": "saudavel" if is_loaded else "indisponivel",
+            "status": "saudavel",
+            "estado": llm_service.estado,
+            "pronto": llm_service.pronto,
             "modelo_carregado": is_loaded,
-            "nome_modelo": llm_service.model_name
+            "nome_modelo": llm_service.model_name,
+            "fila": inference_executor.stats()
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro ao verificar saúde: {str(e)}")
 
+@app.get("/pronto")
+async def verificar_prontidao():
+    """
+    Readiness: 200 só depois que o modelo foi carregado e aquecido, 503 antes
+    
+    Traz também o tempo gasto em cada etapa da inicialização.
+    """
+    corpo = {
+        "pronto": llm_service.pronto,
+        "estado": llm_service.estado,
+        "erro": llm_service.erro_inicializacao,
+        "inicializacao": llm_service.tempos_inicializacao
+    }
+    if not llm_service.pronto:
+        return JSONResponse(status_code=503, content=corpo, headers={"Retry-After": "5"})
+    return corpo
+
 @app.post("/pergunta", response_model=QuestionResponse)
-async def enviar_pergunta(request: QuestionRequest):
+async def enviar_pergunta(request: QuestionRequest, http_request: Request,
+                          x_request_timeout: Optional[float] = Header(None),
+                          x_client_id: Optional[str] = Header(None)):
     """
     Envia uma pergunta ao modelo e retorna a resposta (modo síncrono)
     
     - **question**: A pergunta que você quer fazer ao modelo
-    - **max_tokens**: Número máximo de tokens na resposta (opcional, padrão: 512)
+    - **mode**: fast (sem pensamento, guloso), balanced ou deep; define os padrões abaixo
+    - **max_tokens**: Número máximo de tokens na resposta (opcional, padrão do modo ou 256)
+    - **max_thinking_tokens**: Limite do pensamento; ao esgotar, o modelo é levado
+      direto à resposta, que fica com os max_tokens só para ela (0 desliga o pensamento)
+    - **do_sample**: False para decodificação gulosa (cacheável por padrão)
+    - **temperature** / **top_p** / **top_k** / **repetition_penalty**: sobrescrevem o modo
+    - **cache**: True permite cachear respostas amostradas; False ignora o cache
+    - **timeout_s** (ou header X-Request-Timeout): prazo em segundos; ao expirar
+      retorna o que já foi gerado com stop_reason="deadline"
+    - **session_id** / **history**: conversa com vários turnos; o histórico entra
+      no prompt e o cache KV dos turnos anteriores fica guardado por session_id,
+      então cada turno novo só faz o prefill do que mudou
+    - **priority**: interactive, standard (padrão deste endpoint) ou batch; a fila
+      favorece classes mais altas e gerações mais curtas, com envelhecimento
+      e justiça por chat (session_id) ou cliente (header X-Client-Id, senão IP)
     """
+    medicao = None
     try:
-        # Validar entrada
-        if not request.question or request.question.strip() == "":
-            raise HTTPException(status_code=400, detail="A pergunta não pode estar vazia")
-        
-        if request.max_tokens < 1 or request.max_tokens > 1024:
-            raise HTTPException(status_code=400, detail="max_tokens deve estar entre 1 e 1024")
+        geracao = resolver_geracao(request)
+        exigir_pronto()
+        sampling = llm_service.sampling_padrao(**geracao["sampling"])
+        result, chave, vetor = await consultar_caches(request, geracao, sampling)
+        if result is not None:
+            METRICAS.requisicoes.inc(endpoint="/pergunta", outcome="cached")
+            return QuestionResponse(
+                question=request.question,
+                thinking=result["thinking"],
+                response=result["response"],
+                thinking_tokens=result.get("thinking_tokens"),
+                response_tokens=result.get("response_tokens"),
+                mode=geracao["modo"],
+                cached=True
+            )
         
-        # Gerar resposta
-        result = llm_service.generate_response(
+        # Gerar resposta no executor de inferência (não bloqueia o event loop)
+        cancelamento = criar_cancelamento(request, x_request_timeout)
+        agendamento = await agendar(request, geracao, "standard", http_request, x_client_id)
+        medicao = MedicaoGeracao("/pergunta")
+        future = asyncio.wrap_future(inference_executor.submit(
+            llm_service.generate_response,
+            agendamento=agendamento,
             prompt=request.question,
-            max_tokens=request.max_tokens
-        )
+            max_tokens=geracao["max_tokens"],
+            sampling=sampling,
+            speculative=request.speculative,
+            cancelamento=cancelamento,
+            medicao=medicao,
+            max_thinking_tokens=geracao["max_thinking_tokens"],
+            sessao=request.session_id,
+            historico=historico(request)
+        ))
+        result = await aguardar_ou_cancelar(http_request, future, cancelamento)
+        
+        # Saídas parciais (cancelamento ou prazo) não vão para o cache
+        if result["stop_reason"] in ("stop", "length"):
+            armazenar_nos_caches(request, chave, vetor, result)
         
         return QuestionResponse(
             question=request.question,
             thinking=result["thinking"],
-            response=result["response"]
+            response=result["response"],
+            speculative=result.get("speculative"),
+            stop_reason=result["stop_reason"],
+            thinking_tokens=result["thinking_tokens"],
+            response_tokens=result["response_tokens"],
+            mode=geracao["modo"]
         )
     
-    except HTTPException:
+    except HTTPException as e:
+        registrar_erro("/pergunta", e, medicao)
         raise
+    except (FilaCheiaError, ServicoSobrecarregadoError) as e:
+        registrar_erro("/pergunta", e, medicao)
+        raise erro_de_admissao(e)
     except Exception as e:
+        registrar_erro("/pergunta", e, medicao)
         raise HTTPException(status_code=500, detail=f"Erro ao processar pergunta: {str(e)}")
 
 @app.post("/pergunta-stream")
-async def enviar_pergunta_stream(request: QuestionRequest):
+async def enviar_pergunta_stream(request: QuestionRequest, http_request: Request,
+                                 x_request_timeout: Optional[float] = Header(None),
+                                 x_client_id: Optional[str] = Header(None)):
     """
     Envia uma pergunta ao modelo e retorna a resposta com streaming em tempo real
     
     - **question**: A pergunta que você quer fazer ao modelo
-    - **max_tokens**: Número máximo de tokens na resposta (opcional, padrão: 512)
+    - **mode**: fast, balanced ou deep, como em /pergunta
+    - **max_tokens**: Número máximo de tokens na resposta (opcional, padrão do modo ou 256)
+    - **max_thinking_tokens**: Limite do pensamento, como em /pergunta
+    - **do_sample** / **temperature** / **top_p** / **top_k** / **repetition_penalty** / **cache**: como em /pergunta; respostas em cache são reproduzidas imediatamente
+    - **timeout_s** (ou header X-Request-Timeout): prazo em segundos
+    - **session_id** / **history**: conversa com vários turnos, como em /pergunta
+    - **priority**: como em /pergunta; o padrão deste endpoint é interactive
+    
+    Se o cliente desconectar, a geração é cancelada no próximo token.
     
     Retorna eventos SSE (Server-Sent Events) com:
+    - queue: Primeiro evento, com a posição na fila (position, tarefas que
+      sairiam antes desta) e a espera estimada (estimated_wait_s) na admissão
     - thinking_chunk: Pedaços do pensamento do modelo
     - thinking: Pensamento completo
     - response_chunk: Pedaços da resposta
     - response: Resposta completa (opcional)
-    - done: Indica que terminou
+    - done: Indica que terminou (com stop_reason: stop, length, cancelled ou deadline
+      e as contagens thinking_tokens/response_tokens)
     """
+    medicao = None
     try:
-        # Validar entrada
-        if not request.question or request.question.strip() == "":
-            raise HTTPException(status_code=400, detail="A pergunta não pode estar vazia")
+        geracao = resolver_geracao(request)
+        exigir_pronto()
+        sampling = llm_service.sampling_padrao(stream=True, **geracao["sampling"])
+        result, chave, vetor = await consultar_caches(request, geracao, sampling)
         
-        if request.max_tokens < 1 or request.max_tokens > 1024:
-            raise HTTPException(status_code=400, detail="max_tokens deve estar entre 1 e 1024")
+        if result is not None:
+            # Replay: a resposta em cache é enviada de uma vez, sem passar pelo executor
+            METRICAS.requisicoes.inc(endpoint="/pergunta-stream", outcome="cached")
+            eventos = llm_service.replay_stream(result)
+        else:
+            cancelamento = criar_cancelamento(request, x_request_timeout)
+            agendamento = await agendar(request, geracao, "interactive", http_request, x_client_id)
+            medicao = MedicaoGeracao("/pergunta-stream")
+            eventos = inference_executor.stream(
+                llm_service.generate_response_stream,
+                agendamento=agendamento,
+                evento_fila=lambda fila: formatar_sse({"type": "queue", **fila}),
+                prompt=request.question,
+                max_tokens=geracao["max_tokens"],
+                sampling=sampling,
+                speculative=request.speculative,
+                cancelamento=cancelamento,
+                medicao=medicao,
+                max_thinking_tokens=geracao["max_thinking_tokens"],
+                sessao=request.session_id,
+                historico=historico(request),
+                ao_concluir=lambda r: armazenar_nos_caches(request, chave, vetor, r),
+                ao_abandonar=cancelamento.cancel
+            )
         
         # Retornar streaming response
         return StreamingResponse(
-            llm_service.generate_response_stream(
-                prompt=request.question,
-                max_tokens=request.max_tokens
-            ),
+            eventos,
             media_type="text/event-stream",
             headers={
                 "Cache-Control": "no-cache",
@@ -158,16 +572,250 @@ async def enviar_pergunta_stream(request: QuestionRequest):
             }
         )
     
-    except HTTPException:
+    except HTTPException as e:
+        registrar_erro("/pergunta-stream", e, medicao)
         raise
+    except (FilaCheiaError, ServicoSobrecarregadoError) as e:
+        registrar_erro("/pergunta-stream", e, medicao)
+        raise erro_de_admissao(e)
     except Exception as e:
+        registrar_erro("/pergunta-stream", e, medicao)
         raise HTTPException(status_code=500, detail=f"Erro ao processar pergunta: {str(e)}")
 
+def resultado_do_lote(indice: int, request: QuestionRequest, geracao: Dict, result: Dict,
+                      cached: bool = False) -> str:
+    """Linha NDJSON com o resultado de uma pergunta do lote"""
+    resposta = QuestionResponse(
+        question=request.question,
+        thinking=result["thinking"],
+        response=result["response"],
+        stop_reason=None if cached else result["stop_reason"],
+        thinking_tokens=result.get("thinking_tokens"),
+        response_tokens=result.get("response_tokens"),
+        mode=geracao["modo"],
+        cached=cached
+    )
+    return linha_ndjson({"index": indice, **resposta.model_dump()})
+
+@app.post("/perguntas-lote")
+async def enviar_perguntas_lote(request: BulkQuestionRequest, http_request: Request,
+                                x_request_timeout: Optional[float] = Header(None),
+                                x_client_id: Optional[str] = Header(None)):
+    """
+    Envia várias perguntas de uma vez (ex.: conjuntos de avaliação)
+    
+    - **questions**: Lista de perguntas no mesmo formato de /pergunta
+    - **timeout_s** (ou header X-Request-Timeout): prazo do lote inteiro
+    
+    Os lotes entram na fila com prioridade batch, atrás das perguntas interativas.
+    
+    As perguntas são agrupadas por decodificação e tamanho do prompt e geradas
+    em lotes com padding. Os resultados chegam em NDJSON (uma linha JSON por
+    pergunta) na ordem em que ficam prontos, cada um com o "index" da pergunta
+    na requisição; respostas em cache saem primeiro. Um lote que falhar gera
+    linhas com "index" e "error". A última linha traz "done": true.
+    
+    Recusa com 400 perguntas inválidas e com 413 requisições acima de
+    LLM_BULK_MAX_QUESTIONS perguntas ou LLM_BULK_MAX_TOKENS tokens somados.
+    """
+    cancelamento = None
+    try:
+        if not request.questions:
+            raise HTTPException(status_code=400, detail="A lista de perguntas não pode estar vazia")
+        if len(request.questions) > LOTE_MAX_PERGUNTAS:
+            raise HTTPException(status_code=413, detail=f"Máximo de {LOTE_MAX_PERGUNTAS} perguntas por lote")
+        geracoes = []
+        for indice, pergunta in enumerate(request.questions):
+            if pergunta.session_id or pergunta.history:
+                raise HTTPException(status_code=400,
+                                    detail=f"Pergunta {indice}: conversas (session_id/history) não são aceitas em lote")
+            try:
+                geracoes.append(resolver_geracao(pergunta))
+            except HTTPException as e:
+                raise HTTPException(status_code=400, detail=f"Pergunta {indice}: {e.detail}")
+        exigir_pronto()
+        
+        # Cache exato primeiro (o semântico exigiria um embedding por pergunta)
+        samplings, chaves, em_cache, itens = [], [], [], []
+        for indice, (pergunta, geracao) in enumerate(zip(request.questions, geracoes)):
+            sampling = llm_service.sampling_padrao(**geracao["sampling"])
+            chave = chave_de_cache(pergunta, geracao, sampling)
+            result = response_cache.get(chave) if chave is not None and response_cache is not None else None
+            samplings.append(sampling)
+            chaves.append(chave)
+            if result is not None:
+                em_cache.append((indice, result))
+        
+        respondidas = {indice for indice, _ in em_cache}
+        pendentes = [i for i in range(len(request.questions)) if i not in respondidas]
+        # Tokenização no pool padrão do loop, fora da fila das gerações (como em agendar)
+        tamanhos = await asyncio.get_running_loop().run_in_executor(None, lambda: [
+            llm_service.tamanho_geracao(request.questions[i].question, geracoes[i]["max_tokens"],
+                                        geracoes[i]["max_thinking_tokens"])
+            for i in pendentes
+        ]) if pendentes else []
+        total = sum(prompt + limite for prompt, limite in tamanhos)
+        if total > LOTE_MAX_TOKENS:
+            raise HTTPException(status_code=413,
+                                detail=f"O lote soma {total} tokens; o máximo é {LOTE_MAX_TOKENS}")
+        for i, (tokens_prompt, limite) in zip(pendentes, tamanhos):
+            grupo = (tuple(sorted(samplings[i].as_dict().items())),
+                     geracoes[i]["max_tokens"], geracoes[i]["max_thinking_tokens"])
+            itens.append(ItemLote(indice=i, tokens_prompt=tokens_prompt, max_new_tokens=limite, grupo=grupo))
+        lotes = agrupar_por_tamanho(itens, LOTE_TAMANHO, LOTE_MAX_TOKENS_BATCH)
+        
+        cancelamento = criar_cancelamento(request, x_request_timeout)
+        cliente = identificar_cliente(request, http_request, x_client_id)
+        
+        def submeter(lote):
+            medicoes_lote = [MedicaoGeracao("/perguntas-lote") for _ in lote]
+            primeiro = lote[0].indice
+            try:
+                future = inference_executor.submit(
+                    llm_service.generate_batch,
+                    agendamento=Agendamento(classe="batch", custo=custo_lote(lote), cliente=cliente),
+                    prompts=[request.questions[item.indice].question for item in lote],
+                    max_tokens=geracoes[primeiro]["max_tokens"],
+                    sampling=samplings[primeiro],
+                    cancelamento=cancelamento,
+                    medicoes=medicoes_lote,
+                    max_thinking_tokens=geracoes[primeiro]["max_thinking_tokens"]
+                )
+            except Exception as erro:
+                for medicao in medicoes_lote:
+                    registrar_erro("/perguntas-lote", erro, medicao)
+                raise
+            return asyncio.wrap_future(future), lote, medicoes_lote
+        
+        # Os primeiros lotes são admitidos já aqui, para que uma fila cheia vire 429/503
+        restantes = iter(lotes)
+        em_execucao = [submeter(lote) for _, lote in zip(range(LOTE_SIMULTANEOS), restantes)]
+    
+    except HTTPException as e:
+        registrar_erro("/perguntas-lote", e)
+        raise
+    except (FilaCheiaError, ServicoSobrecarregadoError) as e:
+        if cancelamento is not None:
+            # Lotes já admitidos nesta requisição não têm mais quem receba o resultado
+            cancelamento.cancel()
+        raise erro_de_admissao(e)
+    except Exception as e:
+        registrar_erro("/perguntas-lote", e)
+        raise HTTPException(status_code=500, detail=f"Erro ao processar lote: {str(e)}")
+    
+    async def resultados():
+        concluido = False
+        try:
+            for indice, result in em_cache:
+                METRICAS.requisicoes.inc(endpoint="/perguntas-lote", outcome="cached")
+                yield resultado_do_lote(indice, request.questions[indice], geracoes[indice], result, cached=True)
+            
+            while em_execucao:
+                prontos, _ = await asyncio.wait([f for f, _, _ in em_execucao], return_when=asyncio.FIRST_COMPLETED)
+                for execucao in [e for e in em_execucao if e[0] in prontos]:
+                    em_execucao.remove(execucao)
+                    future, lote, medicoes_lote = execucao
+                    try:
+                        saidas = future.result()
+                    except Exception as erro:
+                        for item, medicao in zip(lote, medicoes_lote):
+                            registrar_erro("/perguntas-lote", erro, medicao)
+                            yield linha_ndjson({"index": item.indice, "error": str(erro)})
+                        continue
+                    for item, result in zip(lote, saidas):
+                        pergunta, geracao = request.questions[item.indice], geracoes[item.indice]
+                        if result["stop_reason"] in ("stop", "length"):
+                            armazenar_nos_caches(pergunta, chaves[item.indice], None, result)
+                        yield resultado_do_lote(item.indice, pergunta, geracao, result)
+                
+                # Mantém LLM_BULK_CONCURRENT_BATCHES lotes em execução
+                for lote in restantes:
+                    try:
+                        em_execucao.append(submeter(lote))
+                    except (FilaCheiaError, ServicoSobrecarregadoError) as erro:
+                        for item in lote:
+                            yield linha_ndjson({"index": item.indice, "error": str(erro)})
+                    if len(em_execucao) >= LOTE_SIMULTANEOS:
+                        break
+            
+            concluido = True
+            yield linha_ndjson({"done": True, "questions": len(request.questions), "cached": len(em_cache),
+                                "batches": len(lotes)})
+        finally:
+            if not concluido:
+                # Cliente desconectou: os lotes em execução param no próximo passo
+                cancelamento.cancel()
+    
+    return StreamingResponse(
+        resultados(),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache"}
+    )
+
+@app.get("/metrics")
+async def metricas():
+    """
+    Métricas de latência, tokens, fila e erros no formato de texto do Prometheus
+    
+    Com vários workers (API_WORKERS) cada coleta vem do worker que atendeu.
+    """
+    fila = inference_executor.stats()
+    METRICAS.profundidade_fila.set(fila["na_fila"])
+    METRICAS.workers_ocupados.set(fila["em_execucao"])
+    return Response(content=METRICAS.renderizar(), media_type=CONTENT_TYPE_METRICAS)
+
 @app.get("/modelo")
 async def informacoes_modelo():
     """Retorna informações sobre o modelo carregado"""
     return {
         "nome_modelo": llm_service.model_name,
+        "estado": llm_service.estado,
+        "inicializacao": llm_service.tempos_inicializacao,
         "dispositivo": str(llm_service.model.device) if llm_service.model else None,
-        "tipo_modelo": type(llm_service.model).__name__ if llm_service.model else None
-    }
\ No newline at end of file
+        "tipo_modelo": type(llm_service.model).__name__ if llm_service.model else None,
+        "precisao": llm_service.precisao,
+        "backend": llm_service.backend.stats() if llm_service.backend else llm_service.backend_nome,
+        "dtype": str(llm_service.model.dtype) if llm_service.model else None,
+        "cache_prompt_sistema": llm_service.prefix_cache.stats(),
+        "sessoes": llm_service.sessoes.stats(),
+        "cache_respostas": response_cache.stats() if response_cache is not None else None,
+        "cache_semantico": semantic_cache.stats() if semantic_cache is not None else None,
+        "interrompidas": llm_service.cancelamentos.stats(),
+        "memoria": uso_memoria(),
+        "runtime": layout_runtime(),
+        "modos": {nome: modo.as_dict() for nome, modo in modes.MODOS.items()},
+        "modo_padrao": MODO_PADRAO,
+        "fila": inference_executor.stats()
+    }
+
+@app.delete("/sessoes/{session_id}")
+async def remover_sessao(session_id: str):
+    """Libera o cache KV de uma conversa (ex.: o chat foi apagado)"""
+    if not llm_service.sessoes.remover(session_id):
+        raise HTTPException(status_code=404, detail="Sessão não encontrada")
+    return {"mensagem": "Sessão removida"}
+
+@app.get("/cache-semantico/auditoria")
+async def auditoria_cache_semantico():
+    """Acertos recentes do cache semântico, para revisão de falsos acertos"""
+    if semantic_cache is None:
+        raise HTTPException(status_code=404, detail="Cache semântico desativado")
+    return {
+        "estatisticas": semantic_cache.stats(),
+        "acertos_recentes": list(semantic_cache.auditoria)
+    }
+
+@app.post("/cache-semantico/falso-acerto/{entrada_id}")
+async def marcar_falso_acerto(entrada_id: int):
+    """Remove do cache semântico uma entrada que gerou um falso acerto"""
+    if semantic_cache is None:
+        raise HTTPException(status_code=404, detail="Cache semântico desativado")
+    if not semantic_cache.marcar_falso_acerto(entrada_id):
+        raise HTTPException(status_code=404, detail="Entrada não encontrada")
+    return {"mensagem": "Entrada removida do cache semântico"}
+
+@app.on_event("shutdown")
+def salvar_cache_semantico():
+    """Persiste o índice semântico para sobreviver a reinicializações"""
+    if semantic_cache is not None:
+        semantic_cache.salvar()
@@ -0,0 +1,370 @@
+"""
+Benchmark de carga e latência da API de chat
+
+Dispara perguntas contra a API FastAPI (/pergunta e /pergunta-stream) ou
+contra as views do Django (/pergunta e /pergunta-stream), com concorrência
+fixa (cada cliente envia a próxima pergunta assim que recebe a resposta)
+ou com uma taxa de chegada (chegadas de Poisson, independentes das
+respostas). Mede tempo até o primeiro token, latência entre tokens,
+latência total, tokens/s e erros, e grava o resultado em JSON para
+comparar com execuções anteriores.
+
+Só usa a biblioteca padrão. Para medir só as camadas de serviço e
+streaming, sem baixar pesos, suba a API com o modelo falso:
+    LLM_SERVICE=fake python run_api.py
+
+Exemplos (a partir da pasta chat/):
+    python benchmark.py --modo stream --concorrencia 8 --requisicoes 200 --saida base.json
+    python benchmark.py --modo sync --taxa 5 --duracao 60
+    python benchmark.py --alvo django --modo stream --concorrencia 4
+    python benchmark.py --modo stream --concorrencia 8 --comparar base.json
+"""
+import argparse
+import http.client
+import json
+import math
+import random
+import sys
+import threading
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+from urllib.parse import urlparse
+
+URLS_PADRAO = {"fastapi": "http://localhost:8000", "django": "http://localhost:8001"}
+
+PERGUNTAS_PADRAO = [
+    "Quem foi a primeira pessoa no espaço?",
+    "Quem inventou a lâmpada?",
+    "Qual é a capital da Austrália?",
+    "Explique em uma frase o que é fotossíntese.",
+    "Qual é o maior planeta do sistema solar?",
+    "Quem escreveu Dom Casmurro?",
+]
+
+# Eventos que carregam texto gerado em cada alvo
+EVENTOS_CONTEUDO = {
+    "fastapi": ("thinking_chunk", "response_chunk"),
+    "django": ("thinking", "response"),
+}
+
+# Métricas comparadas com o resultado de referência: (grupo, estatística, maior é melhor)
+METRICAS_REGRESSAO = [
+    ("ttft_s", "p50", False),
+    ("ttft_s", "p95", False),
+    ("latencia_s", "p50", False),
+    ("latencia_s", "p95", False),
+    ("itl_s", "p95", False),
+    ("vazao", "tokens_por_s", True),
+    ("vazao", "requisicoes_por_s", True),
+]
+
+
+def percentis(valores: List[float]) -> Dict[str, Optional[float]]:
+    """Média e percentis p50/p90/p95/p99 (interpolação linear entre vizinhos)"""
+    if not valores:
+        return {"n": 0, "media": None, "p50": None, "p90": None, "p95": None, "p99": None, "max": None}
+    ordenados = sorted(valores)
+
+    def percentil(p: float) -> float:
+        posicao = (len(ordenados) - 1) * p / 100
+        abaixo, acima = math.floor(posicao), math.ceil(posicao)
+        fracao = posicao - abaixo
+        return ordenados[abaixo] + (ordenados[acima] - ordenados[abaixo]) * fracao
+
+    return {
+        "n": len(ordenados),
+        "media": round(sum(ordenados) / len(ordenados), 4),
+        "p50": round(percentil(50), 4),
+        "p90": round(percentil(90), 4),
+        "p95": round(percentil(95), 4),
+        "p99": round(percentil(99), 4),
+        "max": round(ordenados[-1], 4),
+    }
+
+
+def ler_sse(resposta) -> Iterator[Tuple[Optional[str], str]]:
+    """Lê um corpo text/event-stream e produz (nome do evento, data) por evento"""
+    evento, dados = None, []
+    while True:
+        linha = resposta.readline()
+        if not linha:
+            break
+        linha = linha.decode("utf-8").rstrip("\r\n")
+        if not linha:
+            if dados:
+                yield evento, "\n".join(dados)
+            evento, dados = None, []
+        elif linha.startswith("event:"):
+            evento = linha[6:].strip()
+        elif linha.startswith("data:"):
+            dados.append(linha[5:].lstrip())
+    if dados:
+        yield evento, "\n".join(dados)
+
+
+def tipo_do_evento(nome: Optional[str], dados: str) -> Optional[str]:
+    """Tipo do evento: o nome 'event:' (Django) ou o campo 'type' do JSON (FastAPI)"""
+    if nome:
+        return nome
+    try:
+        return json.loads(dados).get("type")
+    except (ValueError, AttributeError):
+        return None
+
+
+class Cliente:
+    """Executa uma pergunta e mede o tempo de cada parte"""
+
+    def __init__(self, alvo: str, url: str, modo: str, max_tokens: int, timeout: float):
+        self.alvo = alvo
+        self.modo = modo
+        self.max_tokens = max_tokens
+        self.timeout = timeout
+        partes = urlparse(url)
+        self.https = partes.scheme == "https"
+        self.host = partes.hostname
+        self.porta = partes.port or (443 if self.https else 80)
+        self.caminho = partes.path.rstrip("/") + ("/pergunta-stream" if modo == "stream" else "/pergunta")
+
+    def _conexao(self) -> http.client.HTTPConnection:
+        classe = http.client.HTTPSConnection if self.https else http.client.HTTPConnection
+        return classe(self.host, self.porta, timeout=self.timeout)
+
+    def executar(self, pergunta: str) -> Dict:
+        corpo = {"question": pergunta}
+        if self.alvo == "fastapi":
+            corpo["max_tokens"] = self.max_tokens
+        medicao = {"ok": False, "status": None, "erro": None, "ttft_s": None,
+                   "latencia_s": None, "tokens": 0, "itl_s": []}
+
+        inicio = time.perf_counter()
+        conexao = self._conexao()
+        try:
+            conexao.request("POST", self.caminho, body=json.dumps(corpo).encode("utf-8"),
+                            headers={"Content-Type": "application/json", "Accept": "text/event-stream"})
+            resposta = conexao.getresponse()
+            medicao["status"] = resposta.status
+            if resposta.status != 200:
+                resposta.read()
+                medicao["erro"] = f"HTTP {resposta.status}"
+            elif self.modo == "stream":
+                self._medir_stream(resposta, inicio, medicao)
+            else:
+                self._medir_sync(resposta, inicio, medicao)
+        except Exception as erro:
+            medicao["erro"] = f"{type(erro).__name__}: {erro}"
+        finally:
+            conexao.close()
+        medicao["latencia_s"] = time.perf_counter() - inicio
+        return medicao
+
+    def _medir_stream(self, resposta, inicio: float, medicao: Dict):
+        eventos_conteudo = EVENTOS_CONTEUDO[self.alvo]
+        ultimo = None
+        for nome, dados in ler_sse(resposta):
+            agora = time.perf_counter()
+            tipo = tipo_do_evento(nome, dados)
+            if tipo == "error":
+                medicao["erro"] = dados
+                return
+            if tipo not in eventos_conteudo:
+                continue
+            medicao["tokens"] += 1
+            if ultimo is None:
+                medicao["ttft_s"] = agora - inicio
+            else:
+                medicao["itl_s"].append(agora - ultimo)
+            ultimo = agora
+        medicao["ok"] = True
+
+    def _medir_sync(self, resposta, inicio: float, medicao: Dict):
+        dados = json.loads(resposta.read())
+        # Sem streaming o primeiro token chega junto com a resposta completa
+        medicao["ttft_s"] = time.perf_counter() - inicio
+        if "response_tokens" in dados:
+            medicao["tokens"] = dados.get("thinking_tokens", 0) + dados["response_tokens"]
+        else:
+            # Estimativa pelo número de palavras quando a API não informa os tokens
+            medicao["tokens"] = len(f"{dados.get('thinking', '')} {dados.get('response', '')}".split())
+        medicao["ok"] = True
+
+
+def executar_carga(cliente: Cliente, perguntas: List[str], concorrencia: int = 1,
+                   taxa: Optional[float] = None, requisicoes: Optional[int] = None,
+                   duracao: Optional[float] = None, semente: int = 0) -> Tuple[List[Dict], float]:
+    """
+    Dispara a carga e retorna (medições, tempo total)
+
+    Sem taxa: `concorrencia` clientes em loop fechado. Com taxa: chegadas de
+    Poisson a `taxa` req/s, cada uma em sua própria thread (loop aberto, as
+    filas do servidor aparecem na latência em vez de reduzir a carga).
+    """
+    if requisicoes is None and duracao is None:
+        requisicoes = 100
+    aleatorio = random.Random(semente)
+    medicoes: List[Dict] = []
+    lock = threading.Lock()
+    contador = [0]
+    inicio = time.perf_counter()
+
+    def proxima() -> Optional[str]:
+        with lock:
+            if requisicoes is not None and contador[0] >= requisicoes:
+                return None
+            if duracao is not None and time.perf_counter() - inicio >= duracao:
+                return None
+            contador[0] += 1
+            return perguntas[(contador[0] - 1) % len(perguntas)]
+
+    def registrar(pergunta: str):
+        medicao = cliente.executar(pergunta)
+        with lock:
+            medicoes.append(medicao)
+
+    threads = []
+    if taxa:
+        while True:
+            pergunta = proxima()
+            if pergunta is None:
+                break
+            thread = threading.Thread(target=registrar, args=(pergunta,), daemon=True)
+            thread.start()
+            threads.append(thread)
+            time.sleep(aleatorio.expovariate(taxa))
+    else:
+        def loop():
+            while True:
+                pergunta = proxima()
+                if pergunta is None:
+                    return
+                registrar(pergunta)
+
+        threads = [threading.Thread(target=loop, daemon=True) for _ in range(concorrencia)]
+        for thread in threads:
+            thread.start()
+
+    for thread in threads:
+        thread.join()
+    return medicoes, time.perf_counter() - inicio
+
+
+def resumir(medicoes: List[Dict], tempo_total: float) -> Dict:
+    """Agrega as medições em percentis, vazão e taxa de erro"""
+    ok = [m for m in medicoes if m["ok"]]
+    erros: Dict[str, int] = {}
+    for medicao in medicoes:
+        if not medicao["ok"]:
+            erros[medicao["erro"] or "desconhecido"] = erros.get(medicao["erro"] or "desconhecido", 0) + 1
+
+    tokens_por_requisicao = []
+    for medicao in ok:
+        geracao = medicao["latencia_s"] - (medicao["ttft_s"] or 0)
+        if medicao["tokens"] > 1 and geracao > 0:
+            tokens_por_requisicao.append((medicao["tokens"] - 1) / geracao)
+
+    total_tokens = sum(m["tokens"] for m in ok)
+    return {
+        "requisicoes": len(medicoes),
+        "sucesso": len(ok),
+        "taxa_erro": round(1 - len(ok) / len(medicoes), 4) if medicoes else 0.0,
+        "erros": erros,
+        "ttft_s": percentis([m["ttft_s"] for m in ok if m["ttft_s"] is not None]),
+        "itl_s": percentis([gap for m in ok for gap in m["itl_s"]]),
+        "latencia_s": percentis([m["latencia_s"] for m in ok]),
+        "tokens_por_s_requisicao": percentis(tokens_por_requisicao),
+        "vazao": {
+            "tempo_total_s": round(tempo_total, 3),
+            "tokens": total_tokens,
+            "tokens_por_s": round(total_tokens / tempo_total, 2) if tempo_total > 0 else 0.0,
+            "requisicoes_por_s": round(len(ok) / tempo_total, 3) if tempo_total > 0 else 0.0,
+        },
+    }
+
+
+def comparar(atual: Dict, referencia: Dict, tolerancia: float = 0.10) -> List[Dict]:
+    """
+    Compara um resumo com o de referência e lista as métricas que pioraram
+
+    Uma métrica é regressão quando piora mais que `tolerancia` (fração)
+    em relação à referência.
+    """
+    regressoes = []
+    for grupo, estatistica, maior_melhor in METRICAS_REGRESSAO:
+        antes = referencia.get(grupo, {}).get(estatistica)
+        depois = atual.get(grupo, {}).get(estatistica)
+        if not antes or depois is None:
+            continue
+        variacao = (depois - antes) / antes
+        piorou = variacao < -tolerancia if maior_melhor else variacao > tolerancia
+        if piorou:
+            regressoes.append({
+                "metrica": f"{grupo}.{estatistica}",
+                "referencia": antes,
+                "atual": depois,
+                "variacao": round(variacao, 4),
+            })
+    return regressoes
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark de carga da API de chat")
+    parser.add_argument("--alvo", choices=("fastapi", "django"), default="fastapi")
+    parser.add_argument("--url", help="URL base (padrão: localhost:8000 para fastapi, :8001 para django)")
+    parser.add_argument("--modo", choices=("sync", "stream"), default="stream")
+    parser.add_argument("--concorrencia", type=int, default=1, help="Clientes simultâneos (loop fechado)")
+    parser.add_argument("--taxa", type=float, help="Chegadas por segundo (loop aberto, ignora --concorrencia)")
+    parser.add_argument("--requisicoes", type=int, help="Total de requisições (padrão: 100 se sem --duracao)")
+    parser.add_argument("--duracao", type=float, help="Duração máxima em segundos")
+    parser.add_argument("--max-tokens", type=int, default=256)
+    parser.add_argument("--timeout", type=float, default=180.0)
+    parser.add_argument("--perguntas", help="Arquivo com uma pergunta por linha")
+    parser.add_argument("--semente", type=int, default=0)
+    parser.add_argument("--saida", help="Grava o resultado em JSON")
+    parser.add_argument("--comparar", help="JSON de uma execução anterior para detectar regressões")
+    parser.add_argument("--tolerancia", type=float, default=0.10, help="Piora aceita antes de acusar regressão")
+    args = parser.parse_args(argv)
+
+    perguntas = PERGUNTAS_PADRAO
+    if args.perguntas:
+        with open(args.perguntas, encoding="utf-8") as arquivo:
+            perguntas = [linha.strip() for linha in arquivo if linha.strip()]
+
+    url = args.url or URLS_PADRAO[args.alvo]
+    cliente = Cliente(args.alvo, url, args.modo, args.max_tokens, args.timeout)
+    carga = f"taxa {args.taxa}/s" if args.taxa else f"concorrência {args.concorrencia}"
+    print(f"Benchmark {args.alvo} {args.modo} em {url} ({carga})...", file=sys.stderr)
+
+    medicoes, tempo_total = executar_carga(
+        cliente, perguntas, concorrencia=args.concorrencia, taxa=args.taxa,
+        requisicoes=args.requisicoes, duracao=args.duracao, semente=args.semente
+    )
+    resultado = {
+        "configuracao": {
+            "alvo": args.alvo,
+            "url": url,
+            "modo": args.modo,
+            "concorrencia": None if args.taxa else args.concorrencia,
+            "taxa": args.taxa,
+            "max_tokens": args.max_tokens,
+            "inicio": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "resumo": resumir(medicoes, tempo_total),
+    }
+
+    codigo = 0
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as arquivo:
+            referencia = json.load(arquivo)
+        resultado["regressoes"] = comparar(resultado["resumo"], referencia["resumo"], args.tolerancia)
+        codigo = 1 if resultado["regressoes"] else 0
+
+    texto = json.dumps(resultado, indent=2, ensure_ascii=False)
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as arquivo:
+            arquivo.write(texto)
+    print(texto)
+    return codigo
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -87,8 +87,7 @@ async function sendMessage() {
                     const dataStr = line.slice(6);
                     
                     try {
-                        // Usar eval para processar a string Python-like
-                        const data = eval('(' + dataStr + ')');
+                        const data = JSON.parse(dataStr);
                         
                         if (data.type === 'thinking_chunk') {
                             updateStreamingThinking(streamElements.thinking, data.content);
@@ -1,14 +1,33 @@
 """
 Script para iniciar a API do Chat com LLM
+
+Com API_WORKERS > 1 o modelo é carregado uma vez no processo pai e
+compartilhado pelos workers (ver service/prefork.py).
 """
+import os
+
 import uvicorn
 
 if __name__ == "__main__":
-    uvicorn.run(
-        "application.app:app",
-        host="0.0.0.0",
-        port=8000,
-        reload=True,
-        log_level="info"
-    )
+    workers = int(os.getenv("API_WORKERS", "1"))
+    if workers > 1:
+        from service.prefork import servir
 
+        servir(
+            "application.app:app",
+            host="0.0.0.0",
+            porta=8000,
+            workers=workers,
+            model_name=None if os.getenv("LLM_SERVICE") == "fake" else "Qwen/Qwen3-0.6B",
+            precisao=os.getenv("LLM_PRECISION", "auto"),
+            log_level="info"
+        )
+    else:
+        uvicorn.run(
+            "application.app:app",
+            host="0.0.0.0",
+            port=8000,
+            # Recarregar a cada mudança de código também recarrega o modelo; só para desenvolvimento
+            reload=os.getenv("API_RELOAD", "0") == "1",
+            log_level="info"
+        )
@@ -0,0 +1,402 @@
+"""
+Engines de inferência por trás do LLMService
+
+Todas seguem o mesmo contrato: gerar(input_ids, ...) retorna os IDs dos
+tokens novos e, se um streamer for passado, entrega os tokens com
+put/end (o mesmo contrato do model.generate). A engine é escolhida por
+LLM_BACKEND, sem mudanças em app.py.
+
+Uso para conferir a paridade com o caminho HF (rodar a partir da pasta chat/):
+    python -m service.backends --backend compiled
+"""
+import argparse
+import json
+import threading
+import time
+from typing import Dict, List, Optional, Sequence
+
+import torch
+from transformers import (LogitsProcessor, LogitsProcessorList, StaticCache, StoppingCriteria,
+                          StoppingCriteriaList)
+
+from service.batching import ContinuousBatcher
+from service.cancellation import CancellationToken, CancelStoppingCriteria
+from service.kv_cache import tuplas_para_cache
+from service.prefix_cache import PrefixoKV
+from service.sampling import SamplingParams
+from service.speculative import gerar_com_prompt_lookup
+from service.thinking import OrcamentoPensamento
+
+BACKENDS = ("hf", "compiled")
+
+
+class InferenceBackend:
+    """Contrato comum das engines de inferência"""
+
+    nome = "base"
+    # Aceita o cache KV do prompt de sistema (PrefixoKV) como ponto de partida
+    suporta_prefixo = False
+    # Aceita decodificação especulativa por n-gramas
+    suporta_especulativo = False
+    # Gera vários prompts juntos em um lote com padding (gerar_lote)
+    suporta_lote = False
+
+    def gerar(self, input_ids: List[int], max_new_tokens: int, sampling: SamplingParams,
+              streamer=None, prefixo: Optional[PrefixoKV] = None,
+              cancelamento: Optional[CancellationToken] = None,
+              speculative: bool = False, stats: Optional[Dict] = None,
+              orcamento: Optional[OrcamentoPensamento] = None) -> List[int]:
+        """
+        Gera a continuação de input_ids
+
+        Args:
+            input_ids: Prompt completo já tokenizado
+            max_new_tokens: Limite de tokens novos
+            sampling: Parâmetros de decodificação
+            streamer: Recebe o prompt e depois cada token (put) e o fim (end)
+            prefixo: Cache do início do prompt (ignorado se não suportado)
+            cancelamento: Interrompe a geração no próximo passo
+            speculative: Pede decodificação especulativa (ignorado se não suportado)
+            stats: Dict preenchido com estatísticas da engine, se houver
+            orcamento: Limites separados de pensamento e resposta; força o
+                </think> quando o pensamento esgota o seu limite
+
+        Returns:
+            Apenas os IDs dos tokens novos
+        """
+        raise NotImplementedError
+
+    def gerar_lote(self, lista_ids: List[List[int]], max_new_tokens: int, sampling: SamplingParams,
+                   pad_token_id: int, streamer=None,
+                   cancelamento: Optional[CancellationToken] = None,
+                   orcamentos: Optional[List[Optional[OrcamentoPensamento]]] = None) -> List[List[int]]:
+        """
+        Gera a continuação de vários prompts em um único lote com padding à esquerda
+
+        Todas as linhas usam a mesma decodificação e o mesmo limite; cada
+        uma para no próprio EOS ou no limite da própria resposta.
+
+        Args:
+            lista_ids: Prompts completos já tokenizados
+            pad_token_id: Token usado no padding
+            streamer: Recebe os prompts e depois os tokens de cada passo (um por linha)
+            orcamentos: Um OrcamentoPensamento (ou None) por linha
+
+        Returns:
+            Os IDs dos tokens novos de cada linha, na ordem de lista_ids
+        """
+        raise NotImplementedError
+
+    def stats(self) -> Dict:
+        return {"nome": self.nome}
+
+
+class HFBackend(InferenceBackend):
+    """
+    Caminho padrão: modelo eager do transformers
+
+    Usa o batching contínuo quando ativo, a decodificação especulativa
+    quando pedida e model.generate nos demais casos.
+    """
+
+    nome = "hf"
+    suporta_prefixo = True
+    suporta_especulativo = True
+    suporta_lote = True
+
+    def __init__(self, model, eos_token_ids: Sequence[int], continuous_batching: bool = True,
+                 max_batch_size: int = 8, speculative_tokens: int = 10):
+        self.model = model
+        self.eos_token_ids = list(eos_token_ids)
+        self.speculative_tokens = speculative_tokens
+        self.batcher = None
+        if continuous_batching:
+            self.batcher = ContinuousBatcher(model, eos_token_ids=self.eos_token_ids,
+                                             max_batch_size=max_batch_size)
+            print(f"Batching contínuo ativado (até {max_batch_size} sequências)")
+
+    def gerar(self, input_ids, max_new_tokens, sampling, streamer=None, prefixo=None,
+              cancelamento=None, speculative=False, stats=None, orcamento=None):
+        if speculative:
+            return gerar_com_prompt_lookup(
+                self.model,
+                input_ids,
+                max_new_tokens=max_new_tokens,
+                sampling=sampling,
+                eos_token_ids=self.eos_token_ids,
+                streamer=streamer,
+                past_key_values=tuplas_para_cache(prefixo.camadas) if prefixo is not None else None,
+                num_tokens_propostos=self.speculative_tokens,
+                stats=stats,
+                cancelamento=cancelamento,
+                orcamento=orcamento
+            )
+
+        if self.batcher is not None:
+            return self.batcher.generate(
+                input_ids,
+                max_new_tokens=max_new_tokens,
+                sampling=sampling,
+                streamer=streamer,
+                prefixo=prefixo,
+                cancelamento=cancelamento,
+                orcamento=orcamento
+            )
+
+        extra = {}
+        if prefixo is not None:
+            # Um DynamicCache novo por requisição; os tensores do prefixo não são alterados
+            extra["past_key_values"] = tuplas_para_cache(prefixo.camadas)
+        return _generate(self.model, input_ids, max_new_tokens, sampling, streamer, cancelamento,
+                         orcamento, **extra)
+
+    def gerar_lote(self, lista_ids, max_new_tokens, sampling, pad_token_id, streamer=None,
+                   cancelamento=None, orcamentos=None):
+        # Fora do batching contínuo: o lote inteiro passa por um único model.generate
+        return _generate_lote(self.model, lista_ids, max_new_tokens, sampling, pad_token_id,
+                              self.eos_token_ids, streamer, cancelamento, orcamentos)
+
+    def stats(self) -> Dict:
+        return {
+            "nome": self.nome,
+            "batching_continuo": self.batcher.ocupacao if self.batcher is not None else None,
+        }
+
+
+class CompiledBackend(InferenceBackend):
+    """
+    Modelo compilado com torch.compile e cache KV estático
+
+    O cache estático tem formato fixo, então o passo de decodificação vira
+    um único grafo compilado (sem realocar o cache a cada token). A
+    compilação acontece na primeira geração; o aquecimento da inicialização
+    paga esse custo. Como o cache estático é reaproveitado entre chamadas,
+    uma geração roda por vez, e o prefixo do prompt de sistema, o batching
+    contínuo e a decodificação especulativa não são usados.
+    """
+
+    nome = "compiled"
+
+    def __init__(self, model, eos_token_ids: Sequence[int], max_cache_len: int = 2048):
+        self.model = model
+        self.eos_token_ids = list(eos_token_ids)
+        self.max_cache_len = max_cache_len
+        self._lock = threading.Lock()
+        # Alocado uma vez: o formato fixo evita recompilar a cada comprimento de prompt
+        self._cache = StaticCache(
+            config=model.config,
+            max_batch_size=1,
+            max_cache_len=max_cache_len,
+            device=model.device,
+            dtype=model.dtype
+        )
+        self.model.forward = torch.compile(self.model.forward, dynamic=None)
+        print(f"Modelo compilado com torch.compile (cache estático de {max_cache_len} posições)")
+
+    def gerar(self, input_ids, max_new_tokens, sampling, streamer=None, prefixo=None,
+              cancelamento=None, speculative=False, stats=None, orcamento=None):
+        if len(input_ids) >= self.max_cache_len:
+            raise ValueError(f"Prompt com {len(input_ids)} tokens não cabe no cache estático "
+                             f"({self.max_cache_len} posições)")
+        # Limita para caber no cache estático alocado
+        max_new_tokens = min(max_new_tokens, self.max_cache_len - len(input_ids))
+        with self._lock:
+            self._cache.reset()
+            return _generate(self.model, input_ids, max_new_tokens, sampling, streamer,
+                             cancelamento, orcamento, past_key_values=self._cache)
+
+    def stats(self) -> Dict:
+        return {"nome": self.nome, "max_cache_len": self.max_cache_len}
+
+
+class _ProcessadorOrcamento(LogitsProcessor):
+    """LogitsProcessor do model.generate que força o </think> (um orçamento por linha, ou None)"""
+
+    def __init__(self, orcamentos: Sequence[Optional[OrcamentoPensamento]], tamanho_prompt: int):
+        self.orcamentos = orcamentos
+        self.tamanho_prompt = tamanho_prompt
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor) -> torch.FloatTensor:
+        for linha, orcamento in enumerate(self.orcamentos):
+            if orcamento is None:
+                continue
+            orcamento.sincronizar(input_ids[linha, self.tamanho_prompt:])
+            forcado = orcamento.token_forcado()
+            if forcado is not None:
+                scores[linha] = float("-inf")
+                scores[linha, forcado] = 0.0
+        return scores
+
+
+class _CriterioOrcamento(StoppingCriteria):
+    """Critério de parada do model.generate quando a resposta de uma linha esgota o seu limite"""
+
+    def __init__(self, orcamentos: Sequence[Optional[OrcamentoPensamento]], tamanho_prompt: int):
+        self.orcamentos = orcamentos
+        self.tamanho_prompt = tamanho_prompt
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor, **kwargs) -> torch.BoolTensor:
+        esgotadas = []
+        for linha, orcamento in enumerate(self.orcamentos):
+            if orcamento is not None:
+                orcamento.sincronizar(input_ids[linha, self.tamanho_prompt:])
+            esgotadas.append(orcamento is not None and orcamento.resposta_esgotada)
+        return torch.tensor(esgotadas, dtype=torch.bool, device=input_ids.device)
+
+
+def _generate(model, input_ids: List[int], max_new_tokens: int, sampling: SamplingParams,
+              streamer=None, cancelamento: Optional[CancellationToken] = None,
+              orcamento: Optional[OrcamentoPensamento] = None, **extra) -> List[int]:
+    """model.generate para uma única sequência, retornando só os tokens novos"""
+    ids = torch.tensor([input_ids], device=model.device)
+    criterios = []
+    if cancelamento is not None:
+        criterios.append(CancelStoppingCriteria(cancelamento))
+    if orcamento is not None:
+        criterios.append(_CriterioOrcamento([orcamento], len(input_ids)))
+        extra["logits_processor"] = LogitsProcessorList([_ProcessadorOrcamento([orcamento], len(input_ids))])
+    if criterios:
+        extra["stopping_criteria"] = StoppingCriteriaList(criterios)
+    with torch.inference_mode():
+        generated_ids = model.generate(
+            input_ids=ids,
+            attention_mask=torch.ones_like(ids),
+            max_new_tokens=max_new_tokens,
+            streamer=streamer,
+            **extra,
+            **sampling.to_generate_kwargs()
+        )
+    return generated_ids[0][len(input_ids):].tolist()
+
+
+def _generate_lote(model, lista_ids: List[List[int]], max_new_tokens: int, sampling: SamplingParams,
+                   pad_token_id: int, eos_token_ids: Sequence[int], streamer=None,
+                   cancelamento: Optional[CancellationToken] = None,
+                   orcamentos: Optional[List[Optional[OrcamentoPensamento]]] = None) -> List[List[int]]:
+    """model.generate para um lote com padding à esquerda, retornando os tokens novos de cada linha"""
+    comprimento = max(len(ids) for ids in lista_ids)
+    ids = torch.tensor([[pad_token_id] * (comprimento - len(i)) + i for i in lista_ids], device=model.device)
+    mascara = torch.tensor([[0] * (comprimento - len(i)) + [1] * len(i) for i in lista_ids], device=model.device)
+    orcamentos = orcamentos or [None] * len(lista_ids)
+
+    extra = {}
+    criterios = []
+    if cancelamento is not None:
+        criterios.append(CancelStoppingCriteria(cancelamento))
+    if any(o is not None for o in orcamentos):
+        criterios.append(_CriterioOrcamento(orcamentos, comprimento))
+        extra["logits_processor"] = LogitsProcessorList([_ProcessadorOrcamento(orcamentos, comprimento)])
+    if criterios:
+        extra["stopping_criteria"] = StoppingCriteriaList(criterios)
+    with torch.inference_mode():
+        generated_ids = model.generate(
+            input_ids=ids,
+            attention_mask=mascara,
+            max_new_tokens=max_new_tokens,
+            pad_token_id=pad_token_id,
+            streamer=streamer,
+            **extra,
+            **sampling.to_generate_kwargs()
+        )
+    return [
+        _aparar_linha(linha[comprimento:].tolist(), eos_token_ids, orcamento)
+        for linha, orcamento in zip(generated_ids, orcamentos)
+    ]
+
+
+def _aparar_linha(gerados: List[int], eos_token_ids: Sequence[int],
+                  orcamento: Optional[OrcamentoPensamento]) -> List[int]:
+    """
+    Remove o padding que o model.generate coloca numa linha depois que ela terminou
+
+    A linha termina no primeiro EOS (incluído, como no batch de tamanho 1)
+    ou quando a resposta esgota o seu limite, conferido com uma cópia nova
+    do orçamento (o original também contou o padding).
+    """
+    if orcamento is not None:
+        orcamento = OrcamentoPensamento(orcamento.max_pensamento, orcamento.max_resposta, orcamento.think_end_id)
+    eos = set(eos_token_ids)
+    saida = []
+    for token_id in gerados:
+        saida.append(token_id)
+        if token_id in eos:
+            break
+        if orcamento is not None:
+            orcamento.registrar(token_id)
+            if orcamento.resposta_esgotada:
+                break
+    return saida
+
+
+def criar_backend(nome: str, model, eos_token_ids: Sequence[int], continuous_batching: bool = True,
+                  max_batch_size: int = 8, speculative_tokens: int = 10,
+                  max_cache_len: int = 2048) -> InferenceBackend:
+    """Cria a engine configurada (LLM_BACKEND)"""
+    if nome == "hf":
+        return HFBackend(model, eos_token_ids, continuous_batching, max_batch_size, speculative_tokens)
+    if nome == "compiled":
+        return CompiledBackend(model, eos_token_ids, max_cache_len)
+    raise ValueError(f"Backend inválido: {nome}. Opções: {', '.join(BACKENDS)}")
+
+
+def verificar_paridade(model_name: str, backend: str, prompts: Optional[List[str]] = None,
+                       max_tokens: int = 64, repeticoes: int = 2) -> Dict:
+    """
+    Compara a engine escolhida com o caminho HF eager em decodificação gulosa
+
+    As duas usam o mesmo modelo carregado. O HF roda primeiro porque a
+    engine compilada substitui o forward do modelo. A primeira repetição
+    de cada engine aquece (e compila); a latência é a da última.
+    """
+    from service.llm import LLMService
+    from service.precision import PROMPTS_PADRAO
+
+    prompts = prompts or PROMPTS_PADRAO
+    llm = LLMService(model_name, continuous_batching=False, backend="hf")
+    greedy = llm.sampling_padrao(do_sample=False)
+    entradas = [llm._preparar_inputs(p).input_ids[0].tolist() for p in prompts]
+
+    def executar(engine: InferenceBackend) -> List[Dict]:
+        resultados = []
+        for ids in entradas:
+            for _ in range(repeticoes):
+                inicio = time.perf_counter()
+                gerados = engine.gerar(ids, max_tokens, greedy)
+                duracao = time.perf_counter() - inicio
+            resultados.append({"ids": gerados, "latencia_s": duracao})
+        return resultados
+
+    referencia = executar(llm.backend)
+    candidato = executar(criar_backend(backend, llm.model, llm._eos_token_ids()))
+
+    relatorio = []
+    for prompt, ref, cand in zip(prompts, referencia, candidato):
+        prefixo_comum = 0
+        for a, b in zip(ref["ids"], cand["ids"]):
+            if a != b:
+                break
+            prefixo_comum += 1
+        relatorio.append({
+            "prompt": prompt,
+            "identicos": ref["ids"] == cand["ids"],
+            "prefixo_comum": prefixo_comum,
+            "tokens": len(ref["ids"]),
+            "latencia_hf_s": round(ref["latencia_s"], 3),
+            f"latencia_{backend}_s": round(cand["latencia_s"], 3),
+        })
+    return {
+        "backend": backend,
+        "respostas_identicas": sum(1 for r in relatorio if r["identicos"]),
+        "total": len(relatorio),
+        "prompts": relatorio,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Confere a paridade de uma engine com o caminho HF")
+    parser.add_argument("--modelo", default="Qwen/Qwen3-0.6B")
+    parser.add_argument("--backend", default="compiled", choices=BACKENDS)
+    parser.add_argument("--max-tokens", type=int, default=64)
+    args = parser.parse_args()
+    print(json.dumps(verificar_paridade(args.modelo, args.backend, max_tokens=args.max_tokens),
+                     indent=2, ensure_ascii=False))
@@ -0,0 +1,254 @@
+import threading
+from collections import deque
+from typing import List, Optional, Sequence
+
+import torch
+import torch.nn.functional as F
+
+from service.kv_cache import cache_para_tuplas, tuplas_para_cache
+from service.sampling import SamplingParams, escolher_proximo_token
+
+
+class _Sequencia:
+    """Estado de uma requisição dentro do batch contínuo"""
+
+    def __init__(self, input_ids: List[int], max_new_tokens: int,
+                 sampling: SamplingParams, streamer=None, prefixo=None, cancelamento=None,
+                 orcamento=None):
+        self.input_ids = input_ids
+        self.prefixo = prefixo
+        self.cancelamento = cancelamento
+        self.orcamento = orcamento
+        self.max_new_tokens = max_new_tokens
+        self.sampling = sampling
+        self.streamer = streamer
+        self.gerados: List[int] = []
+        self.erro: Optional[BaseException] = None
+        self.concluida = threading.Event()
+
+    @property
+    def cancelada(self) -> bool:
+        return self.cancelamento is not None and self.cancelamento.cancelado
+
+    @property
+    def contexto(self) -> List[int]:
+        return self.input_ids + self.gerados
+
+    def escolher(self, logits: torch.Tensor) -> int:
+        """Próximo token: o </think> forçado pelo orçamento ou o escolhido pela amostragem"""
+        if self.orcamento is not None:
+            forcado = self.orcamento.token_forcado()
+            if forcado is not None:
+                return forcado
+        return escolher_proximo_token(logits, self.sampling, self.contexto)
+
+    @property
+    def resposta_esgotada(self) -> bool:
+        return self.orcamento is not None and self.orcamento.resposta_esgotada
+
+    def adicionar(self, token_id: int):
+        self.gerados.append(token_id)
+        if self.orcamento is not None:
+            self.orcamento.registrar(token_id)
+        if self.streamer is not None:
+            self.streamer.put(torch.tensor([token_id]))
+
+    def finalizar(self, erro: Optional[BaseException] = None):
+        self.erro = erro
+        if self.streamer is not None:
+            self.streamer.end()
+        self.concluida.set()
+
+
+class ContinuousBatcher:
+    """
+    Motor de batching contínuo para geração em CPU
+
+    Todas as requisições em andamento compartilham um único loop de
+    decodificação: a cada passo o modelo recebe um token por sequência ativa.
+    Novas sequências são admitidas entre passos (após um prefill individual) e
+    sequências concluídas são retiradas sem interromper as demais. Cada
+    requisição mantém seu próprio max_new_tokens e parâmetros de amostragem.
+
+    O cache KV do batch é mantido com padding à esquerda e só é reorganizado
+    quando o conjunto de sequências ativas muda.
+    """
+
+    def __init__(self, model, eos_token_ids: Sequence[int], max_batch_size: int = 8):
+        self.model = model
+        self.eos_token_ids = set(eos_token_ids)
+        self.max_batch_size = max_batch_size
+
+        self._condicao = threading.Condition()
+        self._pendentes = deque()
+        self._ativas: List[_Sequencia] = []
+        self._cache = []        # lista (key, value) por camada, batch = len(_ativas)
+        self._mascara = None    # (batch, comprimento) com 0 nas posições de padding
+
+        self._thread = threading.Thread(target=self._loop, name="continuous-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, input_ids: List[int], max_new_tokens: int,
+               sampling: SamplingParams, streamer=None, prefixo=None,
+               cancelamento=None, orcamento=None) -> _Sequencia:
+        """
+        Enfileira uma sequência para ser admitida no próximo passo
+
+        Se um prefixo (PrefixoKV) for informado, o prefill começa do cache dele.
+        Com um CancellationToken, a sequência sai do batch no primeiro passo
+        após o cancelamento, mantendo os tokens já gerados. Com um
+        OrcamentoPensamento, o </think> é forçado quando o pensamento esgota
+        o seu limite e a sequência sai quando a resposta esgota o dela.
+        """
+        sequencia = _Sequencia(list(input_ids), max_new_tokens, sampling, streamer, prefixo,
+                               cancelamento, orcamento)
+        if streamer is not None:
+            # Mesmo contrato do model.generate: o prompt é enviado primeiro
+            streamer.put(torch.tensor([sequencia.input_ids]))
+        with self._condicao:
+            self._pendentes.append(sequencia)
+            self._condicao.notify()
+        return sequencia
+
+    def generate(self, input_ids: List[int], max_new_tokens: int,
+                 sampling: SamplingParams, streamer=None, prefixo=None,
+                 cancelamento=None, orcamento=None) -> List[int]:
+        """Gera tokens de forma bloqueante e retorna apenas os tokens novos"""
+        sequencia = self.submit(input_ids, max_new_tokens, sampling, streamer, prefixo,
+                                cancelamento, orcamento)
+        sequencia.concluida.wait()
+        if sequencia.erro is not None:
+            raise sequencia.erro
+        return sequencia.gerados
+
+    @property
+    def ocupacao(self) -> int:
+        """Número de sequências ativas mais as aguardando admissão"""
+        with self._condicao:
+            return len(self._ativas) + len(self._pendentes)
+
+    # Loop principal
+
+    def _loop(self):
+        while True:
+            with self._condicao:
+                while not self._pendentes and not self._ativas:
+                    self._condicao.wait()
+                novas = []
+                while self._pendentes and len(self._ativas) + len(novas) < self.max_batch_size:
+                    novas.append(self._pendentes.popleft())
+
+            try:
+                with torch.inference_mode():
+                    for sequencia in novas:
+                        self._admitir(sequencia)
+                    self._retirar_concluidas()
+                    if self._ativas:
+                        self._passo_decodificacao()
+                        self._retirar_concluidas()
+            except BaseException as erro:  # falha no passo afeta o batch inteiro
+                for sequencia in self._ativas + [s for s in novas if not s.concluida.is_set()]:
+                    if not sequencia.concluida.is_set():
+                        sequencia.finalizar(erro)
+                self._ativas = []
+                self._cache = []
+                self._mascara = None
+
+    def _admitir(self, sequencia: _Sequencia):
+        """Faz o prefill da sequência sozinha e a insere no batch ativo"""
+        if sequencia.max_new_tokens <= 0 or sequencia.cancelada:
+            sequencia.finalizar()
+            return
+
+        if sequencia.prefixo is not None:
+            inicio = len(sequencia.prefixo)
+            past_key_values = tuplas_para_cache(sequencia.prefixo.camadas)
+        else:
+            inicio, past_key_values = 0, None
+
+        entrada = torch.tensor([sequencia.input_ids[inicio:]], device=self.model.device)
+        saida = self.model(input_ids=entrada, past_key_values=past_key_values, use_cache=True)
+        camadas = cache_para_tuplas(saida.past_key_values)
+        mascara = torch.ones((1, len(sequencia.input_ids)), dtype=torch.long)
+
+        sequencia.adicionar(sequencia.escolher(saida.logits[0, -1]))
+
+        if not self._ativas:
+            self._cache, self._mascara = camadas, mascara
+        else:
+            self._cache, self._mascara = self._juntar(self._cache, self._mascara, camadas, mascara)
+        self._ativas.append(sequencia)
+
+    @staticmethod
+    def _juntar(cache_a, mascara_a, cache_b, mascara_b):
+        """Concatena dois caches no eixo do batch, alinhando-os à direita"""
+        comprimento = max(mascara_a.shape[1], mascara_b.shape[1])
+
+        def alinhar(camadas, mascara):
+            falta = comprimento - mascara.shape[1]
+            if falta == 0:
+                return camadas, mascara
+            camadas = [(F.pad(k, (0, 0, falta, 0)), F.pad(v, (0, 0, falta, 0))) for k, v in camadas]
+            return camadas, F.pad(mascara, (falta, 0))
+
+        cache_a, mascara_a = alinhar(cache_a, mascara_a)
+        cache_b, mascara_b = alinhar(cache_b, mascara_b)
+        cache = [
+            (torch.cat([ka, kb], dim=0), torch.cat([va, vb], dim=0))
+            for (ka, va), (kb, vb) in zip(cache_a, cache_b)
+        ]
+        return cache, torch.cat([mascara_a, mascara_b], dim=0)
+
+    def _passo_decodificacao(self):
+        """Executa um passo de decodificação para todas as sequências ativas"""
+        ultimos = torch.tensor([[s.gerados[-1]] for s in self._ativas], device=self.model.device)
+        posicoes = self._mascara.sum(dim=1, keepdim=True)
+        mascara = torch.cat([self._mascara, torch.ones_like(posicoes)], dim=1)
+
+        saida = self.model(
+            input_ids=ultimos,
+            attention_mask=mascara.to(self.model.device),
+            position_ids=posicoes.to(self.model.device),
+            past_key_values=tuplas_para_cache(self._cache),
+            use_cache=True,
+        )
+        self._cache = cache_para_tuplas(saida.past_key_values)
+        self._mascara = mascara
+
+        logits = saida.logits[:, -1, :]
+        for indice, sequencia in enumerate(self._ativas):
+            sequencia.adicionar(sequencia.escolher(logits[indice]))
+
+    def _terminou(self, sequencia: _Sequencia) -> bool:
+        return (
+            sequencia.cancelada
+            or sequencia.resposta_esgotada
+            or len(sequencia.gerados) >= sequencia.max_new_tokens
+            or (sequencia.gerados and sequencia.gerados[-1] in self.eos_token_ids)
+        )
+
+    def _retirar_concluidas(self):
+        """Remove do batch as sequências que atingiram EOS ou o limite de tokens"""
+        manter = [i for i, s in enumerate(self._ativas) if not self._terminou(s)]
+        if len(manter) == len(self._ativas):
+            return
+
+        for indice, sequencia in enumerate(self._ativas):
+            if indice not in manter:
+                sequencia.finalizar()
+
+        if not manter:
+            self._ativas, self._cache, self._mascara = [], [], None
+            return
+
+        indices = torch.tensor(manter)
+        self._ativas = [self._ativas[i] for i in manter]
+        mascara = self._mascara.index_select(0, indices)
+        # Descarta colunas que viraram padding para todas as sequências restantes
+        inicio = int((mascara.sum(dim=0) > 0).nonzero()[0].item())
+        self._mascara = mascara[:, inicio:]
+        self._cache = [
+            (k.index_select(0, indices.to(k.device))[:, :, inicio:, :],
+             v.index_select(0, indices.to(v.device))[:, :, inicio:, :])
+            for k, v in self._cache
+        ]
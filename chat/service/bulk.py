@@ -0,0 +1,73 @@
+"""
+Agrupamento das perguntas do endpoint /perguntas-lote em lotes com padding
+
+Perguntas só dividem um lote quando têm o mesmo grupo (mesma decodificação
+e mesmos limites de tokens), já que o model.generate aplica uma única
+configuração a todas as linhas. Dentro de cada grupo as perguntas são
+ordenadas pelo tamanho do prompt, para que o padding à esquerda desperdice
+pouco, e cortadas em lotes limitados em número de linhas e em tokens.
+"""
+import json
+from dataclasses import dataclass
+from typing import Dict, Hashable, List
+
+
+@dataclass
+class ItemLote:
+    """Uma pergunta do lote já tokenizada"""
+
+    indice: int  # posição na requisição, devolvida junto com o resultado
+    tokens_prompt: int
+    max_new_tokens: int
+    grupo: Hashable
+
+    @property
+    def custo(self) -> int:
+        return self.tokens_prompt + self.max_new_tokens
+
+
+def custo_lote(itens: List[ItemLote]) -> int:
+    """Tokens ocupados pelo lote com padding: linhas x (maior prompt + maior geração)"""
+    if not itens:
+        return 0
+    return len(itens) * (max(i.tokens_prompt for i in itens) + max(i.max_new_tokens for i in itens))
+
+
+def agrupar_por_tamanho(itens: List[ItemLote], max_lote: int, max_tokens_lote: int) -> List[List[ItemLote]]:
+    """
+    Divide os itens em lotes de tamanhos parecidos
+
+    Um item sozinho maior que max_tokens_lote ainda forma o próprio lote.
+
+    Args:
+        itens: Perguntas a gerar
+        max_lote: Máximo de linhas por lote
+        max_tokens_lote: Máximo de custo_lote por lote
+
+    Returns:
+        Lotes ordenados do mais barato para o mais caro, para que os
+        primeiros resultados cheguem logo
+    """
+    grupos: Dict[Hashable, List[ItemLote]] = {}
+    for item in itens:
+        grupos.setdefault(item.grupo, []).append(item)
+
+    lotes = []
+    for grupo in grupos.values():
+        grupo.sort(key=lambda item: item.tokens_prompt)
+        atual: List[ItemLote] = []
+        for item in grupo:
+            candidato = atual + [item]
+            if atual and (len(candidato) > max_lote or custo_lote(candidato) > max_tokens_lote):
+                lotes.append(atual)
+                candidato = [item]
+            atual = candidato
+        if atual:
+            lotes.append(atual)
+    lotes.sort(key=custo_lote)
+    return lotes
+
+
+def linha_ndjson(objeto: Dict) -> str:
+    """Serializa um resultado como uma linha de NDJSON"""
+    return json.dumps(objeto, ensure_ascii=False) + "\n"
@@ -0,0 +1,77 @@
+import threading
+import time
+from typing import Dict, Optional
+
+import torch
+from transformers import StoppingCriteria
+
+# Motivos de interrupção reportados ao cliente
+CANCELADA = "cancelled"
+EXPIRADA = "deadline"
+
+
+class CancellationToken:
+    """
+    Sinal de cancelamento cooperativo de uma geração
+
+    É cancelado explicitamente (ex.: cliente desconectou) ou quando o prazo
+    opcional expira. Os loops de geração consultam `cancelado` a cada passo.
+    """
+
+    def __init__(self, deadline_s: Optional[float] = None):
+        self._evento = threading.Event()
+        self.motivo: Optional[str] = None
+        self.deadline = time.monotonic() + deadline_s if deadline_s else None
+
+    def cancel(self, motivo: str = CANCELADA):
+        if not self._evento.is_set():
+            self.motivo = motivo
+            self._evento.set()
+
+    @property
+    def cancelado(self) -> bool:
+        if self._evento.is_set():
+            return True
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            self.cancel(EXPIRADA)
+            return True
+        return False
+
+
+class CancelStoppingCriteria(StoppingCriteria):
+    """Critério de parada do model.generate ligado a um CancellationToken"""
+
+    def __init__(self, token: CancellationToken):
+        self.token = token
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor, **kwargs) -> torch.BoolTensor:
+        return torch.full((input_ids.shape[0],), self.token.cancelado, dtype=torch.bool, device=input_ids.device)
+
+
+class ContadoresCancelamento:
+    """Contadores de gerações interrompidas (thread-safe)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.canceladas = 0
+        self.expiradas = 0
+        self.tokens_interrompidas = 0
+
+    def registrar(self, motivo: Optional[str], tokens_gerados: int):
+        """Registra uma geração interrompida e quantos tokens ela chegou a gerar"""
+        if motivo is None:
+            return
+        with self._lock:
+            if motivo == EXPIRADA:
+                self.expiradas += 1
+            else:
+                self.canceladas += 1
+            self.tokens_interrompidas += tokens_gerados
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "canceladas": self.canceladas,
+                "expiradas": self.expiradas,
+                "tokens_gerados_interrompidas": self.tokens_interrompidas,
+            }
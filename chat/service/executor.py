@@ -0,0 +1,227 @@
+import asyncio
+import math
+import threading
+import time
+import traceback
+from concurrent.futures import Future
+from typing import AsyncIterator, Callable, Dict, Iterator, Optional
+
+from service.scheduler import Agendamento, FilaAgendada
+
+
+class FilaCheiaError(Exception):
+    """A fila de admissão atingiu o limite configurado"""
+
+    def __init__(self, mensagem: str, retry_after: int):
+        super().__init__(mensagem)
+        self.retry_after = retry_after
+
+
+class ServicoSobrecarregadoError(Exception):
+    """A espera estimada na fila excede o tempo máximo aceitável"""
+
+    def __init__(self, mensagem: str, retry_after: int):
+        super().__init__(mensagem)
+        self.retry_after = retry_after
+
+
+_FIM = object()
+
+
+class InferenceExecutor:
+    """
+    Executor dedicado para as gerações do modelo
+
+    Mantém um número fixo de threads de inferência e uma fila de admissão
+    limitada, para que chamadas bloqueantes do modelo nunca rodem no event
+    loop do uvicorn. A fila não é FIFO: as tarefas saem pela classe de
+    prioridade, pelo custo estimado, pelo cliente e pelo tempo de espera
+    (ver service/scheduler.py). Quando a fila está cheia ou a espera
+    estimada da nova tarefa passa de max_wait_s, ela é recusada
+    imediatamente com uma sugestão de Retry-After.
+
+    Só gerações devem passar por aqui: a espera estimada vem do tempo médio
+    das tarefas executadas. Trabalho curto (embedding, tokenização) roda no
+    pool padrão do event loop.
+    """
+
+    def __init__(self, max_workers: int = 1, max_queue: int = 32, max_wait_s: float = 120.0,
+                 envelhecimento: float = 32.0, penalidade_cliente: float = 256.0):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.max_wait_s = max_wait_s
+
+        self._condicao = threading.Condition()
+        self._fila = FilaAgendada(envelhecimento, penalidade_cliente)
+        self._ativos = 0
+        self._tempo_medio = None  # média móvel do tempo de serviço (s)
+        self._recusadas = 0
+
+        self._threads = [
+            threading.Thread(target=self._worker, name=f"inference-{i}", daemon=True)
+            for i in range(max_workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    # Admissão
+
+    def espera_estimada(self) -> float:
+        """Estimativa (s) de quanto uma nova requisição aguardaria na fila"""
+        with self._condicao:
+            return self._espera_estimada()
+
+    def _espera_estimada(self, posicao: Optional[int] = None) -> float:
+        """Espera de quem entrar na fila na posição dada (padrão: no fim da fila)"""
+        if self._tempo_medio is None:
+            return 0.0
+        if posicao is None:
+            posicao = len(self._fila)
+        # Tarefas que precisam liberar um worker antes desta começar
+        a_frente = max(0, posicao + self._ativos - self.max_workers + 1)
+        return a_frente / self.max_workers * self._tempo_medio
+
+    def _retry_after(self) -> int:
+        # Tempo aproximado até uma vaga da fila ser liberada
+        return max(1, math.ceil((self._tempo_medio or 1.0) / self.max_workers))
+
+    def _enfileirar(self, tarefa, agendamento: Optional[Agendamento]) -> Dict:
+        """
+        Admite a tarefa na fila
+        
+        Returns:
+            {'position', 'estimated_wait_s'}: tarefas que sairiam antes dela
+            e a espera estimada, no momento da admissão
+        """
+        agendamento = agendamento or Agendamento()
+        with self._condicao:
+            if len(self._fila) >= self.max_queue:
+                self._recusadas += 1
+                raise FilaCheiaError(
+                    f"Fila de inferência cheia ({self.max_queue} requisições aguardando)",
+                    retry_after=self._retry_after()
+                )
+            posicao = self._fila.posicao(agendamento)
+            espera = self._espera_estimada(posicao)
+            if espera > self.max_wait_s:
+                self._recusadas += 1
+                raise ServicoSobrecarregadoError(
+                    f"Espera estimada de {espera:.0f}s excede o limite de {self.max_wait_s:.0f}s",
+                    retry_after=max(1, math.ceil(espera - self.max_wait_s))
+                )
+            self._fila.adicionar(tarefa, agendamento)
+            self._condicao.notify()
+            return {"position": posicao, "estimated_wait_s": round(espera, 2)}
+
+    # Execução
+
+    def _worker(self):
+        while True:
+            with self._condicao:
+                while not self._fila:
+                    self._condicao.wait()
+                tarefa, agendamento = self._fila.retirar()
+                self._ativos += 1
+
+            inicio = time.monotonic()
+            try:
+                tarefa()
+            except Exception:
+                # Uma tarefa com erro não pode derrubar a thread de inferência
+                traceback.print_exc()
+            finally:
+                duracao = time.monotonic() - inicio
+                with self._condicao:
+                    self._ativos -= 1
+                    self._fila.liberar(agendamento)
+                    if self._tempo_medio is None:
+                        self._tempo_medio = duracao
+                    else:
+                        self._tempo_medio = 0.8 * self._tempo_medio + 0.2 * duracao
+
+    def submit(self, fn: Callable, *args, agendamento: Optional[Agendamento] = None, **kwargs) -> Future:
+        """
+        Enfileira fn(*args, **kwargs) e retorna um Future com o resultado
+        
+        O Future traz em `fila` a posição e a espera estimada na admissão.
+        """
+        future = Future()
+
+        def tarefa():
+            if not future.set_running_or_notify_cancel():
+                return
+            try:
+                future.set_result(fn(*args, **kwargs))
+            except BaseException as erro:
+                future.set_exception(erro)
+
+        future.fila = self._enfileirar(tarefa, agendamento)
+        return future
+
+    async def run(self, fn: Callable, *args, agendamento: Optional[Agendamento] = None, **kwargs):
+        """Executa fn em uma thread de inferência sem bloquear o event loop"""
+        return await asyncio.wrap_future(self.submit(fn, *args, agendamento=agendamento, **kwargs))
+
+    def stream(self, gen_fn: Callable[..., Iterator], *args,
+               ao_abandonar: Optional[Callable[[], None]] = None,
+               agendamento: Optional[Agendamento] = None,
+               evento_fila: Optional[Callable[[Dict], object]] = None, **kwargs) -> AsyncIterator:
+        """
+        Executa um gerador síncrono em uma thread de inferência
+
+        A admissão acontece na chamada (podendo lançar FilaCheiaError ou
+        ServicoSobrecarregadoError); os itens produzidos são entregues ao
+        event loop por um gerador assíncrono. Se o consumidor parar antes do
+        fim (ex.: o cliente desconectou), ao_abandonar é chamado para que a
+        geração seja interrompida. Com evento_fila, o primeiro item entregue
+        é evento_fila({'position', 'estimated_wait_s'}).
+        """
+        loop = asyncio.get_running_loop()
+        saida = asyncio.Queue()
+
+        def entregar(item):
+            loop.call_soon_threadsafe(saida.put_nowait, item)
+
+        def tarefa():
+            try:
+                for item in gen_fn(*args, **kwargs):
+                    entregar(item)
+            except BaseException as erro:
+                entregar(erro)
+            finally:
+                entregar(_FIM)
+
+        fila = self._enfileirar(tarefa, agendamento)
+
+        async def consumir():
+            concluido = False
+            try:
+                if evento_fila is not None:
+                    yield evento_fila(fila)
+                while True:
+                    item = await saida.get()
+                    if item is _FIM:
+                        concluido = True
+                        return
+                    if isinstance(item, BaseException):
+                        concluido = True
+                        raise item
+                    yield item
+            finally:
+                if not concluido and ao_abandonar is not None:
+                    ao_abandonar()
+
+        return consumir()
+
+    def stats(self) -> Dict:
+        """Estado atual da fila para os endpoints de saúde"""
+        with self._condicao:
+            return {
+                "workers": self.max_workers,
+                "em_execucao": self._ativos,
+                "na_fila": len(self._fila),
+                "na_fila_por_classe": self._fila.por_classe(),
+                "limite_fila": self.max_queue,
+                "espera_estimada_s": round(self._espera_estimada(), 2),
+                "recusadas": self._recusadas,
+            }
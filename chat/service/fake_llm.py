@@ -0,0 +1,251 @@
+"""
+LLMService falso e determinístico para benchmarks da camada de serviço
+
+Não carrega pesos: gera um pensamento e uma resposta pseudoaleatórios
+(a mesma pergunta sempre gera o mesmo texto) com um atraso fixo por
+token. Segue o mesmo contrato do LLMService usado por application/app.py,
+incluindo o formato dos eventos de streaming, o cancelamento e o prazo.
+
+Uso (a partir da pasta chat/):
+    LLM_SERVICE=fake python run_api.py
+"""
+import hashlib
+import os
+import random
+import threading
+import time
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from service.cancellation import CancellationToken, ContadoresCancelamento
+from service.metrics import MedicaoGeracao
+from service.prefix_cache import PrefixCache
+from service.sessions import SessionStore
+from service.sampling import SamplingParams
+from service.streaming import formatar_sse
+
+_PALAVRAS = (
+    "o modelo analisa a pergunta e considera fatos relevantes sobre o tema antes de "
+    "formular uma resposta curta clara e direta em português com base no contexto"
+).split()
+
+
+class FakeLLMService:
+    """Substituto do LLMService com latência configurável e saída determinística"""
+
+    def __init__(self, model_name: str = "fake/deterministico",
+                 atraso_token_s: Optional[float] = None,
+                 atraso_prefill_s: Optional[float] = None,
+                 tokens_pensamento: Optional[int] = None,
+                 tokens_resposta: Optional[int] = None,
+                 carregar: bool = True):
+        self.model_name = model_name
+        self.atraso_token_s = atraso_token_s if atraso_token_s is not None else \
+            float(os.getenv("LLM_FAKE_TOKEN_DELAY_S", "0.02"))
+        self.atraso_prefill_s = atraso_prefill_s if atraso_prefill_s is not None else \
+            float(os.getenv("LLM_FAKE_PREFILL_S", "0.05"))
+        self.tokens_pensamento = tokens_pensamento if tokens_pensamento is not None else \
+            int(os.getenv("LLM_FAKE_THINKING_TOKENS", "32"))
+        self.tokens_resposta = tokens_resposta if tokens_resposta is not None else \
+            int(os.getenv("LLM_FAKE_RESPONSE_TOKENS", "24"))
+
+        # Mesmos atributos que a API consulta no serviço real
+        self.precisao = "fake"
+        self.backend = None
+        self.backend_nome = "fake"
+        self.model = None
+        self.tokenizer = None
+        # Gerações independentes e simultâneas, como as vagas do batching contínuo
+        self.continuous_batching = True
+        self.max_batch_size = int(os.getenv("LLM_MAX_BATCH_SIZE", "8"))
+        limite_pensamento = os.getenv("LLM_MAX_THINKING_TOKENS", "")
+        self.max_thinking_tokens = int(limite_pensamento) if limite_pensamento else None
+        self.prefix_cache = PrefixCache()
+        self.sessoes = SessionStore(0)  # sem cache KV: o histórico não muda o custo
+        self.cancelamentos = ContadoresCancelamento()
+        self.estado = "pronto" if carregar else "parado"
+        self.erro_inicializacao: Optional[str] = None
+        self.tempos_inicializacao: Dict[str, float] = {}
+
+    @property
+    def pronto(self) -> bool:
+        return self.estado == "pronto"
+
+    @property
+    def identificador(self) -> str:
+        return f"{self.model_name}@{self.precisao}"
+
+    @property
+    def dimensao_embedding(self) -> int:
+        return 64
+
+    def iniciar(self, aquecimento: int = 0, max_tokens_aquecimento: int = 16,
+                ao_ficar_pronto: Optional[Callable[[], None]] = None) -> threading.Thread:
+        """Fica pronto imediatamente (não há pesos para carregar)"""
+        def inicializar():
+            if ao_ficar_pronto is not None:
+                ao_ficar_pronto()
+            self.tempos_inicializacao["total_s"] = self.tempos_inicializacao.get("import_s", 0.0)
+            self.estado = "pronto"
+
+        thread = threading.Thread(target=inicializar, name="llm-inicializacao", daemon=True)
+        thread.start()
+        return thread
+
+    def sampling_padrao(self, stream: bool = False, **overrides) -> SamplingParams:
+        overrides = {k: v for k, v in overrides.items() if v is not None}
+        padrao = dict(temperature=0.7, top_p=0.9, repetition_penalty=1.1, do_sample=True) if stream else {}
+        padrao.update(overrides)
+        return SamplingParams(**padrao)
+
+    def embed(self, texto: str) -> np.ndarray:
+        """Embedding determinístico derivado do hash do texto"""
+        gerador = np.random.default_rng(_semente(texto))
+        vetor = gerador.standard_normal(self.dimensao_embedding).astype(np.float32)
+        return vetor / np.linalg.norm(vetor)
+
+    def _tokens(self, prompt: str, max_tokens: int, max_thinking_tokens: Optional[int]) -> List[tuple]:
+        """
+        Sequência (seção, palavra) que será 'gerada' para o prompt
+
+        Com limite de pensamento o pensamento é cortado nele e max_tokens vale
+        só para a resposta, como no LLMService.
+        """
+        aleatorio = random.Random(_semente(prompt))
+        pensamento = [("thinking", aleatorio.choice(_PALAVRAS)) for _ in range(self.tokens_pensamento)]
+        resposta = [("response", aleatorio.choice(_PALAVRAS)) for _ in range(self.tokens_resposta)]
+        if max_thinking_tokens is None:
+            return (pensamento + resposta)[:max_tokens]
+        return pensamento[:max_thinking_tokens] + resposta[:max_tokens]
+
+    def _gerar(self, prompt: str, max_tokens: int, cancelamento: Optional[CancellationToken],
+               medicao: Optional[MedicaoGeracao], max_thinking_tokens: Optional[int]) -> Iterator[tuple]:
+        if medicao is not None:
+            medicao.iniciar(len(prompt.split()))
+        time.sleep(self.atraso_prefill_s)
+        for token in self._tokens(prompt, max_tokens, max_thinking_tokens):
+            if cancelamento is not None and cancelamento.cancelado:
+                return
+            time.sleep(self.atraso_token_s)
+            if medicao is not None:
+                medicao.marcar_token()
+            yield token
+
+    def _motivo_parada(self, secoes: Dict[str, List[str]], max_tokens: int,
+                       cancelamento: Optional[CancellationToken], max_thinking_tokens: Optional[int]) -> str:
+        gerados = len(secoes["thinking"]) + len(secoes["response"])
+        if cancelamento is not None and cancelamento.motivo is not None:
+            self.cancelamentos.registrar(cancelamento.motivo, gerados)
+            return cancelamento.motivo
+        if max_thinking_tokens is not None:
+            gerados = len(secoes["response"])
+        return "length" if gerados >= max_tokens else "stop"
+
+    def generate_response(self, prompt: str, max_tokens: int = 512,
+                          sampling: Optional[SamplingParams] = None,
+                          speculative: Optional[bool] = None,
+                          cancelamento: Optional[CancellationToken] = None,
+                          medicao: Optional[MedicaoGeracao] = None,
+                          max_thinking_tokens: Optional[int] = None,
+                          sessao: Optional[str] = None,
+                          historico: Optional[List[Dict]] = None) -> Dict:
+        secoes = {"thinking": [], "response": []}
+        for secao, palavra in self._gerar(prompt, max_tokens, cancelamento, medicao, max_thinking_tokens):
+            secoes[secao].append(palavra)
+        stop_reason = self._motivo_parada(secoes, max_tokens, cancelamento, max_thinking_tokens)
+        if medicao is not None:
+            medicao.concluir(stop_reason, len(secoes["thinking"]), len(secoes["response"]))
+        return {
+            "thinking": " ".join(secoes["thinking"]),
+            "response": " ".join(secoes["response"]),
+            "thinking_tokens": len(secoes["thinking"]),
+            "response_tokens": len(secoes["response"]),
+            "stop_reason": stop_reason,
+        }
+
+    def tamanho_geracao(self, prompt: str, max_tokens: int,
+                        max_thinking_tokens: Optional[int] = None,
+                        historico: Optional[List[Dict]] = None) -> Tuple[int, int]:
+        if max_thinking_tokens is None:
+            max_thinking_tokens = self.max_thinking_tokens
+        limite = max_tokens + (max_thinking_tokens + 1 if max_thinking_tokens else 0)
+        turnos = " ".join(f"{t['question']} {t['response']}" for t in historico or [])
+        return len(prompt.split()) + len(turnos.split()), limite
+
+    def generate_batch(self, prompts: List[str], max_tokens: int = 512,
+                       sampling: Optional[SamplingParams] = None,
+                       cancelamento: Optional[CancellationToken] = None,
+                       medicoes: Optional[List[MedicaoGeracao]] = None,
+                       max_thinking_tokens: Optional[int] = None) -> List[Dict]:
+        """Lote: um prefill e um atraso por passo para todas as linhas juntas"""
+        if max_thinking_tokens is None:
+            max_thinking_tokens = self.max_thinking_tokens
+        medicoes = medicoes or [None] * len(prompts)
+        planejados = [self._tokens(prompt, max_tokens, max_thinking_tokens) for prompt in prompts]
+        for medicao, prompt in zip(medicoes, prompts):
+            if medicao is not None:
+                medicao.iniciar(len(prompt.split()))
+        time.sleep(self.atraso_prefill_s)
+
+        secoes = [{"thinking": [], "response": []} for _ in prompts]
+        for passo in range(max((len(t) for t in planejados), default=0)):
+            if cancelamento is not None and cancelamento.cancelado:
+                break
+            time.sleep(self.atraso_token_s)
+            for tokens, secao, medicao in zip(planejados, secoes, medicoes):
+                if passo < len(tokens):
+                    secao[tokens[passo][0]].append(tokens[passo][1])
+                    if medicao is not None:
+                        medicao.marcar_token()
+
+        resultados = []
+        for secao, medicao in zip(secoes, medicoes):
+            stop_reason = self._motivo_parada(secao, max_tokens, cancelamento, max_thinking_tokens)
+            if medicao is not None:
+                medicao.concluir(stop_reason, len(secao["thinking"]), len(secao["response"]))
+            resultados.append({
+                "thinking": " ".join(secao["thinking"]),
+                "response": " ".join(secao["response"]),
+                "thinking_tokens": len(secao["thinking"]),
+                "response_tokens": len(secao["response"]),
+                "stop_reason": stop_reason,
+            })
+        return resultados
+
+    def generate_response_stream(self, prompt: str, max_tokens: int = 512,
+                                 sampling: Optional[SamplingParams] = None,
+                                 ao_concluir: Optional[Callable[[Dict[str, str]], None]] = None,
+                                 speculative: Optional[bool] = None,
+                                 cancelamento: Optional[CancellationToken] = None,
+                                 medicao: Optional[MedicaoGeracao] = None,
+                                 max_thinking_tokens: Optional[int] = None,
+                                 sessao: Optional[str] = None,
+                                 historico: Optional[List[Dict]] = None) -> Iterator[str]:
+        secoes = {"thinking": [], "response": []}
+        for secao, palavra in self._gerar(prompt, max_tokens, cancelamento, medicao, max_thinking_tokens):
+            conteudo = palavra if not secoes[secao] else " " + palavra
+            secoes[secao].append(palavra)
+            yield formatar_sse({"type": f"{secao}_chunk", "content": conteudo})
+
+        stop_reason = self._motivo_parada(secoes, max_tokens, cancelamento, max_thinking_tokens)
+        if medicao is not None:
+            medicao.concluir(stop_reason, len(secoes["thinking"]), len(secoes["response"]))
+        yield formatar_sse({"type": "done", "stop_reason": stop_reason,
+                            "thinking_tokens": len(secoes["thinking"]),
+                            "response_tokens": len(secoes["response"])})
+        if ao_concluir is not None and stop_reason in ("stop", "length"):
+            ao_concluir({"thinking": " ".join(secoes["thinking"]),
+                         "response": " ".join(secoes["response"])})
+
+    @staticmethod
+    def replay_stream(result: Dict[str, str]) -> Iterator[str]:
+        if result.get("thinking"):
+            yield formatar_sse({"type": "thinking_chunk", "content": result["thinking"]})
+        if result.get("response"):
+            yield formatar_sse({"type": "response_chunk", "content": result["response"]})
+        yield formatar_sse({"type": "done", "stop_reason": "stop"})
+
+
+def _semente(texto: str) -> int:
+    return int.from_bytes(hashlib.sha256(texto.encode("utf-8")).digest()[:8], "little")
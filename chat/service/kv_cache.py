@@ -0,0 +1,69 @@
+from typing import List, Tuple
+
+import torch
+
+try:
+    from transformers import DynamicCache
+except ImportError:  # versões muito antigas do transformers
+    DynamicCache = None
+
+
+CamadasKV = List[Tuple[torch.Tensor, torch.Tensor]]
+
+
+def cache_para_tuplas(past_key_values) -> CamadasKV:
+    """
+    Converte o cache retornado pelo modelo em uma lista (key, value) por camada
+
+    Aceita o formato legado (tuplas) e as diferentes versões do DynamicCache.
+    """
+    if past_key_values is None:
+        return []
+    if isinstance(past_key_values, (list, tuple)):
+        return [(k, v) for k, v in past_key_values]
+    if hasattr(past_key_values, "layers"):
+        return [(camada.keys, camada.values) for camada in past_key_values.layers]
+    if hasattr(past_key_values, "key_cache"):
+        return list(zip(past_key_values.key_cache, past_key_values.value_cache))
+    return [(k, v) for k, v in past_key_values.to_legacy_cache()]
+
+
+def tuplas_para_cache(camadas: CamadasKV):
+    """Monta um DynamicCache a partir de uma lista (key, value) por camada"""
+    if DynamicCache is None:
+        return tuple(camadas)
+    cache = DynamicCache()
+    for indice, (k, v) in enumerate(camadas):
+        cache.update(k, v, indice)
+    return cache
+
+
+def comprimento_cache(camadas: CamadasKV) -> int:
+    """Número de posições armazenadas no cache"""
+    if not camadas:
+        return 0
+    return camadas[0][0].shape[-2]
+
+
+def tamanho_bytes(camadas: CamadasKV) -> int:
+    """
+    Memória presa pelos tensores do cache
+
+    Conta o armazenamento por trás de cada tensor, não só os elementos
+    visíveis: uma fatia mantém viva a memória inteira de onde foi cortada.
+    """
+    armazenamentos = {}
+    for tensor in (t for par in camadas for t in par):
+        armazenamento = tensor.untyped_storage()
+        armazenamentos[armazenamento.data_ptr()] = armazenamento.nbytes()
+    return sum(armazenamentos.values())
+
+
+def cortar_cache(past_key_values, comprimento: int):
+    """Descarta as posições do cache a partir de `comprimento` (ex.: tokens rejeitados)"""
+    if hasattr(past_key_values, "crop"):
+        past_key_values.crop(comprimento)
+        return past_key_values
+    camadas = [(k[:, :, :comprimento, :], v[:, :, :comprimento, :])
+               for k, v in cache_para_tuplas(past_key_values)]
+    return tuplas_para_cache(camadas)
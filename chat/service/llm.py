@@ -1,195 +1,636 @@
 import os
-from typing import Dict, Iterator
-from transformers import AutoModelForCausalLM, AutoTokenizer, TextIteratorStreamer
+import time
+import traceback
+import numpy as np
+import torch
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+from transformers import AutoTokenizer
 from threading import Thread
 
+from service.backends import BACKENDS, criar_backend
+from service.cancellation import CancellationToken, ContadoresCancelamento
+from service.metrics import MedicaoGeracao, StreamerMedido
+from service.precision import carregar_modelo
+from service.prefork import obter_precarregado
+from service.kv_cache import cache_para_tuplas, tamanho_bytes, tuplas_para_cache
+from service.prefix_cache import PrefixCache, PrefixoKV
+from service.sampling import SamplingParams
+from service.sessions import SessionStore
+from service.streaming import ThinkStreamParser, TokenIteratorStreamer, contar_tokens, formatar_sse
+from service.thinking import OrcamentoPensamento
+
+# Prompt de sistema compartilhado pelos modos síncrono e streaming
+SYSTEM_PROMPT = """Você é um assistente que responde perguntas de forma clara, direta e precisa em português.
+
+Exemplo:
+Pergunta: Quem inventou a lâmpada?
+Resposta: Thomas Edison inventou a lâmpada elétrica em 1879.
+
+Agora responda a próxima pergunta de forma direta e objetiva, com no máximo 2-3 frases curtas."""
+
+# Perguntas sintéticas do aquecimento (tamanhos variados para exercitar formatos diferentes)
+PROMPTS_AQUECIMENTO = [
+    "Oi",
+    "Qual é a capital do Brasil?",
+    "Explique em uma frase curta por que o céu é azul durante o dia.",
+]
+
+
 class LLMService:
     """Serviço para interagir com o modelo de linguagem"""
     
-    def __init__(self, model_name: str = "Qwen/Qwen3-0.6B"):
+    def __init__(self, model_name: str = "Qwen/Qwen3-0.6B",
+                 continuous_batching: Optional[bool] = None,
+                 max_batch_size: Optional[int] = None,
+                 precision: Optional[str] = None,
+                 speculative: Optional[bool] = None,
+                 backend: Optional[str] = None,
+                 carregar: bool = True):
+        """
+        Args:
+            backend: Engine de inferência ('hf' ou 'compiled', padrão LLM_BACKEND)
+            carregar: Carrega o modelo já no construtor. Com False o modelo
+                é carregado depois, em segundo plano, por iniciar()
+        """
         self.model_name = model_name
+        # auto (dtype do checkpoint), fp32, bf16 ou int8 (quantização dinâmica)
+        self.precision = precision or os.getenv("LLM_PRECISION", "auto")
+        self.precisao = None  # modo efetivamente ativo após o carregamento
         self.tokenizer = None
         self.model = None
-        self._load_model()
+        self.backend = None
+        self.backend_nome = backend or os.getenv("LLM_BACKEND", "hf")
+        if self.backend_nome not in BACKENDS:
+            raise ValueError(f"Backend inválido: {self.backend_nome}. Opções: {', '.join(BACKENDS)}")
+        self.system_prompt = SYSTEM_PROMPT
+        self.prefix_cache = PrefixCache()
+        # Cache KV das conversas (session_id) e quantos turnos do histórico entram no prompt
+        self.sessoes = SessionStore(int(float(os.getenv("LLM_SESSION_CACHE_MB", "1024")) * 2**20))
+        self.max_turnos_historico = int(os.getenv("LLM_SESSION_MAX_TURNS", "8"))
+        self.cancelamentos = ContadoresCancelamento()
+        if continuous_batching is None:
+            continuous_batching = os.getenv("LLM_CONTINUOUS_BATCHING", "1") == "1"
+        # O batching contínuo roda sobre o modelo eager; só existe na engine HF
+        self.continuous_batching = continuous_batching and self.backend_nome == "hf"
+        self.max_batch_size = max_batch_size or int(os.getenv("LLM_MAX_BATCH_SIZE", "8"))
+        # Decodificação especulativa por n-gramas (prompt lookup), padrão por requisição
+        if speculative is None:
+            speculative = os.getenv("LLM_SPECULATIVE", "0") == "1"
+        self.speculative = speculative
+        self.speculative_tokens = int(os.getenv("LLM_SPECULATIVE_TOKENS", "10"))
+        self.max_cache_len = int(os.getenv("LLM_STATIC_CACHE_LEN", "2048"))
+        # Limite de tokens de pensamento padrão (vazio = pensamento e resposta dividem max_tokens)
+        limite_pensamento = os.getenv("LLM_MAX_THINKING_TOKENS", "")
+        self.max_thinking_tokens = int(limite_pensamento) if limite_pensamento else None
+        # Ciclo de vida: parado -> carregando -> aquecendo -> pronto (ou erro)
+        self.estado = "parado"
+        self.erro_inicializacao: Optional[str] = None
+        self.tempos_inicializacao: Dict[str, float] = {}
+        if carregar:
+            self._load_model()
+            self.estado = "pronto"
     
-    def _load_model(self):
-        """Carrega o modelo e tokenizer"""
-        print(f"Carregando modelo {self.model_name}...")
-        self.tokenizer = AutoTokenizer.from_pretrained(self.model_name)
-        self.model = AutoModelForCausalLM.from_pretrained(
-            self.model_name,
-            torch_dtype="auto",
-            device_map="cpu"
-        )
-        print("Modelo carregado com sucesso!")
+    @property
+    def pronto(self) -> bool:
+        return self.estado == "pronto"
     
-    def generate_response(self, prompt: str, max_tokens: int = 512) -> Dict[str, str]:
+    def iniciar(self, aquecimento: int = 0, max_tokens_aquecimento: int = 16,
+                ao_ficar_pronto: Optional[Callable[[], None]] = None) -> Thread:
         """
-        Gera uma resposta para o prompt fornecido
+        Carrega e aquece o modelo em uma thread, sem bloquear quem chamou
+        
+        O aquecimento roda algumas gerações sintéticas para alocar a memória
+        das ativações/cache KV e iniciar os pools de threads antes da
+        primeira requisição real. O estado só vira 'pronto' depois dele.
         
         Args:
-            prompt: Pergunta/prompt do usuário
-            max_tokens: Número máximo de tokens a gerar
+            aquecimento: Número de gerações sintéticas
+            max_tokens_aquecimento: Tokens gerados em cada uma
+            ao_ficar_pronto: Callback chamado após o aquecimento, antes do estado 'pronto'
+        """
+        thread = Thread(
+            target=self._inicializar,
+            args=(aquecimento, max_tokens_aquecimento, ao_ficar_pronto),
+            name="llm-inicializacao",
+            daemon=True
+        )
+        thread.start()
+        return thread
+    
+    def _inicializar(self, aquecimento: int, max_tokens_aquecimento: int,
+                     ao_ficar_pronto: Optional[Callable[[], None]]):
+        inicio = time.perf_counter()
+        try:
+            self._load_model()
             
-        Returns:
-            Dict com 'thinking' e 'response'
+            self.estado = "aquecendo"
+            inicio_aquecimento = time.perf_counter()
+            self._aquecer(aquecimento, max_tokens_aquecimento)
+            self.tempos_inicializacao["aquecimento_s"] = round(time.perf_counter() - inicio_aquecimento, 3)
+            
+            if ao_ficar_pronto is not None:
+                ao_ficar_pronto()
+        except Exception as erro:
+            self.estado = "erro"
+            self.erro_inicializacao = str(erro)
+            traceback.print_exc()
+            return
+        
+        self.tempos_inicializacao["total_s"] = round(
+            self.tempos_inicializacao.get("import_s", 0.0) + time.perf_counter() - inicio, 3
+        )
+        self.estado = "pronto"
+        print(f"Serviço LLM pronto! Tempos de inicialização: {self.tempos_inicializacao}")
+    
+    def _aquecer(self, quantidade: int, max_tokens: int):
+        """Gerações sintéticas gulosas pelo mesmo caminho das requisições"""
+        greedy = self.sampling_padrao(do_sample=False)
+        for i in range(quantidade):
+            prompt = PROMPTS_AQUECIMENTO[i % len(PROMPTS_AQUECIMENTO)]
+            self.generate_response(prompt, max_tokens=max_tokens, sampling=greedy)
+        if quantidade:
+            print(f"Aquecimento concluído ({quantidade} gerações)")
+    
+    def _load_model(self):
+        """Carrega o modelo e tokenizer, registrando o tempo de cada etapa"""
+        self.estado = "carregando"
+        tempos = self.tempos_inicializacao
+        precarregado = obter_precarregado(self.model_name, self.precision)
+        if precarregado is not None:
+            # Worker criado por fork: os pesos do processo pai são compartilhados
+            print(f"Usando modelo {self.model_name} pré-carregado pelo processo pai")
+            self.tokenizer, self.model, self.precisao = precarregado
+            tempos["tokenizer_s"] = tempos["pesos_s"] = 0.0
+        else:
+            print(f"Carregando modelo {self.model_name} (precisão: {self.precision})...")
+            inicio = time.perf_counter()
+            self.tokenizer = AutoTokenizer.from_pretrained(self.model_name)
+            tempos["tokenizer_s"] = round(time.perf_counter() - inicio, 3)
+            inicio = time.perf_counter()
+            self.model, self.precisao = carregar_modelo(self.model_name, self.precision)
+            tempos["pesos_s"] = round(time.perf_counter() - inicio, 3)
+        self.backend = criar_backend(
+            self.backend_nome,
+            self.model,
+            eos_token_ids=self._eos_token_ids(),
+            continuous_batching=self.continuous_batching,
+            max_batch_size=self.max_batch_size,
+            speculative_tokens=self.speculative_tokens,
+            max_cache_len=self.max_cache_len
+        )
+        
+        # Prefill do prompt de sistema uma única vez; as requisições reutilizam o cache
+        self.prefix_cache.invalidar()
+        self.sessoes.limpar()
+        if self.backend.suporta_prefixo:
+            inicio = time.perf_counter()
+            prefixo = self.prefix_cache.obter(self.model, self.tokenizer, self.identificador, self.system_prompt)
+            tempos["prefixo_s"] = round(time.perf_counter() - inicio, 3)
+            print(f"Cache do prompt de sistema pronto ({len(prefixo)} tokens)")
+        print(f"Modelo carregado com sucesso! (backend: {self.backend.nome})")
+    
+    @property
+    def identificador(self) -> str:
+        """Nome do modelo com a precisão e a engine ativas (respostas mudam com elas)"""
+        return f"{self.model_name}@{self.precisao}/{self.backend_nome}"
+    
+    def _eos_token_ids(self) -> List[int]:
+        """IDs que encerram a geração, conforme o generation_config do modelo"""
+        eos = self.model.generation_config.eos_token_id
+        if eos is None:
+            eos = self.tokenizer.eos_token_id
+        return list(eos) if isinstance(eos, (list, tuple)) else [eos]
+    
+    def sampling_padrao(self, stream: bool = False, **overrides) -> SamplingParams:
         """
-        # Preparar mensagem com instrução clara
-        system_prompt = """Você é um assistente que responde perguntas de forma clara, direta e precisa em português.
-
-Exemplo:
-Pergunta: Quem inventou a lâmpada?
-Resposta: Thomas Edison inventou a lâmpada elétrica em 1879.
-
-Agora responda a próxima pergunta de forma direta e objetiva, com no máximo 2-3 frases curtas."""
+        Parâmetros de decodificação padrão de cada modo
         
-        messages = [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": prompt}
-        ]
+        O modo síncrono usa o generation_config do modelo; o streaming usa
+        parâmetros otimizados (temperature=0.7, top_p=0.9, repetition_penalty=1.1).
+        Valores None em overrides são ignorados.
+        """
+        overrides = {k: v for k, v in overrides.items() if v is not None}
+        if stream:
+            padrao = dict(temperature=0.7, top_p=0.9, repetition_penalty=1.1, do_sample=True)
+            padrao.update(overrides)
+            overrides = padrao
+        return SamplingParams.from_generation_config(self.model.generation_config, **overrides)
+    
+    @property
+    def dimensao_embedding(self) -> int:
+        return self.model.config.hidden_size
+    
+    def embed(self, texto: str) -> np.ndarray:
+        """
+        Gera um embedding do texto com o próprio modelo carregado
+        
+        Média dos estados ocultos da última camada do decoder (sem o lm_head),
+        normalizada para norma 1.
+        """
+        inputs = self.tokenizer([texto], return_tensors="pt").to(self.model.device)
+        decoder = self.model.get_decoder() if hasattr(self.model, "get_decoder") else self.model.model
+        with torch.no_grad():
+            estados = decoder(**inputs).last_hidden_state[0]
+        vetor = estados.float().mean(dim=0)
+        vetor = vetor / vetor.norm().clamp_min(1e-12)
+        return vetor.cpu().numpy()
+    
+    def _preparar_inputs(self, prompt: str, pensar: bool = True, historico: Optional[List[Dict]] = None):
+        """
+        Aplica o template de chat com o prompt de sistema e tokeniza
+        
+        historico traz os turnos anteriores da conversa ({'question', 'response'});
+        só os últimos LLM_SESSION_MAX_TURNS entram no prompt.
+        """
+        messages = [{"role": "system", "content": self.system_prompt}]
+        turnos = (historico or [])[-self.max_turnos_historico:] if self.max_turnos_historico > 0 else []
+        for turno in turnos:
+            messages.append({"role": "user", "content": turno["question"]})
+            messages.append({"role": "assistant", "content": turno["response"]})
+        messages.append({"role": "user", "content": prompt})
         
         # Aplicar template de chat
         text = self.tokenizer.apply_chat_template(
             messages,
             tokenize=False,
             add_generation_prompt=True,
-            enable_thinking=True
+            enable_thinking=pensar
         )
         
-        # Preparar inputs
-        model_inputs = self.tokenizer([text], return_tensors="pt").to(self.model.device)
+        return self.tokenizer([text], return_tensors="pt").to(self.model.device)
+    
+    def _planejar_orcamento(self, max_tokens: int, max_thinking_tokens: Optional[int]):
+        """
+        Divide o limite de tokens de uma requisição entre pensamento e resposta
         
-        # Gerar resposta
-        generated_ids = self.model.generate(
-            **model_inputs,
-            max_new_tokens=max_tokens
+        Sem limite de pensamento (nem na requisição nem em LLM_MAX_THINKING_TOKENS)
+        os dois dividem max_tokens. Com limite, max_tokens passa a valer só para a
+        resposta e o </think> é forçado quando o pensamento esgota o seu. Com 0 o
+        pensamento é desligado no template de chat.
+        
+        Returns:
+            (OrcamentoPensamento ou None, limite de tokens novos, pensar)
+        """
+        if max_thinking_tokens is None:
+            max_thinking_tokens = self.max_thinking_tokens
+        if max_thinking_tokens is None:
+            return None, max_tokens, True
+        if max_thinking_tokens == 0:
+            return None, max_tokens, False
+        orcamento = OrcamentoPensamento(max_thinking_tokens, max_tokens)
+        return orcamento, orcamento.max_new_tokens, True
+    
+    def _gerar(self, model_inputs, max_tokens: int, sampling: SamplingParams,
+               streamer=None, speculative: Optional[bool] = None,
+               stats: Optional[Dict] = None,
+               cancelamento: Optional[CancellationToken] = None,
+               orcamento: Optional[OrcamentoPensamento] = None,
+               sessao: Optional[str] = None) -> List[int]:
+        """
+        Executa a geração na engine ativa e retorna apenas os IDs dos tokens novos
+        
+        Na engine HF, com decodificação especulativa a requisição roda
+        sozinha, verificando continuações propostas por n-gramas; senão, com o
+        batching contínuo ativo ela entra no loop compartilhado; caso contrário
+        usa model.generate com batch de tamanho 1. Quando a engine suporta, o
+        cache KV do prompt de sistema é reaproveitado e só o turno do usuário
+        passa pelo prefill; numa sessão, o cache reaproveitado é o dos turnos
+        anteriores da conversa.
+        
+        Args:
+            speculative: Força ligar/desligar a decodificação especulativa
+            stats: Dict preenchido com as estatísticas de aceitação (modo especulativo)
+            cancelamento: Interrompe a geração no próximo passo (desconexão ou prazo)
+            orcamento: Limites separados de pensamento e resposta
+            sessao: Conversa cujo cache KV é reaproveitado e atualizado
+        """
+        input_ids = model_inputs.input_ids[0].tolist()
+        if cancelamento is not None and cancelamento.cancelado:
+            # Cliente já foi embora (ou o prazo estourou) enquanto esperava na fila
+            if streamer is not None:
+                streamer.end()
+            return []
+        
+        prefixo = None
+        if self.backend.suporta_prefixo and sessao is not None:
+            prefixo = self._prefixo_sessao(sessao, input_ids)
+        elif self.backend.suporta_prefixo:
+            prefixo = self.prefix_cache.buscar(
+                self.model, self.tokenizer, self.identificador, self.system_prompt, input_ids
+            )
+        
+        if speculative is None:
+            speculative = self.speculative
+        return self.backend.gerar(
+            input_ids,
+            max_tokens,
+            sampling,
+            streamer=streamer,
+            prefixo=prefixo,
+            cancelamento=cancelamento,
+            speculative=speculative and self.backend.suporta_especulativo,
+            stats=stats,
+            orcamento=orcamento
         )
+    
+    def _prefixo_sessao(self, sessao: str, input_ids: List[int]) -> PrefixoKV:
+        """
+        Cache KV do prompt da sessão, sem o último token
         
-        output_ids = generated_ids[0][len(model_inputs.input_ids[0]):].tolist()
+        Parte do que a sessão já tem guardado (ou só do prompt de sistema,
+        se ela foi descartada ou é nova neste processo), faz o prefill do
+        trecho novo (a resposta anterior e a nova pergunta) e guarda o
+        resultado para o próximo turno.
+        """
+        base = self.sessoes.buscar(sessao, input_ids)
+        if base is None:
+            prefixo = self.prefix_cache.buscar(
+                self.model, self.tokenizer, self.identificador, self.system_prompt, input_ids
+            )
+            base = (prefixo.ids, prefixo.camadas) if prefixo is not None else ([], [])
+        ids, camadas = base
         
-        # Parsing do conteúdo de pensamento
+        alvo = input_ids[:-1]
+        if len(alvo) > len(ids):
+            entrada = torch.tensor([alvo[len(ids):]], device=self.model.device)
+            with torch.no_grad():
+                saida = self.model(input_ids=entrada,
+                                   past_key_values=tuplas_para_cache(camadas) if camadas else None,
+                                   use_cache=True)
+            camadas = cache_para_tuplas(saida.past_key_values)
+        self.sessoes.guardar(sessao, alvo, camadas, tamanho_bytes(camadas))
+        return PrefixoKV(alvo, camadas)
+    
+    def generate_response(self, prompt: str, max_tokens: int = 512,
+                          sampling: Optional[SamplingParams] = None,
+                          speculative: Optional[bool] = None,
+                          cancelamento: Optional[CancellationToken] = None,
+                          medicao: Optional[MedicaoGeracao] = None,
+                          max_thinking_tokens: Optional[int] = None,
+                          sessao: Optional[str] = None,
+                          historico: Optional[List[Dict]] = None) -> Dict:
+        """
+        Gera uma resposta para o prompt fornecido
+        
+        Args:
+            prompt: Pergunta/prompt do usuário
+            max_tokens: Número máximo de tokens a gerar (só da resposta, se houver limite de pensamento)
+            sampling: Parâmetros de decodificação (padrão: generation_config do modelo)
+            speculative: Liga/desliga a decodificação especulativa (padrão do serviço se None)
+            cancelamento: Token de cancelamento/prazo; a saída parcial é retornada
+            medicao: Recebe os tempos e a contagem de tokens (métricas da API)
+            max_thinking_tokens: Limite de tokens de pensamento (padrão LLM_MAX_THINKING_TOKENS);
+                ao esgotar, o </think> é forçado e a resposta começa. 0 desliga o pensamento
+            sessao: Identificador da conversa (ex.: chat_id); o cache KV dos turnos
+                anteriores é reaproveitado e só o turno novo passa pelo prefill
+            historico: Turnos anteriores da conversa ({'question', 'response'})
+            
+        Returns:
+            Dict com 'thinking', 'response', 'thinking_tokens', 'response_tokens' e
+            'stop_reason' (e 'speculative' com as estatísticas de aceitação, quando usada)
+        """
+        if sampling is None:
+            sampling = self.sampling_padrao()
+        
+        orcamento, limite, pensar = self._planejar_orcamento(max_tokens, max_thinking_tokens)
+        model_inputs = self._preparar_inputs(prompt, pensar=pensar, historico=historico)
+        streamer = None
+        if medicao is not None:
+            medicao.iniciar(model_inputs.input_ids.shape[1])
+            streamer = StreamerMedido(medicao)
+        
+        # Gerar resposta
+        stats = {}
         try:
-            # Procura o token </think> (151668)
-            index = len(output_ids) - output_ids[::-1].index(151668)
-        except ValueError:
-            index = 0
+            output_ids = self._gerar(model_inputs, limite, sampling, streamer=streamer,
+                                     speculative=speculative, stats=stats, cancelamento=cancelamento,
+                                     orcamento=orcamento, sessao=sessao)
+        except Exception:
+            if medicao is not None:
+                medicao.falhar()
+            raise
+        result = self._montar_resultado(output_ids, limite, cancelamento, orcamento, medicao)
+        if stats:
+            result["speculative"] = stats
+        return result
+    
+    def _montar_resultado(self, output_ids: List[int], limite: int,
+                          cancelamento: Optional[CancellationToken],
+                          orcamento: Optional[OrcamentoPensamento],
+                          medicao: Optional[MedicaoGeracao]) -> Dict:
+        """Separa pensamento e resposta dos tokens gerados e registra a medição"""
+        if orcamento is not None:
+            orcamento.sincronizar(output_ids)
+        stop_reason = self._motivo_parada(len(output_ids), limite, cancelamento, orcamento)
+        
+        # Parsing do conteúdo de pensamento: até o último </think> (151668), sem o eos final
+        index, response_tokens = contar_tokens(output_ids, self._eos_token_ids())
         
         thinking = self.tokenizer.decode(output_ids[:index], skip_special_tokens=True).strip("\n")
         response = self.tokenizer.decode(output_ids[index:], skip_special_tokens=True).strip("\n")
+        if medicao is not None:
+            medicao.concluir(stop_reason, index, response_tokens)
         
         return {
             "thinking": thinking,
-            "response": response
+            "response": response,
+            "thinking_tokens": index,
+            "response_tokens": response_tokens,
+            "stop_reason": stop_reason
         }
     
-    def generate_response_stream(self, prompt: str, max_tokens: int = 512) -> Iterator[str]:
+    def tamanho_geracao(self, prompt: str, max_tokens: int,
+                        max_thinking_tokens: Optional[int] = None,
+                        historico: Optional[List[Dict]] = None) -> Tuple[int, int]:
+        """
+        Tamanho de uma geração antes de executá-la (para agrupar lotes e ordenar a fila)
+        
+        Returns:
+            (tokens do prompt com o template de chat, limite de tokens novos)
+        """
+        _, limite, pensar = self._planejar_orcamento(max_tokens, max_thinking_tokens)
+        return self._preparar_inputs(prompt, pensar=pensar, historico=historico).input_ids.shape[1], limite
+    
+    def generate_batch(self, prompts: List[str], max_tokens: int = 512,
+                       sampling: Optional[SamplingParams] = None,
+                       cancelamento: Optional[CancellationToken] = None,
+                       medicoes: Optional[List[MedicaoGeracao]] = None,
+                       max_thinking_tokens: Optional[int] = None) -> List[Dict]:
+        """
+        Gera as respostas de vários prompts em um único lote com padding
+        
+        Todos os prompts usam a mesma decodificação e os mesmos limites. O
+        lote roda sozinho, fora do batching contínuo e sem o cache do prompt
+        de sistema (o padding à esquerda desloca as posições do prefixo).
+        Engines sem suporte a lote geram os prompts um por vez.
+        
+        Args:
+            prompts: Perguntas do lote (de tamanhos parecidos, para pouco padding)
+            max_tokens: Como em generate_response, vale para cada prompt
+            sampling: Parâmetros de decodificação (padrão: generation_config do modelo)
+            cancelamento: Interrompe o lote inteiro; as saídas parciais são retornadas
+            medicoes: Uma medição por prompt (métricas da API)
+            max_thinking_tokens: Limite de tokens de pensamento de cada prompt
+            
+        Returns:
+            Um dict por prompt, na ordem recebida, no formato de generate_response
+        """
+        if sampling is None:
+            sampling = self.sampling_padrao()
+        medicoes = medicoes or [None] * len(prompts)
+        
+        planos = [self._planejar_orcamento(max_tokens, max_thinking_tokens) for _ in prompts]
+        _, limite, pensar = planos[0]
+        orcamentos = [orcamento for orcamento, _, _ in planos]
+        lista_ids = [self._preparar_inputs(prompt, pensar=pensar).input_ids[0].tolist() for prompt in prompts]
+        
+        streamer = None
+        for medicao, ids in zip(medicoes, lista_ids):
+            if medicao is not None:
+                medicao.iniciar(len(ids))
+                streamer = StreamerMedido(medicao, streamer)
+        
+        try:
+            if cancelamento is not None and cancelamento.cancelado:
+                saidas = [[] for _ in prompts]
+            elif self.backend.suporta_lote:
+                pad_token_id = self.tokenizer.pad_token_id
+                if pad_token_id is None:
+                    pad_token_id = self._eos_token_ids()[0]
+                saidas = self.backend.gerar_lote(lista_ids, limite, sampling, pad_token_id,
+                                                 streamer=streamer, cancelamento=cancelamento,
+                                                 orcamentos=orcamentos)
+            else:
+                saidas = [
+                    self.backend.gerar(ids, limite, sampling, cancelamento=cancelamento, orcamento=orcamento)
+                    for ids, orcamento in zip(lista_ids, orcamentos)
+                ]
+        except Exception:
+            for medicao in medicoes:
+                if medicao is not None:
+                    medicao.falhar()
+            raise
+        
+        # Orçamentos novos: os do lote também contaram o padding das linhas que terminaram antes
+        return [
+            self._montar_resultado(saida, limite, cancelamento,
+                                   self._planejar_orcamento(max_tokens, max_thinking_tokens)[0], medicao)
+            for saida, medicao in zip(saidas, medicoes)
+        ]
+    
+    def generate_response_stream(self, prompt: str, max_tokens: int = 512,
+                                 sampling: Optional[SamplingParams] = None,
+                                 ao_concluir: Optional[Callable[[Dict[str, str]], None]] = None,
+                                 speculative: Optional[bool] = None,
+                                 cancelamento: Optional[CancellationToken] = None,
+                                 medicao: Optional[MedicaoGeracao] = None,
+                                 max_thinking_tokens: Optional[int] = None,
+                                 sessao: Optional[str] = None,
+                                 historico: Optional[List[Dict]] = None) -> Iterator[str]:
         """
         Gera uma resposta com streaming token por token
         
         Args:
             prompt: Pergunta/prompt do usuário
             max_tokens: Número máximo de tokens a gerar
+            sampling: Parâmetros de decodificação (padrão: amostragem com temperature=0.7)
+            ao_concluir: Callback chamado com {'thinking', 'response'} ao final da geração
+                (não é chamado se a geração for interrompida)
+            speculative: Liga/desliga a decodificação especulativa (padrão do serviço se None)
+            cancelamento: Token de cancelamento/prazo; o evento 'done' traz o 'stop_reason'
+            medicao: Recebe os tempos e a contagem de tokens (métricas da API)
+            max_thinking_tokens: Limite de tokens de pensamento, como em generate_response
+            sessao / historico: Conversa com vários turnos, como em generate_response
             
         Yields:
-            Eventos SSE com o texto gerado
+            Eventos SSE com o texto gerado; o 'done' traz as contagens de tokens
         """
-        # Preparar mensagem com instrução clara e exemplo
-        system_prompt = """Você é um assistente que responde perguntas de forma clara, direta e precisa em português.
-
-Exemplo:
-Pergunta: Quem inventou a lâmpada?
-Resposta: Thomas Edison inventou a lâmpada elétrica em 1879.
-
-Agora responda a próxima pergunta de forma direta e objetiva, com no máximo 2-3 frases curtas."""
+        if sampling is None:
+            sampling = self.sampling_padrao(stream=True)
         
-        messages = [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": prompt}
-        ]
+        orcamento, limite, pensar = self._planejar_orcamento(max_tokens, max_thinking_tokens)
+        model_inputs = self._preparar_inputs(prompt, pensar=pensar, historico=historico)
         
-        # Aplicar template de chat
-        text = self.tokenizer.apply_chat_template(
-            messages,
-            tokenize=False,
-            add_generation_prompt=True,
-            enable_thinking=True
-        )
-        
-        # Preparar inputs
-        model_inputs = self.tokenizer([text], return_tensors="pt").to(self.model.device)
+        # Streamer de IDs: a detokenização é incremental, feita pelo parser
+        streamer = TokenIteratorStreamer(skip_prompt=True)
+        parser = ThinkStreamParser(self.tokenizer, eos_token_ids=self._eos_token_ids())
+        destino = streamer
+        if medicao is not None:
+            medicao.iniciar(model_inputs.input_ids.shape[1])
+            destino = StreamerMedido(medicao, streamer)
         
-        # Configurar streamer
-        streamer = TextIteratorStreamer(
-            self.tokenizer,
-            skip_prompt=True,
-            skip_special_tokens=False
-        )
+        # Configurar geração em thread separada
+        stats = {}
+        erros = []
         
-        # Configurar geração em thread separada com parâmetros otimizados
-        generation_kwargs = dict(
-            **model_inputs,
-            max_new_tokens=max_tokens,
-            streamer=streamer,
-            temperature=0.7,
-            top_p=0.9,
-            repetition_penalty=1.1,
-            do_sample=True
-        )
+        def gerar():
+            try:
+                self._gerar(model_inputs, limite, sampling, streamer=destino, speculative=speculative,
+                            stats=stats, cancelamento=cancelamento, orcamento=orcamento, sessao=sessao)
+            except Exception as erro:
+                # Libera o consumidor do streamer; o erro é relançado abaixo
+                erros.append(erro)
+                streamer.end()
         
-        thread = Thread(target=self.model.generate, kwargs=generation_kwargs)
+        thread = Thread(target=gerar)
         thread.start()
         
-        # Variáveis para controle
-        full_text = ""
-        in_thinking = False
-        thinking_text = ""
-        response_text = ""
-        thinking_sent = False
-        
         # Iterar sobre tokens gerados
-        for new_text in streamer:
-            # Ignorar apenas tokens vazios
-            if not new_text:
-                continue
-            
-            # Detectar e processar tags de controle ANTES de limpar
-            
-            # Início do pensamento
-            if "<think>" in new_text:
-                in_thinking = True
-                new_text = new_text.replace("<think>", "")
-            
-            # Fim do pensamento
-            if "</think>" in new_text:
-                in_thinking = False
-                thinking_sent = True
-                parts = new_text.split("</think>", 1)
-                # Enviar última parte do pensamento
-                if parts[0]:
-                    yield f"data: {{'type': 'thinking_chunk', 'content': {repr(parts[0])}}}\n\n"
-                # Preparar resto para ser processado como resposta
-                new_text = parts[1] if len(parts) > 1 else ""
-                if not new_text:
-                    continue
-            
-            # Limpar tokens especiais de fim
-            new_text = new_text.replace("<|endoftext|>", "")
-            new_text = new_text.replace("<|im_end|>", "")
-            new_text = new_text.replace("<|end|>", "")
-            
-            # Enviar apenas se tiver conteúdo
-            if not new_text.strip():
-                continue
-            
-            # Enviar o chunk apropriado
-            if in_thinking:
-                yield f"data: {{'type': 'thinking_chunk', 'content': {repr(new_text)}}}\n\n"
-            elif thinking_sent:
-                yield f"data: {{'type': 'response_chunk', 'content': {repr(new_text)}}}\n\n"
+        for ids in streamer:
+            for evento in parser.feed(ids):
+                yield formatar_sse(evento)
+        for evento in parser.finish():
+            yield formatar_sse(evento)
         
-        # Finalizar
-        yield f"data: {{'type': 'done'}}\n\n"
         thread.join()
+        if erros:
+            if medicao is not None:
+                medicao.falhar()
+            raise erros[0]
+        if stats:
+            # Estatísticas de aceitação da decodificação especulativa
+            yield formatar_sse({"type": "speculative", "stats": stats})
+        
+        # Finalizar
+        gerados = parser.thinking_tokens + parser.response_tokens
+        stop_reason = self._motivo_parada(gerados, limite, cancelamento, orcamento)
+        if medicao is not None:
+            medicao.concluir(stop_reason, parser.thinking_tokens, parser.response_tokens)
+        yield formatar_sse({
+            "type": "done",
+            "stop_reason": stop_reason,
+            "thinking_tokens": parser.thinking_tokens,
+            "response_tokens": parser.response_tokens
+        })
+        
+        # Saídas parciais não vão para o cache
+        if ao_concluir is not None and stop_reason in ("stop", "length"):
+            ao_concluir(parser.resultado())
+    
+    def _motivo_parada(self, num_gerados: int, max_tokens: int,
+                       cancelamento: Optional[CancellationToken],
+                       orcamento: Optional[OrcamentoPensamento] = None) -> str:
+        """
+        Motivo do fim da geração: 'stop' (eos), 'length' (max_tokens ou limite
+        da resposta), 'cancelled' (cliente desconectou) ou 'deadline' (prazo expirou)
+        
+        Gerações interrompidas entram nos contadores de cancelamento.
+        """
+        if cancelamento is not None and cancelamento.motivo is not None:
+            self.cancelamentos.registrar(cancelamento.motivo, num_gerados)
+            return cancelamento.motivo
+        if orcamento is not None and orcamento.resposta_esgotada:
+            return "length"
+        return "length" if num_gerados >= max_tokens else "stop"
+    
+    @staticmethod
+    def replay_stream(result: Dict[str, str]) -> Iterator[str]:
+        """Reproduz uma resposta já pronta (ex.: do cache) no formato de eventos do streaming"""
+        if result.get("thinking"):
+            yield formatar_sse({"type": "thinking_chunk", "content": result["thinking"]})
+        if result.get("response"):
+            yield formatar_sse({"type": "response_chunk", "content": result["response"]})
+        yield formatar_sse({"type": "done", "stop_reason": "stop"})
 
 
 # Para execução direta (teste)
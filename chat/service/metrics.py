@@ -0,0 +1,318 @@
+"""
+Métricas da inferência no formato de texto do Prometheus
+
+Contadores, medidores e histogramas com rótulos, sem dependências
+externas, expostos pela API em GET /metrics. Cada geração é acompanhada
+por uma MedicaoGeracao, criada pela API na chegada da requisição e
+preenchida pelo serviço do modelo (início, primeiro token, fim e
+contagem de tokens).
+
+Com vários workers (API_WORKERS) cada processo tem as próprias métricas.
+"""
+import math
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Limites dos histogramas de latência (s) e de vazão (tokens/s)
+BUCKETS_LATENCIA = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+BUCKETS_TOKENS_POR_S = (1, 2, 5, 10, 15, 20, 30, 50, 75, 100, 200, 500)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _formatar_valor(valor: float) -> str:
+    if math.isinf(valor):
+        return "+Inf" if valor > 0 else "-Inf"
+    if float(valor).is_integer():
+        return str(int(valor))
+    return repr(float(valor))
+
+
+def _escapar(valor: str) -> str:
+    return valor.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _formatar_rotulos(nomes: Sequence[str], valores: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pares = list(zip(nomes, valores))
+    if extra is not None:
+        pares.append(extra)
+    if not pares:
+        return ""
+    return "{" + ",".join(f'{nome}="{_escapar(valor)}"' for nome, valor in pares) + "}"
+
+
+class _Metrica:
+    """Base: uma família de séries identificadas pelos valores dos rótulos"""
+
+    tipo = "untyped"
+
+    def __init__(self, nome: str, descricao: str, rotulos: Sequence[str] = ()):
+        self.nome = nome
+        self.descricao = descricao
+        self.rotulos = tuple(rotulos)
+        self._lock = threading.Lock()
+        self._series: Dict[Tuple[str, ...], object] = {}
+
+    def _chave(self, rotulos: Dict[str, object]) -> Tuple[str, ...]:
+        if set(rotulos) != set(self.rotulos):
+            raise ValueError(f"{self.nome} espera os rótulos {self.rotulos}, recebeu {tuple(rotulos)}")
+        return tuple(str(rotulos[nome]) for nome in self.rotulos)
+
+    def _linhas(self) -> List[str]:
+        raise NotImplementedError
+
+    def renderizar(self) -> List[str]:
+        return [f"# HELP {self.nome} {self.descricao}", f"# TYPE {self.nome} {self.tipo}"] + self._linhas()
+
+
+class Contador(_Metrica):
+    """Valor que só cresce (ex.: tokens gerados)"""
+
+    tipo = "counter"
+
+    def inc(self, valor: float = 1.0, **rotulos):
+        if valor < 0:
+            raise ValueError("Contadores não podem diminuir")
+        chave = self._chave(rotulos)
+        with self._lock:
+            self._series[chave] = self._series.get(chave, 0.0) + valor
+
+    def valor(self, **rotulos) -> float:
+        with self._lock:
+            return self._series.get(self._chave(rotulos), 0.0)
+
+    def _linhas(self) -> List[str]:
+        with self._lock:
+            series = sorted(self._series.items())
+        return [f"{self.nome}{_formatar_rotulos(self.rotulos, chave)} {_formatar_valor(valor)}"
+                for chave, valor in series]
+
+
+class Medidor(Contador):
+    """Valor instantâneo que sobe e desce (ex.: requisições em andamento)"""
+
+    tipo = "gauge"
+
+    def inc(self, valor: float = 1.0, **rotulos):
+        chave = self._chave(rotulos)
+        with self._lock:
+            self._series[chave] = self._series.get(chave, 0.0) + valor
+
+    def dec(self, valor: float = 1.0, **rotulos):
+        self.inc(-valor, **rotulos)
+
+    def set(self, valor: float, **rotulos):
+        chave = self._chave(rotulos)
+        with self._lock:
+            self._series[chave] = float(valor)
+
+
+class Histograma(_Metrica):
+    """Distribuição de observações em buckets cumulativos, com soma e contagem"""
+
+    tipo = "histogram"
+
+    def __init__(self, nome: str, descricao: str, rotulos: Sequence[str] = (),
+                 buckets: Iterable[float] = BUCKETS_LATENCIA):
+        super().__init__(nome, descricao, rotulos)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, valor: float, **rotulos):
+        chave = self._chave(rotulos)
+        with self._lock:
+            serie = self._series.get(chave)
+            if serie is None:
+                serie = self._series[chave] = {"buckets": [0] * len(self.buckets), "soma": 0.0, "contagem": 0}
+            for i, limite in enumerate(self.buckets):
+                if valor <= limite:
+                    serie["buckets"][i] += 1
+            serie["soma"] += valor
+            serie["contagem"] += 1
+
+    def contagem(self, **rotulos) -> int:
+        with self._lock:
+            serie = self._series.get(self._chave(rotulos))
+            return serie["contagem"] if serie else 0
+
+    def _linhas(self) -> List[str]:
+        with self._lock:
+            series = sorted((chave, dict(serie, buckets=list(serie["buckets"])))
+                            for chave, serie in self._series.items())
+        linhas = []
+        for chave, serie in series:
+            for limite, quantidade in zip(self.buckets, serie["buckets"]):
+                rotulos = _formatar_rotulos(self.rotulos, chave, ("le", _formatar_valor(limite)))
+                linhas.append(f"{self.nome}_bucket{rotulos} {quantidade}")
+            rotulos = _formatar_rotulos(self.rotulos, chave, ("le", "+Inf"))
+            linhas.append(f"{self.nome}_bucket{rotulos} {serie['contagem']}")
+            rotulos = _formatar_rotulos(self.rotulos, chave)
+            linhas.append(f"{self.nome}_sum{rotulos} {_formatar_valor(serie['soma'])}")
+            linhas.append(f"{self.nome}_count{rotulos} {serie['contagem']}")
+        return linhas
+
+
+class Registro:
+    """Conjunto de métricas renderizado em uma única resposta"""
+
+    def __init__(self):
+        self._metricas: List[_Metrica] = []
+
+    def registrar(self, metrica: _Metrica) -> _Metrica:
+        if any(m.nome == metrica.nome for m in self._metricas):
+            raise ValueError(f"Métrica já registrada: {metrica.nome}")
+        self._metricas.append(metrica)
+        return metrica
+
+    def renderizar(self) -> str:
+        linhas = []
+        for metrica in self._metricas:
+            linhas.extend(metrica.renderizar())
+        return "\n".join(linhas) + "\n"
+
+
+class MetricasInferencia:
+    """Métricas do serviço de chat, rotuladas por endpoint"""
+
+    def __init__(self):
+        self.registro = Registro()
+        r = self.registro.registrar
+        self.espera_fila = r(Histograma(
+            "llm_queue_wait_seconds", "Tempo entre a chegada da requisição e o início da geração", ("endpoint",)))
+        self.prefill = r(Histograma(
+            "llm_prefill_seconds", "Tempo entre o início da geração e o primeiro token", ("endpoint",)))
+        self.decode = r(Histograma(
+            "llm_decode_seconds", "Tempo entre o primeiro e o último token", ("endpoint",)))
+        self.ttft = r(Histograma(
+            "llm_time_to_first_token_seconds", "Tempo entre a chegada da requisição e o primeiro token",
+            ("endpoint",)))
+        self.tokens_por_s = r(Histograma(
+            "llm_tokens_per_second", "Tokens por segundo da fase de decode de cada requisição", ("endpoint",),
+            buckets=BUCKETS_TOKENS_POR_S))
+        self.em_andamento = r(Medidor(
+            "llm_requests_in_flight", "Gerações aceitas e ainda não concluídas (na fila ou rodando)",
+            ("endpoint",)))
+        self.profundidade_fila = r(Medidor(
+            "llm_queue_depth", "Tarefas aguardando uma thread do executor de inferência"))
+        self.workers_ocupados = r(Medidor(
+            "llm_inference_workers_busy", "Threads do executor de inferência ocupadas"))
+        self.tokens_gerados = r(Contador(
+            "llm_generated_tokens_total", "Tokens gerados, separados em pensamento e resposta",
+            ("endpoint", "section")))
+        self.tokens_prompt = r(Contador(
+            "llm_prompt_tokens_total", "Tokens de prompt processados (incluindo o prompt de sistema)",
+            ("endpoint",)))
+        self.requisicoes = r(Contador(
+            "llm_requests_total", "Requisições concluídas por resultado (stop, length, cancelled, deadline, cached)",
+            ("endpoint", "outcome")))
+        self.erros = r(Contador(
+            "llm_errors_total", "Requisições com erro por tipo", ("endpoint", "type")))
+        self.cancelamentos = r(Contador(
+            "llm_cancellations_total", "Gerações interrompidas por desconexão (cancelled) ou prazo (deadline)",
+            ("endpoint", "reason")))
+
+    def renderizar(self) -> str:
+        return self.registro.renderizar()
+
+
+# Métricas do processo, usadas pela API
+METRICAS = MetricasInferencia()
+
+
+class MedicaoGeracao:
+    """
+    Tempos e tokens de uma geração, registrados nas métricas ao final
+
+    A API cria a medição na chegada da requisição; o serviço do modelo
+    chama iniciar() quando a geração sai da fila, marcar_token() a cada
+    token (ou usa StreamerMedido) e concluir() ou falhar() no fim. A
+    medição conta como em andamento até concluir(), falhar() ou descartar().
+    """
+
+    def __init__(self, endpoint: str, metricas: Optional[MetricasInferencia] = None):
+        self.endpoint = endpoint
+        self.metricas = metricas or METRICAS
+        self.chegada = time.monotonic()
+        self.inicio: Optional[float] = None
+        self.primeiro_token: Optional[float] = None
+        self.fim: Optional[float] = None
+        self.tokens_prompt = 0
+        self.finalizada = False
+        self.metricas.em_andamento.inc(endpoint=endpoint)
+
+    def iniciar(self, tokens_prompt: int = 0):
+        """A geração saiu da fila e começou"""
+        self.inicio = time.monotonic()
+        self.tokens_prompt = tokens_prompt
+        self.metricas.espera_fila.observe(self.inicio - self.chegada, endpoint=self.endpoint)
+
+    def marcar_token(self):
+        if self.primeiro_token is None:
+            self.primeiro_token = time.monotonic()
+
+    def _finalizar(self) -> bool:
+        if self.finalizada:
+            return False
+        self.finalizada = True
+        self.fim = time.monotonic()
+        self.metricas.em_andamento.dec(endpoint=self.endpoint)
+        return True
+
+    def concluir(self, stop_reason: str, tokens_pensamento: int, tokens_resposta: int):
+        """Registra os tempos, os tokens e o resultado de uma geração encerrada"""
+        if not self._finalizar():
+            return
+        m, endpoint = self.metricas, self.endpoint
+        m.requisicoes.inc(endpoint=endpoint, outcome=stop_reason)
+        if stop_reason in ("cancelled", "deadline"):
+            m.cancelamentos.inc(endpoint=endpoint, reason=stop_reason)
+        m.tokens_prompt.inc(self.tokens_prompt, endpoint=endpoint)
+        m.tokens_gerados.inc(tokens_pensamento, endpoint=endpoint, section="thinking")
+        m.tokens_gerados.inc(tokens_resposta, endpoint=endpoint, section="response")
+
+        if self.inicio is None or self.primeiro_token is None:
+            # Interrompida antes do primeiro token: não há prefill nem decode a medir
+            return
+        m.prefill.observe(self.primeiro_token - self.inicio, endpoint=endpoint)
+        m.ttft.observe(self.primeiro_token - self.chegada, endpoint=endpoint)
+        duracao_decode = self.fim - self.primeiro_token
+        m.decode.observe(duracao_decode, endpoint=endpoint)
+        tokens_decode = tokens_pensamento + tokens_resposta - 1
+        if tokens_decode > 0 and duracao_decode > 0:
+            m.tokens_por_s.observe(tokens_decode / duracao_decode, endpoint=endpoint)
+
+    def falhar(self, tipo: str = "geracao"):
+        """A geração terminou com exceção"""
+        if self._finalizar():
+            self.metricas.erros.inc(endpoint=self.endpoint, type=tipo)
+
+    def descartar(self):
+        """A requisição foi recusada antes de entrar na fila (nada a medir)"""
+        if not self.finalizada:
+            self.finalizada = True
+            self.metricas.em_andamento.dec(endpoint=self.endpoint)
+
+
+class StreamerMedido:
+    """
+    Streamer (contrato put/end do model.generate) que marca o primeiro token
+
+    Repassa tudo ao streamer de destino, se houver. A primeira chamada de
+    put é o prompt e não conta como token.
+    """
+
+    def __init__(self, medicao: MedicaoGeracao, destino=None):
+        self.medicao = medicao
+        self.destino = destino
+        self._prompt_recebido = False
+
+    def put(self, value):
+        if self._prompt_recebido:
+            self.medicao.marcar_token()
+        self._prompt_recebido = True
+        if self.destino is not None:
+            self.destino.put(value)
+
+    def end(self):
+        if self.destino is not None:
+            self.destino.end()
@@ -0,0 +1,106 @@
+"""
+Modos de geração escolhidos por requisição
+
+Cada modo define o orçamento de tokens e os parâmetros de decodificação
+padrão; a requisição pode sobrescrever qualquer um deles, dentro das
+faixas validadas aqui.
+
+- fast: sem pensamento e com decodificação gulosa (perguntas factuais simples)
+- balanced: pensamento curto com a amostragem recomendada para o Qwen3
+- deep: pensamento longo e mais espaço para a resposta
+"""
+from dataclasses import asdict, dataclass
+from typing import Dict, Optional
+
+MODOS_VALIDOS = ("fast", "balanced", "deep")
+
+# Faixas aceitas para cada parâmetro sobrescrito pela requisição: (mínimo, máximo)
+FAIXAS = {
+    "max_tokens": (1, 1024),
+    "max_thinking_tokens": (0, 1024),
+    "temperature": (0.01, 2.0),
+    "top_p": (0.01, 1.0),
+    "top_k": (0, 1000),
+    "repetition_penalty": (1.0, 2.0),
+}
+
+CAMPOS_SAMPLING = ("do_sample", "temperature", "top_p", "top_k", "repetition_penalty")
+
+
+@dataclass(frozen=True)
+class ModoGeracao:
+    """Padrões de um modo; max_thinking_tokens=0 desliga o pensamento"""
+
+    max_tokens: int
+    max_thinking_tokens: Optional[int]
+    do_sample: bool
+    temperature: float = 1.0
+    top_p: float = 1.0
+    top_k: int = 0
+    repetition_penalty: float = 1.0
+
+    def as_dict(self) -> Dict:
+        return asdict(self)
+
+
+MODOS: Dict[str, ModoGeracao] = {
+    "fast": ModoGeracao(max_tokens=192, max_thinking_tokens=0, do_sample=False, repetition_penalty=1.1),
+    "balanced": ModoGeracao(max_tokens=256, max_thinking_tokens=256, do_sample=True,
+                            temperature=0.6, top_p=0.95, top_k=20),
+    "deep": ModoGeracao(max_tokens=512, max_thinking_tokens=1024, do_sample=True,
+                        temperature=0.6, top_p=0.95, top_k=20),
+}
+
+
+def validar(**valores) -> None:
+    """Lança ValueError se algum valor informado estiver fora da faixa aceita"""
+    for campo, valor in valores.items():
+        if valor is None or campo not in FAIXAS:
+            continue
+        minimo, maximo = FAIXAS[campo]
+        if not minimo <= valor <= maximo:
+            raise ValueError(f"{campo} deve estar entre {minimo} e {maximo}")
+
+
+def resolver(modo: Optional[str], max_tokens: Optional[int] = None,
+             max_thinking_tokens: Optional[int] = None, **sampling) -> Dict:
+    """
+    Combina os padrões do modo com os valores enviados pela requisição
+
+    Sem modo, só os valores enviados são aplicados (os demais ficam com o
+    padrão do serviço, como antes dos modos existirem).
+
+    Args:
+        modo: 'fast', 'balanced', 'deep' ou None
+        max_tokens: Limite de tokens (da resposta, se houver limite de pensamento)
+        max_thinking_tokens: Limite de tokens de pensamento (0 = sem pensamento)
+        **sampling: do_sample, temperature, top_p, top_k, repetition_penalty
+
+    Returns:
+        Dict com 'modo', 'max_tokens', 'max_thinking_tokens' e 'sampling'
+        (overrides para LLMService.sampling_padrao; None = padrão do serviço)
+
+    Raises:
+        ValueError: Modo desconhecido, parâmetro desconhecido ou valor fora da faixa
+    """
+    desconhecidos = set(sampling) - set(CAMPOS_SAMPLING)
+    if desconhecidos:
+        raise ValueError(f"Parâmetros desconhecidos: {', '.join(sorted(desconhecidos))}")
+    validar(max_tokens=max_tokens, max_thinking_tokens=max_thinking_tokens, **sampling)
+
+    if modo is None:
+        padrao = {}
+    elif modo in MODOS:
+        padrao = MODOS[modo].as_dict()
+    else:
+        raise ValueError(f"Modo inválido: {modo}. Opções: {', '.join(MODOS_VALIDOS)}")
+
+    def escolher(campo, valor):
+        return valor if valor is not None else padrao.get(campo)
+
+    return {
+        "modo": modo,
+        "max_tokens": escolher("max_tokens", max_tokens),
+        "max_thinking_tokens": escolher("max_thinking_tokens", max_thinking_tokens),
+        "sampling": {campo: escolher(campo, sampling.get(campo)) for campo in CAMPOS_SAMPLING},
+    }
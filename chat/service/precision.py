@@ -0,0 +1,202 @@
+"""
+Modos de precisão para inferência em CPU
+
+Uso para comparar os modos (rodar a partir da pasta chat/):
+    python -m service.precision --modos fp32 bf16 int8
+"""
+import argparse
+import difflib
+import json
+import os
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional, Tuple
+
+import torch
+from transformers import AutoModelForCausalLM
+
+PRECISOES = ("auto", "fp32", "bf16", "int8")
+
+PROMPTS_PADRAO = [
+    "Quem foi a primeira pessoa no espaço?",
+    "Quem inventou a lâmpada?",
+    "Qual é a capital da Austrália?",
+    "Explique em uma frase o que é fotossíntese.",
+]
+
+
+def bf16_suportado() -> bool:
+    """Verifica se a CPU tem instruções nativas para bfloat16 (AVX512-BF16 ou AMX)"""
+    try:
+        with open("/proc/cpuinfo") as arquivo:
+            flags = arquivo.read()
+    except OSError:
+        return False
+    return "avx512_bf16" in flags or "amx_bf16" in flags
+
+
+def carregar_modelo(model_name: str, precisao: str = "auto") -> Tuple[torch.nn.Module, str]:
+    """
+    Carrega o modelo na precisão pedida
+
+    Args:
+        model_name: Nome do modelo no Hugging Face
+        precisao: 'auto' (dtype do checkpoint), 'fp32', 'bf16' ou 'int8'
+            (quantização dinâmica das camadas Linear)
+
+    Returns:
+        (modelo, precisão efetivamente usada)
+    """
+    if precisao not in PRECISOES:
+        raise ValueError(f"Precisão inválida: {precisao}. Opções: {', '.join(PRECISOES)}")
+
+    if precisao == "bf16" and not bf16_suportado():
+        print("CPU sem suporte nativo a bf16; usando fp32")
+        precisao = "fp32"
+
+    dtype = {
+        "auto": "auto",
+        "fp32": torch.float32,
+        "bf16": torch.bfloat16,
+        "int8": torch.float32,
+    }[precisao]
+
+    model = AutoModelForCausalLM.from_pretrained(
+        model_name,
+        torch_dtype=dtype,
+        device_map="cpu"
+    )
+
+    if precisao == "int8":
+        model = torch.ao.quantization.quantize_dynamic(
+            model, {torch.nn.Linear}, dtype=torch.qint8
+        )
+
+    model.eval()
+    return model, precisao
+
+
+def rss_bytes() -> int:
+    """Memória residente (RSS) do processo atual"""
+    with open("/proc/self/status") as arquivo:
+        for linha in arquivo:
+            if linha.startswith("VmRSS:"):
+                return int(linha.split()[1]) * 1024
+    return 0
+
+
+def medir(model_name: str, precisao: str, prompts: List[str], max_tokens: int) -> Dict:
+    """Carrega o modelo no modo indicado e mede latência, RSS e as respostas geradas"""
+    from service.llm import LLMService
+
+    rss_inicial = rss_bytes()
+    inicio = time.perf_counter()
+    llm = LLMService(model_name, continuous_batching=False, precision=precisao)
+    tempo_carga = time.perf_counter() - inicio
+    # Medido antes das gerações, para não incluir o cache KV e as ativações
+    rss_modelo = rss_bytes() - rss_inicial
+
+    greedy = llm.sampling_padrao(do_sample=False)
+    resultados = []
+    for prompt in prompts:
+        model_inputs = llm._preparar_inputs(prompt)
+        inicio = time.perf_counter()
+        ids = llm._gerar(model_inputs, max_tokens, greedy)
+        duracao = time.perf_counter() - inicio
+        resultados.append({
+            "prompt": prompt,
+            "ids": ids,
+            "texto": llm.tokenizer.decode(ids, skip_special_tokens=True),
+            "latencia_s": duracao,
+            "tokens_por_s": len(ids) / duracao if duracao > 0 else 0.0,
+        })
+
+    return {
+        "precisao": llm.precisao,
+        "tempo_carga_s": tempo_carga,
+        "rss_bytes": rss_bytes(),
+        "rss_modelo_bytes": rss_modelo,
+        "resultados": resultados,
+    }
+
+
+def _deriva(referencia: Dict, candidato: Dict) -> Dict:
+    """Compara as respostas de um modo com as do fp32"""
+    concordancia_tokens = []
+    similaridade_texto = []
+    for ref, cand in zip(referencia["resultados"], candidato["resultados"]):
+        iguais = 0
+        for a, b in zip(ref["ids"], cand["ids"]):
+            if a != b:
+                break
+            iguais += 1
+        concordancia_tokens.append(iguais / max(1, len(ref["ids"])))
+        similaridade_texto.append(difflib.SequenceMatcher(None, ref["texto"], cand["texto"]).ratio())
+    n = max(1, len(concordancia_tokens))
+    return {
+        "prefixo_identico_medio": sum(concordancia_tokens) / n,
+        "similaridade_texto_media": sum(similaridade_texto) / n,
+        "respostas_identicas": sum(1 for c in concordancia_tokens if c == 1.0),
+    }
+
+
+def comparar_precisoes(model_name: str, precisoes: List[str],
+                       prompts: Optional[List[str]] = None, max_tokens: int = 128) -> Dict:
+    """
+    Compara latência, RSS e deriva das respostas de cada modo contra o fp32
+
+    Cada modo roda em um processo separado para que a RSS medida não inclua
+    modelos carregados anteriormente. A decodificação é gulosa para que as
+    diferenças venham apenas da precisão.
+    """
+    prompts = prompts or PROMPTS_PADRAO
+    if "fp32" not in precisoes:
+        precisoes = ["fp32"] + list(precisoes)
+
+    diretorio_chat = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    medicoes = {}
+    for precisao in precisoes:
+        print(f"Medindo {precisao}...")
+        saida = subprocess.run(
+            [sys.executable, "-m", "service.precision", "--medir", precisao,
+             "--modelo", model_name, "--max-tokens", str(max_tokens),
+             "--prompts-json", json.dumps(prompts)],
+            cwd=diretorio_chat, capture_output=True, text=True, check=True
+        )
+        medicoes[precisao] = json.loads(saida.stdout.strip().splitlines()[-1])
+
+    referencia = medicoes["fp32"]
+    relatorio = {}
+    for precisao, medicao in medicoes.items():
+        latencias = [r["latencia_s"] for r in medicao["resultados"]]
+        relatorio[precisao] = {
+            "precisao_efetiva": medicao["precisao"],
+            "tempo_carga_s": round(medicao["tempo_carga_s"], 2),
+            "rss_mb": round(medicao["rss_bytes"] / 2**20, 1),
+            "rss_modelo_mb": round(medicao["rss_modelo_bytes"] / 2**20, 1),
+            "latencia_media_s": round(sum(latencias) / len(latencias), 3),
+            "tokens_por_s": round(
+                sum(r["tokens_por_s"] for r in medicao["resultados"]) / len(latencias), 2
+            ),
+            "deriva_vs_fp32": _deriva(referencia, medicao),
+        }
+    return relatorio
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compara os modos de precisão do LLMService")
+    parser.add_argument("--modelo", default="Qwen/Qwen3-0.6B")
+    parser.add_argument("--modos", nargs="+", default=["fp32", "bf16", "int8"], choices=PRECISOES)
+    parser.add_argument("--max-tokens", type=int, default=128)
+    parser.add_argument("--medir", choices=PRECISOES, help=argparse.SUPPRESS)
+    parser.add_argument("--prompts-json", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.medir:
+        # Execução interna: mede um único modo e imprime o JSON na última linha
+        prompts = json.loads(args.prompts_json) if args.prompts_json else PROMPTS_PADRAO
+        print(json.dumps(medir(args.modelo, args.medir, prompts, args.max_tokens)))
+    else:
+        relatorio = comparar_precisoes(args.modelo, args.modos, max_tokens=args.max_tokens)
+        print(json.dumps(relatorio, indent=2, ensure_ascii=False))
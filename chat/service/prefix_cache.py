@@ -0,0 +1,96 @@
+import hashlib
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import torch
+
+from service.kv_cache import CamadasKV, cache_para_tuplas
+
+
+class PrefixoKV:
+    """Tokens do prefixo e o cache KV correspondente (somente leitura)"""
+
+    def __init__(self, ids: List[int], camadas: CamadasKV):
+        self.ids = ids
+        self.camadas = camadas
+
+    def __len__(self):
+        return len(self.ids)
+
+    def casa_com(self, input_ids: List[int]) -> bool:
+        """Verifica se a entrada começa com o prefixo e ainda tem tokens a processar"""
+        return len(input_ids) > len(self.ids) and input_ids[:len(self.ids)] == self.ids
+
+
+class PrefixCache:
+    """
+    Cache KV pré-computado do prompt de sistema
+
+    O prefill do prompt de sistema é feito uma única vez por combinação de
+    modelo, template de chat e texto do prompt; as requisições reutilizam o
+    cache e só fazem o prefill do turno do usuário. Uma mudança em qualquer
+    um desses itens gera uma nova chave e, portanto, um novo prefill.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entradas: Dict[Tuple[str, str, str], PrefixoKV] = {}
+        self.acertos = 0
+        self.falhas = 0
+
+    @staticmethod
+    def _chave(model_name: str, tokenizer, system_prompt: str) -> Tuple[str, str, str]:
+        template = getattr(tokenizer, "chat_template", None) or ""
+        if isinstance(template, dict):
+            template = repr(sorted(template.items()))
+        return (
+            model_name,
+            hashlib.sha256(template.encode("utf-8")).hexdigest(),
+            hashlib.sha256(system_prompt.encode("utf-8")).hexdigest(),
+        )
+
+    def obter(self, model, tokenizer, model_name: str, system_prompt: str) -> PrefixoKV:
+        """Retorna o prefixo do prompt de sistema, calculando-o se necessário"""
+        chave = self._chave(model_name, tokenizer, system_prompt)
+        with self._lock:
+            prefixo = self._entradas.get(chave)
+            if prefixo is not None:
+                return prefixo
+
+            texto = tokenizer.apply_chat_template(
+                [{"role": "system", "content": system_prompt}],
+                tokenize=False,
+                add_generation_prompt=False
+            )
+            ids = tokenizer(texto, return_tensors="pt").input_ids.to(model.device)
+            with torch.no_grad():
+                saida = model(input_ids=ids, use_cache=True)
+            prefixo = PrefixoKV(ids[0].tolist(), cache_para_tuplas(saida.past_key_values))
+            # Só o prefixo vigente é mantido; chaves antigas ficaram inválidas
+            self._entradas = {chave: prefixo}
+            return prefixo
+
+    def buscar(self, model, tokenizer, model_name: str, system_prompt: str,
+               input_ids: List[int]) -> Optional[PrefixoKV]:
+        """Retorna o prefixo se a entrada começar com ele, senão None"""
+        prefixo = self.obter(model, tokenizer, model_name, system_prompt)
+        with self._lock:
+            if prefixo.casa_com(input_ids):
+                self.acertos += 1
+                return prefixo
+            self.falhas += 1
+            return None
+
+    def invalidar(self):
+        """Descarta todos os prefixos (ex.: ao recarregar o modelo)"""
+        with self._lock:
+            self._entradas = {}
+
+    def stats(self) -> Dict:
+        with self._lock:
+            tokens = [len(p) for p in self._entradas.values()]
+            return {
+                "tokens_prefixo": tokens[0] if tokens else 0,
+                "acertos": self.acertos,
+                "falhas": self.falhas,
+            }
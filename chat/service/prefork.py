@@ -0,0 +1,167 @@
+"""
+Execução com vários workers compartilhando uma única cópia dos pesos
+
+O processo pai carrega o tokenizer e os pesos, congela o heap do Python
+(gc.freeze) e só então cria os workers com fork. Os tensores dos pesos
+nunca são escritos durante a inferência, então as páginas continuam
+compartilhadas (copy-on-write) entre todos os workers, e cada worker só
+paga pela memória própria (cache KV, ativações, caches de resposta).
+
+Uso (a partir da pasta chat/):
+    API_WORKERS=4 python run_api.py
+"""
+import gc
+import os
+import signal
+import socket
+import sys
+import time
+from typing import Dict, Optional, Tuple
+
+import torch
+from transformers import AutoTokenizer
+
+from service.precision import carregar_modelo
+from service.runtime import configurar as configurar_runtime
+
+# Modelo carregado pelo processo pai antes do fork: (model_name, precisão pedida) -> (tokenizer, modelo, precisão)
+_precarregados: Dict[Tuple[str, str], Tuple] = {}
+
+
+def precarregar(model_name: str, precisao: str):
+    """
+    Carrega tokenizer e pesos no processo atual para serem herdados pelos workers
+
+    Nenhuma passada do modelo roda aqui: o pool de threads de operações
+    paralelas só é iniciado nos workers, depois do fork.
+    """
+    print(f"Pré-carregando {model_name} (precisão: {precisao}) no processo pai...")
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model, efetiva = carregar_modelo(model_name, precisao)
+    _precarregados[(model_name, precisao)] = (tokenizer, model, efetiva)
+    # Objetos criados até aqui não são mais visitados pelo coletor de lixo,
+    # que senão tocaria nos cabeçalhos e duplicaria as páginas nos workers
+    gc.collect()
+    gc.freeze()
+
+
+def obter_precarregado(model_name: str, precisao: str) -> Optional[Tuple]:
+    """Retorna (tokenizer, modelo, precisão efetiva) se o pai já carregou o modelo"""
+    return _precarregados.get((model_name, precisao))
+
+
+def uso_memoria() -> Dict:
+    """
+    Memória do processo atual separada em compartilhada e exclusiva
+
+    Lê /proc/self/smaps_rollup: 'compartilhada' são as páginas também
+    mapeadas por outros processos (ex.: pesos herdados do pai), 'exclusiva'
+    o que só este worker usa e 'pss' a divisão proporcional das
+    compartilhadas (somando o pss de todos os workers tem-se o total real).
+    """
+    campos = {}
+    try:
+        with open("/proc/self/smaps_rollup") as arquivo:
+            for linha in arquivo:
+                partes = linha.split()
+                if len(partes) == 3 and partes[2] == "kB":
+                    campos[partes[0].rstrip(":")] = int(partes[1]) * 1024
+    except OSError:
+        return {}
+
+    def mb(*nomes) -> float:
+        return round(sum(campos.get(nome, 0) for nome in nomes) / 2**20, 1)
+
+    return {
+        "pid": os.getpid(),
+        "rss_mb": mb("Rss"),
+        "pss_mb": mb("Pss"),
+        "compartilhada_mb": mb("Shared_Clean", "Shared_Dirty"),
+        "exclusiva_mb": mb("Private_Clean", "Private_Dirty"),
+    }
+
+
+def _abrir_socket(host: str, porta: int) -> socket.socket:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, porta))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def _executar_worker(app: str, sock: socket.socket, indice: int, workers: int, log_level: str):
+    """Corpo do processo filho: servidor uvicorn no socket herdado"""
+    import uvicorn
+
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    # Threads e núcleos deste worker, antes de qualquer uso do modelo
+    configurar_runtime(workers=workers, indice=indice)
+    config = uvicorn.Config(app, log_level=log_level)
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def servir(app: str, host: str, porta: int, workers: int,
+           model_name: Optional[str], precisao: str, log_level: str = "info"):
+    """
+    Pré-carrega o modelo e mantém `workers` processos uvicorn no mesmo socket
+
+    Com model_name=None nada é pré-carregado (ex.: LLM_SERVICE=fake).
+
+    Workers que morrem são recriados com fork a partir do pai, reaproveitando
+    os pesos já carregados e a mesma fatia de núcleos (ver service/runtime.py).
+    SIGINT/SIGTERM no pai encerram todos os workers.
+    """
+    # Sem pool de threads no pai: ele nunca roda o modelo, só o carrega
+    torch.set_num_threads(1)
+    if model_name is not None:
+        precarregar(model_name, precisao)
+    sock = _abrir_socket(host, porta)
+
+    filhos = {}
+    encerrando = False
+
+    def criar_worker(indice: int):
+        pid = os.fork()
+        if pid == 0:
+            try:
+                _executar_worker(app, sock, indice, workers, log_level)
+            finally:
+                os._exit(0)
+        filhos[pid] = (time.monotonic(), indice)
+        print(f"Worker {pid} iniciado (índice {indice})")
+
+    def encerrar(signum, frame):
+        nonlocal encerrando
+        encerrando = True
+        for pid in list(filhos):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, encerrar)
+    signal.signal(signal.SIGTERM, encerrar)
+
+    for indice in range(workers):
+        criar_worker(indice)
+    print(f"{workers} workers ouvindo em http://{host}:{porta}")
+
+    while filhos:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        filho = filhos.pop(pid, None)
+        if filho is None or encerrando:
+            continue
+        inicio, indice = filho
+        print(f"Worker {pid} terminou (status {status}); criando outro", file=sys.stderr)
+        if time.monotonic() - inicio < 5:
+            # Evita um loop de fork se o worker falha logo na inicialização
+            time.sleep(5)
+        criar_worker(indice)
+    sock.close()
@@ -0,0 +1,113 @@
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from service.sampling import SamplingParams
+
+
+def normalizar_pergunta(pergunta: str) -> str:
+    """
+    Normaliza a pergunta para uso como chave de cache
+
+    Aplica NFKC, ignora maiúsculas/minúsculas, colapsa espaços e remove
+    pontuação nas pontas ("Quem foi...?" e "quem foi... " viram a mesma chave).
+    """
+    texto = unicodedata.normalize("NFKC", pergunta).casefold()
+    texto = re.sub(r"\s+", " ", texto)
+    return texto.strip(" \t\n?!.;:¿¡")
+
+
+def chave_decodificacao(sampling: SamplingParams) -> Tuple:
+    """Parte da chave que depende dos parâmetros de decodificação"""
+    if not sampling.do_sample:
+        # Em modo guloso temperatura/top-p/top-k não alteram o resultado
+        return ("greedy", sampling.repetition_penalty)
+    return (
+        "sample",
+        sampling.temperature,
+        sampling.top_p,
+        sampling.top_k,
+        sampling.repetition_penalty,
+    )
+
+
+class ResponseCache:
+    """
+    Cache de respostas completas com LRU e TTL
+
+    A chave combina a pergunta normalizada, max_tokens, o limite de tokens de
+    pensamento, o nome do modelo e os parâmetros de decodificação. Thread-safe.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl_s: float = 3600.0):
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self._lock = threading.Lock()
+        self._entradas: "OrderedDict[Tuple, Tuple[float, Dict]]" = OrderedDict()
+        self.acertos = 0
+        self.falhas = 0
+        self.remocoes_lru = 0
+        self.expiradas = 0
+
+    @staticmethod
+    def chave(pergunta: str, max_tokens: int, model_name: str, sampling: SamplingParams,
+              max_thinking_tokens: Optional[int] = None) -> Tuple:
+        return (normalizar_pergunta(pergunta), max_tokens, max_thinking_tokens, model_name,
+                chave_decodificacao(sampling))
+
+    @staticmethod
+    def pode_armazenar(sampling: SamplingParams, permitir_amostragem: Optional[bool]) -> bool:
+        """
+        Decide se a requisição usa o cache
+
+        Requisições gulosas são cacheáveis por padrão; as com amostragem só
+        quando o cliente pede explicitamente. False desativa o cache.
+        """
+        if permitir_amostragem is False:
+            return False
+        return not sampling.do_sample or permitir_amostragem is True
+
+    def get(self, chave: Tuple) -> Optional[Dict]:
+        with self._lock:
+            entrada = self._entradas.get(chave)
+            if entrada is None:
+                self.falhas += 1
+                return None
+            criado_em, valor = entrada
+            if time.monotonic() - criado_em > self.ttl_s:
+                del self._entradas[chave]
+                self.expiradas += 1
+                self.falhas += 1
+                return None
+            self._entradas.move_to_end(chave)
+            self.acertos += 1
+            return dict(valor)
+
+    def put(self, chave: Tuple, valor: Dict):
+        with self._lock:
+            self._entradas[chave] = (time.monotonic(), dict(valor))
+            self._entradas.move_to_end(chave)
+            while len(self._entradas) > self.max_entries:
+                self._entradas.popitem(last=False)
+                self.remocoes_lru += 1
+
+    def clear(self):
+        with self._lock:
+            self._entradas.clear()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            total = self.acertos + self.falhas
+            return {
+                "entradas": len(self._entradas),
+                "limite": self.max_entries,
+                "ttl_s": self.ttl_s,
+                "acertos": self.acertos,
+                "falhas": self.falhas,
+                "taxa_acerto": round(self.acertos / total, 4) if total else 0.0,
+                "remocoes_lru": self.remocoes_lru,
+                "expiradas": self.expiradas,
+            }
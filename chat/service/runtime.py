@@ -0,0 +1,213 @@
+"""
+Configuração de threads e núcleos da inferência em CPU
+
+Detecta quantas CPUs o processo pode usar de fato (afinidade e cota do
+cgroup, ex.: limite de CPUs do container), divide os núcleos entre os
+workers e configura os pools de threads do PyTorch de cada um.
+
+Uso para medir tokens/s com diferentes números de threads (rodar a partir da pasta chat/):
+    python -m service.runtime --autotune
+"""
+import argparse
+import json
+import math
+import os
+import time
+from typing import Dict, List, Optional
+
+# Layout aplicado neste processo (exposto em /modelo)
+_layout: Optional[Dict] = None
+
+
+def cota_cgroup(raiz: str = "/sys/fs/cgroup") -> Optional[float]:
+    """
+    CPUs permitidas pela cota do cgroup (v2 cpu.max ou v1 cfs_quota_us)
+
+    Returns:
+        Número de CPUs (pode ser fracionário) ou None se não houver limite
+    """
+    try:
+        with open(os.path.join(raiz, "cpu.max")) as arquivo:
+            cota, periodo = arquivo.read().split()[:2]
+        if cota == "max":
+            return None
+        return int(cota) / int(periodo)
+    except (OSError, ValueError):
+        pass
+
+    try:
+        with open(os.path.join(raiz, "cpu", "cpu.cfs_quota_us")) as arquivo:
+            cota = int(arquivo.read())
+        with open(os.path.join(raiz, "cpu", "cpu.cfs_period_us")) as arquivo:
+            periodo = int(arquivo.read())
+    except (OSError, ValueError):
+        return None
+    if cota <= 0 or periodo <= 0:
+        return None
+    return cota / periodo
+
+
+def cpus_permitidas() -> List[int]:
+    """Núcleos em que o processo pode rodar (afinidade atual)"""
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def cpus_efetivas(cpus: Optional[List[int]] = None, cota: Optional[float] = None) -> int:
+    """Quantas CPUs dá para usar ao mesmo tempo: o menor entre afinidade e cota"""
+    cpus = cpus if cpus is not None else cpus_permitidas()
+    efetivas = len(cpus)
+    if cota is not None:
+        efetivas = min(efetivas, max(1, math.floor(cota)))
+    return efetivas
+
+
+def planejar(workers: int = 1, indice: int = 0, cpus: Optional[List[int]] = None,
+             cota: Optional[float] = None, intra: Optional[int] = None,
+             interop: int = 1, fixar: bool = False) -> Dict:
+    """
+    Calcula o layout de um worker sem aplicá-lo
+
+    As CPUs efetivas são divididas igualmente entre os workers; cada worker
+    usa uma thread intra-op por núcleo da sua fatia. Com fixar=True o
+    worker é preso aos núcleos da fatia, disjuntos dos demais workers.
+
+    Args:
+        workers: Número de processos de inferência na máquina
+        indice: Índice deste worker (0..workers-1)
+        cpus: Núcleos permitidos (padrão: afinidade atual)
+        cota: CPUs da cota do cgroup (padrão: detectada)
+        intra: Força o número de threads intra-op
+        interop: Threads inter-op
+        fixar: Prende o worker aos seus núcleos
+
+    Returns:
+        Dict com cpus, cota, cpus_efetivas, nucleos, intra_op, inter_op e fixado
+    """
+    cpus = cpus if cpus is not None else cpus_permitidas()
+    efetivas = cpus_efetivas(cpus, cota)
+    por_worker = max(1, efetivas // max(1, workers))
+    inicio = (indice * por_worker) % max(1, len(cpus))
+    nucleos = cpus[inicio:inicio + por_worker] or cpus[:por_worker]
+    return {
+        "worker": indice,
+        "workers": workers,
+        "cpus_permitidas": len(cpus),
+        "cota_cgroup": cota,
+        "cpus_efetivas": efetivas,
+        "nucleos": nucleos if fixar else None,
+        "intra_op": intra or por_worker,
+        "inter_op": interop,
+        "fixado": fixar,
+    }
+
+
+def configurar(workers: int = 1, indice: int = 0) -> Dict:
+    """
+    Aplica o layout deste processo a partir das variáveis de ambiente
+
+    Deve rodar cedo, antes do modelo ser usado: o número de threads
+    inter-op só pode ser definido antes do primeiro uso do pool, e a
+    afinidade é herdada apenas pelas threads criadas depois. Chamadas
+    repetidas retornam o layout já aplicado.
+    """
+    global _layout
+    if _layout is not None:
+        return _layout
+
+    import torch
+
+    intra = int(os.getenv("LLM_INTRA_THREADS", "0")) or None
+    layout = planejar(
+        workers=workers,
+        indice=indice,
+        cota=cota_cgroup(),
+        intra=intra,
+        interop=int(os.getenv("LLM_INTEROP_THREADS", "1")),
+        fixar=os.getenv("LLM_PIN_CORES", "0") == "1",
+    )
+
+    if layout["nucleos"] and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, layout["nucleos"])
+    torch.set_num_threads(layout["intra_op"])
+    try:
+        torch.set_num_interop_threads(layout["inter_op"])
+    except RuntimeError:
+        # O pool inter-op já foi iniciado; mantém o valor atual
+        layout["inter_op"] = torch.get_num_interop_threads()
+
+    _layout = layout
+    print(f"Runtime: {layout['intra_op']} threads intra-op, {layout['inter_op']} inter-op"
+          + (f", núcleos {layout['nucleos']}" if layout["nucleos"] else ""))
+    return layout
+
+
+def layout() -> Dict:
+    """Layout efetivo deste processo, com os valores atuais do PyTorch"""
+    import torch
+
+    atual = dict(_layout or planejar())
+    atual["intra_op_atual"] = torch.get_num_threads()
+    atual["inter_op_atual"] = torch.get_num_interop_threads()
+    return atual
+
+
+def autotune(llm, contagens: Optional[List[int]] = None, max_tokens: int = 32,
+             prompt: str = "Explique em duas frases o que é uma CPU.") -> Dict:
+    """
+    Mede tokens/s com diferentes números de threads intra-op e recomenda o melhor
+
+    Usa decodificação gulosa, então todas as medições geram o mesmo texto
+    e fazem o mesmo trabalho. O número original de threads é restaurado
+    ao final.
+    """
+    import torch
+
+    efetivas = cpus_efetivas(cota=cota_cgroup())
+    if contagens is None:
+        contagens = sorted({1, 2, 4, 8, 16, efetivas} & set(range(1, efetivas + 1)))
+
+    original = torch.get_num_threads()
+    greedy = llm.sampling_padrao(do_sample=False)
+    model_inputs = llm._preparar_inputs(prompt)
+    # Aquece alocador e pools antes da primeira medição
+    llm._gerar(model_inputs, 4, greedy)
+
+    medicoes = {}
+    try:
+        for threads in contagens:
+            torch.set_num_threads(threads)
+            inicio = time.perf_counter()
+            ids = llm._gerar(model_inputs, max_tokens, greedy)
+            duracao = time.perf_counter() - inicio
+            medicoes[threads] = round(len(ids) / duracao, 2) if duracao > 0 else 0.0
+            print(f"{threads} threads: {medicoes[threads]} tokens/s")
+    finally:
+        torch.set_num_threads(original)
+
+    melhor = max(medicoes, key=medicoes.get)
+    return {
+        "cpus_efetivas": efetivas,
+        "tokens_por_s": medicoes,
+        "recomendado": melhor,
+        "sugestao": f"LLM_INTRA_THREADS={melhor}",
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Layout de threads e autotune da inferência")
+    parser.add_argument("--modelo", default="Qwen/Qwen3-0.6B")
+    parser.add_argument("--autotune", action="store_true", help="Mede tokens/s para cada número de threads")
+    parser.add_argument("--threads", type=int, nargs="+", help="Números de threads a medir")
+    parser.add_argument("--max-tokens", type=int, default=32)
+    args = parser.parse_args()
+
+    if args.autotune:
+        from service.llm import LLMService
+
+        llm = LLMService(args.modelo, continuous_batching=False)
+        resultado = autotune(llm, args.threads, args.max_tokens)
+    else:
+        resultado = planejar(cota=cota_cgroup())
+    print(json.dumps(resultado, indent=2, ensure_ascii=False))
@@ -0,0 +1,137 @@
+from dataclasses import dataclass, asdict
+from typing import Dict, Iterable, Optional
+
+import torch
+
+
+@dataclass
+class SamplingParams:
+    """Parâmetros de decodificação de uma requisição"""
+
+    do_sample: bool = False
+    temperature: float = 1.0
+    top_p: float = 1.0
+    top_k: int = 0
+    repetition_penalty: float = 1.0
+
+    @classmethod
+    def from_generation_config(cls, config, **overrides) -> "SamplingParams":
+        """
+        Cria os parâmetros a partir do generation_config do modelo
+
+        Args:
+            config: GenerationConfig do modelo (pode ser None)
+            **overrides: Valores que substituem os do modelo
+
+        Returns:
+            SamplingParams com os padrões do modelo e as substituições aplicadas
+        """
+        params = cls()
+        if config is not None:
+            params.do_sample = bool(getattr(config, "do_sample", False) or False)
+            params.temperature = float(getattr(config, "temperature", None) or 1.0)
+            params.top_p = float(getattr(config, "top_p", None) or 1.0)
+            params.top_k = int(getattr(config, "top_k", None) or 0)
+            params.repetition_penalty = float(getattr(config, "repetition_penalty", None) or 1.0)
+        for chave, valor in overrides.items():
+            setattr(params, chave, valor)
+        return params
+
+    def to_generate_kwargs(self) -> Dict:
+        """Converte para os argumentos aceitos por model.generate"""
+        kwargs = {
+            "do_sample": self.do_sample,
+            "repetition_penalty": self.repetition_penalty,
+        }
+        if self.do_sample:
+            kwargs.update(
+                temperature=self.temperature,
+                top_p=self.top_p,
+                top_k=self.top_k,
+            )
+        return kwargs
+
+    def as_dict(self) -> Dict:
+        return asdict(self)
+
+
+def processar_logits(
+    logits: torch.Tensor,
+    params: SamplingParams,
+    contexto_ids: Iterable[int],
+) -> torch.Tensor:
+    """
+    Aplica os processadores de logits de uma única sequência
+
+    Segue a mesma ordem do model.generate: penalidade de repetição,
+    temperatura, top-k e top-p. Em modo guloso só a penalidade é aplicada.
+
+    Args:
+        logits: Logits do último passo, formato (vocab,)
+        params: Parâmetros de decodificação da requisição
+        contexto_ids: Tokens já vistos (prompt + gerados) para a penalidade
+
+    Returns:
+        Scores processados (tokens descartados ficam com -inf)
+    """
+    scores = logits.float()
+
+    if params.repetition_penalty != 1.0:
+        ids = torch.tensor(sorted(set(contexto_ids)), dtype=torch.long, device=scores.device)
+        if ids.numel() > 0:
+            selecionados = scores.index_select(0, ids)
+            selecionados = torch.where(
+                selecionados < 0,
+                selecionados * params.repetition_penalty,
+                selecionados / params.repetition_penalty,
+            )
+            scores = scores.index_copy(0, ids, selecionados)
+
+    if not params.do_sample:
+        return scores
+
+    if params.temperature and params.temperature != 1.0:
+        scores = scores / params.temperature
+
+    if params.top_k and params.top_k > 0:
+        k = min(params.top_k, scores.numel())
+        limite = torch.topk(scores, k).values[-1]
+        scores = scores.masked_fill(scores < limite, float("-inf"))
+
+    if params.top_p < 1.0:
+        ordenados, indices = torch.sort(scores, descending=True)
+        acumulado = torch.softmax(ordenados, dim=-1).cumsum(dim=-1)
+        remover = acumulado > params.top_p
+        # Mantém sempre o primeiro token que ultrapassa o limite
+        remover[1:] = remover[:-1].clone()
+        remover[0] = False
+        scores = scores.masked_fill(
+            torch.zeros_like(remover).scatter(0, indices, remover), float("-inf")
+        )
+
+    return scores
+
+
+def escolher_proximo_token(
+    logits: torch.Tensor,
+    params: SamplingParams,
+    contexto_ids: Iterable[int],
+    generator: Optional[torch.Generator] = None,
+) -> int:
+    """
+    Escolhe o próximo token para uma única sequência
+
+    Args:
+        logits: Logits do último passo, formato (vocab,)
+        params: Parâmetros de decodificação da requisição
+        contexto_ids: Tokens já vistos (prompt + gerados) para a penalidade
+        generator: Gerador aleatório opcional
+
+    Returns:
+        ID do token escolhido
+    """
+    scores = processar_logits(logits, params, contexto_ids)
+    if not params.do_sample:
+        return int(torch.argmax(scores).item())
+    probs = torch.softmax(scores, dim=-1)
+    return int(torch.multinomial(probs, num_samples=1, generator=generator).item())
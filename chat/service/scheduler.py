@@ -0,0 +1,125 @@
+"""
+Ordem de execução das tarefas na fila do executor de inferência
+
+Em vez de FIFO, cada tarefa recebe uma pontuação (menor sai primeiro):
+
+    deslocamento da classe + custo estimado + penalidade do cliente - envelhecimento
+
+- classe: interactive (streaming) < standard (/pergunta) < batch (/perguntas-lote)
+- custo: tokens do prompt + limite de tokens novos (shortest job first)
+- cliente: cada tarefa do mesmo cliente (ou chat) em execução ou à frente na
+  fila soma uma penalidade, para que um cliente não monopolize os workers
+- envelhecimento: a pontuação cai com o tempo de espera, então nenhuma
+  tarefa fica na fila para sempre atrás de tarefas mais baratas
+"""
+import itertools
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+
+CLASSES = ("interactive", "standard", "batch")
+
+# Deslocamento de cada classe, em tokens equivalentes
+DESLOCAMENTOS = {"interactive": 0, "standard": 128, "batch": 1024}
+
+
+@dataclass
+class Agendamento:
+    """Como uma tarefa deve ser ordenada na fila"""
+
+    classe: str = "standard"
+    custo: int = 0  # tokens do prompt + limite de tokens novos
+    cliente: Optional[str] = None  # None = sem justiça entre clientes
+
+    def __post_init__(self):
+        if self.classe not in DESLOCAMENTOS:
+            raise ValueError(f"Classe de prioridade inválida: {self.classe}. Opções: {', '.join(CLASSES)}")
+
+
+@dataclass(eq=False)
+class _Entrada:
+    tarefa: Optional[Callable]
+    agendamento: Agendamento
+    chegada: float
+    ordem: float  # ordem de chegada
+
+
+class FilaAgendada:
+    """
+    Fila de tarefas ordenada por classe, custo, cliente e tempo de espera
+
+    Não é thread-safe: o executor a usa sempre sob o próprio lock. Guarda
+    também quantas tarefas de cada cliente estão em execução.
+    """
+
+    def __init__(self, envelhecimento: float = 32.0, penalidade_cliente: float = 256.0,
+                 relogio: Callable[[], float] = time.monotonic):
+        """
+        Args:
+            envelhecimento: Tokens descontados da pontuação por segundo de espera
+            penalidade_cliente: Tokens somados por tarefa do mesmo cliente
+                em execução ou à frente na fila
+            relogio: Fonte de tempo (substituível nos testes)
+        """
+        self.envelhecimento = envelhecimento
+        self.penalidade_cliente = penalidade_cliente
+        self.relogio = relogio
+        self._entradas: List[_Entrada] = []
+        self._sequencia = itertools.count()
+        self.em_execucao: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._entradas)
+
+    def _pontuacoes(self, entradas: List[_Entrada]) -> List[float]:
+        agora = self.relogio()
+        a_frente: Dict[str, int] = {}
+        pontuacoes: Dict[int, float] = {}
+        # Em ordem de chegada, para contar as tarefas do cliente que chegaram antes
+        for entrada in sorted(entradas, key=lambda e: e.ordem):
+            ag = entrada.agendamento
+            pontuacao = DESLOCAMENTOS[ag.classe] + ag.custo - self.envelhecimento * (agora - entrada.chegada)
+            if ag.cliente is not None:
+                anteriores = self.em_execucao.get(ag.cliente, 0) + a_frente.get(ag.cliente, 0)
+                pontuacao += self.penalidade_cliente * anteriores
+                a_frente[ag.cliente] = a_frente.get(ag.cliente, 0) + 1
+            pontuacoes[id(entrada)] = pontuacao
+        return [pontuacoes[id(e)] for e in entradas]
+
+    def _ordenadas(self, entradas: List[_Entrada]) -> List[_Entrada]:
+        pontuacoes = self._pontuacoes(entradas)
+        return [e for _, e in sorted(zip(pontuacoes, entradas), key=lambda par: (par[0], par[1].ordem))]
+
+    def posicao(self, agendamento: Agendamento) -> int:
+        """Quantas tarefas da fila sairiam antes de uma nova tarefa com este agendamento"""
+        nova = _Entrada(None, agendamento, self.relogio(), ordem=float("inf"))
+        return self._ordenadas(self._entradas + [nova]).index(nova)
+
+    def adicionar(self, tarefa: Callable, agendamento: Agendamento):
+        self._entradas.append(_Entrada(tarefa, agendamento, self.relogio(), ordem=next(self._sequencia)))
+
+    def retirar(self) -> Tuple[Callable, Agendamento]:
+        """Remove a tarefa de menor pontuação e a conta como em execução"""
+        entrada = self._ordenadas(self._entradas)[0]
+        self._entradas.remove(entrada)
+        cliente = entrada.agendamento.cliente
+        if cliente is not None:
+            self.em_execucao[cliente] = self.em_execucao.get(cliente, 0) + 1
+        return entrada.tarefa, entrada.agendamento
+
+    def liberar(self, agendamento: Agendamento):
+        """Uma tarefa retirada terminou"""
+        cliente = agendamento.cliente
+        if cliente is None:
+            return
+        restantes = self.em_execucao.get(cliente, 0) - 1
+        if restantes > 0:
+            self.em_execucao[cliente] = restantes
+        else:
+            self.em_execucao.pop(cliente, None)
+
+    def por_classe(self) -> Dict[str, int]:
+        contagem = {classe: 0 for classe in CLASSES}
+        for entrada in self._entradas:
+            contagem[entrada.agendamento.classe] += 1
+        return contagem
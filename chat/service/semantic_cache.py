@@ -0,0 +1,201 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Optional
+
+import numpy as np
+
+
+class SemanticCache:
+    """
+    Cache semântico de respostas com índice vetorial em NumPy
+
+    Cada pergunta é representada por um embedding normalizado (norma L2 = 1);
+    a busca é um produto escalar contra todos os vetores armazenados
+    (similaridade de cosseno). Um acerto exige similaridade >= threshold e o
+    mesmo escopo (modelo, max_tokens e parâmetros de decodificação).
+
+    A memória é limitada a `capacidade` vetores pré-alocados; quando cheio, o
+    vetor acessado há mais tempo é substituído (LRU). Os acertos recentes
+    ficam registrados para auditoria de falsos acertos.
+    """
+
+    def __init__(self, dim: int, capacidade: int = 2048, threshold: float = 0.92,
+                 caminho: Optional[str] = None, salvar_a_cada: int = 50,
+                 tamanho_auditoria: int = 200):
+        self.dim = dim
+        self.capacidade = capacidade
+        self.threshold = threshold
+        self.caminho = caminho
+        self.salvar_a_cada = salvar_a_cada
+
+        self._lock = threading.Lock()
+        self._vetores = np.zeros((capacidade, dim), dtype=np.float32)
+        self._valido = np.zeros(capacidade, dtype=bool)
+        self._ultimo_acesso = np.zeros(capacidade, dtype=np.float64)
+        self._escopo = np.full(capacidade, -1, dtype=np.int32)
+        self._ids_escopo: Dict[str, int] = {}
+        self._entradas: List[Optional[Dict]] = [None] * capacidade
+        self._proximo_id = 1
+        self._insercoes_pendentes = 0
+
+        self.acertos = 0
+        self.falhas = 0
+        self.remocoes = 0
+        self.falsos_acertos = 0
+        self.auditoria = deque(maxlen=tamanho_auditoria)
+
+        if caminho and os.path.exists(caminho):
+            self.carregar(caminho)
+
+    # Busca e inserção
+
+    def buscar(self, vetor: np.ndarray, escopo: str, pergunta: str = "") -> Optional[Dict]:
+        """Retorna a resposta armazenada mais parecida, ou None abaixo do threshold"""
+        vetor = self._normalizar(vetor)
+        with self._lock:
+            if not self._valido.any():
+                self.falhas += 1
+                return None
+
+            escopo_id = self._ids_escopo.get(escopo)
+            if escopo_id is None:
+                self.falhas += 1
+                return None
+
+            similaridades = self._vetores @ vetor
+            candidatos = self._valido & (self._escopo == escopo_id)
+            similaridades = np.where(candidatos, similaridades, -np.inf)
+            indice = int(np.argmax(similaridades))
+            similaridade = float(similaridades[indice])
+
+            if similaridade < self.threshold:
+                self.falhas += 1
+                return None
+
+            entrada = self._entradas[indice]
+            self._ultimo_acesso[indice] = time.time()
+            self.acertos += 1
+            self.auditoria.append({
+                "id": entrada["id"],
+                "pergunta": pergunta,
+                "pergunta_em_cache": entrada["pergunta"],
+                "similaridade": round(similaridade, 4),
+                "quando": time.time(),
+            })
+            return dict(entrada["resultado"], similaridade=similaridade)
+
+    def adicionar(self, vetor: np.ndarray, pergunta: str, resultado: Dict[str, str], escopo: str):
+        """Armazena uma resposta, substituindo a entrada LRU se o índice estiver cheio"""
+        vetor = self._normalizar(vetor)
+        with self._lock:
+            livres = np.flatnonzero(~self._valido)
+            if livres.size:
+                indice = int(livres[0])
+            else:
+                indice = int(np.argmin(self._ultimo_acesso))
+                self.remocoes += 1
+
+            self._vetores[indice] = vetor
+            self._valido[indice] = True
+            self._ultimo_acesso[indice] = time.time()
+            self._escopo[indice] = self._id_escopo(escopo)
+            self._entradas[indice] = {
+                "id": self._proximo_id,
+                "pergunta": pergunta,
+                "escopo": escopo,
+                "resultado": {"thinking": resultado.get("thinking", ""), "response": resultado.get("response", "")},
+            }
+            self._proximo_id += 1
+            self._insercoes_pendentes += 1
+            salvar = self.caminho and self._insercoes_pendentes >= self.salvar_a_cada
+
+        if salvar:
+            self.salvar()
+
+    def marcar_falso_acerto(self, entrada_id: int) -> bool:
+        """Remove uma entrada apontada como falso acerto na auditoria"""
+        with self._lock:
+            for indice, entrada in enumerate(self._entradas):
+                if entrada is not None and entrada["id"] == entrada_id:
+                    self._valido[indice] = False
+                    self._entradas[indice] = None
+                    self.falsos_acertos += 1
+                    return True
+            return False
+
+    def _id_escopo(self, escopo: str) -> int:
+        if escopo not in self._ids_escopo:
+            self._ids_escopo[escopo] = len(self._ids_escopo)
+        return self._ids_escopo[escopo]
+
+    def _normalizar(self, vetor: np.ndarray) -> np.ndarray:
+        vetor = np.asarray(vetor, dtype=np.float32).reshape(-1)
+        if vetor.shape[0] != self.dim:
+            raise ValueError(f"Embedding com dimensão {vetor.shape[0]}, esperado {self.dim}")
+        norma = np.linalg.norm(vetor)
+        return vetor / norma if norma > 0 else vetor
+
+    # Persistência
+
+    def salvar(self, caminho: Optional[str] = None):
+        """Grava o índice em disco (escrita atômica)"""
+        caminho = caminho or self.caminho
+        if not caminho:
+            return
+        with self._lock:
+            metadados = json.dumps({
+                "dim": self.dim,
+                "proximo_id": self._proximo_id,
+                "entradas": self._entradas,
+            }, ensure_ascii=False)
+            if os.path.dirname(caminho):
+                os.makedirs(os.path.dirname(caminho), exist_ok=True)
+            temporario = caminho + ".tmp.npz"
+            np.savez(
+                temporario,
+                vetores=self._vetores,
+                valido=self._valido,
+                ultimo_acesso=self._ultimo_acesso,
+                metadados=np.array(metadados),
+            )
+            os.replace(temporario, caminho)
+            self._insercoes_pendentes = 0
+
+    def carregar(self, caminho: str):
+        """Carrega um índice salvo; entradas além da capacidade atual são descartadas"""
+        with np.load(caminho, allow_pickle=False) as dados:
+            metadados = json.loads(str(dados["metadados"]))
+            if metadados["dim"] != self.dim:
+                print(f"Cache semântico ignorado: dimensão {metadados['dim']} != {self.dim}")
+                return
+            n = min(self.capacidade, dados["vetores"].shape[0])
+            with self._lock:
+                self._vetores[:n] = dados["vetores"][:n]
+                self._valido[:n] = dados["valido"][:n]
+                self._ultimo_acesso[:n] = dados["ultimo_acesso"][:n]
+                self._entradas[:n] = metadados["entradas"][:n]
+                self._proximo_id = metadados["proximo_id"]
+                for indice, entrada in enumerate(self._entradas[:n]):
+                    if entrada is None:
+                        self._valido[indice] = False
+                    else:
+                        self._escopo[indice] = self._id_escopo(entrada["escopo"])
+        print(f"Cache semântico carregado de {caminho} ({int(self._valido.sum())} entradas)")
+
+    def stats(self) -> Dict:
+        with self._lock:
+            total = self.acertos + self.falhas
+            return {
+                "entradas": int(self._valido.sum()),
+                "capacidade": self.capacidade,
+                "threshold": self.threshold,
+                "memoria_bytes": int(self._vetores.nbytes),
+                "acertos": self.acertos,
+                "falhas": self.falhas,
+                "taxa_acerto": round(self.acertos / total, 4) if total else 0.0,
+                "remocoes": self.remocoes,
+                "falsos_acertos": self.falsos_acertos,
+            }
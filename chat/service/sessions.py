@@ -0,0 +1,143 @@
+"""
+Cache KV das conversas (sessões) com orçamento de memória
+
+Cada sessão guarda os tokens do último prompt enviado (prompt de sistema,
+turnos anteriores e a pergunta) e o cache KV correspondente. No turno
+seguinte o prompt começa com os mesmos tokens, então só a parte nova (a
+resposta anterior e a nova pergunta) passa pelo prefill.
+
+As sessões mais antigas (LRU) são descartadas quando a memória passa do
+limite. Uma sessão descartada (ou que nunca esteve neste processo) é
+reconstruída a partir do histórico que o cliente envia junto com a pergunta.
+"""
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence, Tuple
+
+
+class _Sessao:
+    def __init__(self, ids: List[int], camadas, tamanho_bytes: int):
+        self.ids = ids
+        self.camadas = camadas
+        self.tamanho_bytes = tamanho_bytes
+
+
+def prefixo_comum(a: Sequence[int], b: Sequence[int]) -> int:
+    """Número de tokens iniciais iguais nas duas sequências"""
+    comprimento = 0
+    for x, y in zip(a, b):
+        if x != y:
+            break
+        comprimento += 1
+    return comprimento
+
+
+def cortar_camadas(camadas, comprimento: int):
+    """
+    Mantém só as primeiras `comprimento` posições de cada (key, value)
+
+    Os cortes são copiados (contiguous): uma fatia continuaria presa à
+    memória do cache inteiro, que o orçamento da sessão não contaria.
+    """
+    return [(k[:, :, :comprimento, :].contiguous(), v[:, :, :comprimento, :].contiguous())
+            for k, v in camadas]
+
+
+class SessionStore:
+    """
+    Sessões com cache KV, limitadas por memória e removidas por LRU (thread-safe)
+
+    O cache de uma sessão é somente leitura: quem o usa monta um cache novo
+    a partir dos tensores, que nunca são alterados no lugar.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._sessoes: "OrderedDict[str, _Sessao]" = OrderedDict()
+        self.bytes_usados = 0
+        self.acertos = 0
+        self.acertos_parciais = 0
+        self.falhas = 0
+        self.removidas = 0
+        self.tokens_reaproveitados = 0
+
+    def buscar(self, sessao_id: str, input_ids: Sequence[int]) -> Optional[Tuple[List[int], object]]:
+        """
+        Maior prefixo de input_ids que já está no cache da sessão
+
+        Sempre sobra ao menos um token de input_ids para o prefill. Se o
+        prompt divergiu no meio (ex.: turnos antigos cortados do histórico),
+        o cache é cortado no ponto da divergência.
+
+        Returns:
+            (ids do prefixo, camadas KV) ou None se a sessão não existe ou nada casa
+        """
+        with self._lock:
+            sessao = self._sessoes.get(sessao_id)
+            if sessao is None:
+                self.falhas += 1
+                return None
+            comprimento = min(prefixo_comum(sessao.ids, input_ids), len(input_ids) - 1)
+            if comprimento <= 0:
+                self.falhas += 1
+                return None
+            self._sessoes.move_to_end(sessao_id)
+            self.tokens_reaproveitados += comprimento
+            if comprimento == len(sessao.ids):
+                self.acertos += 1
+                return sessao.ids, sessao.camadas
+            self.acertos_parciais += 1
+            return list(sessao.ids[:comprimento]), cortar_camadas(sessao.camadas, comprimento)
+
+    def guardar(self, sessao_id: str, ids: List[int], camadas, tamanho_bytes: int) -> bool:
+        """
+        Guarda (ou substitui) o cache da sessão e remove as mais antigas se faltar memória
+
+        Returns:
+            False se o cache sozinho não cabe no limite (a sessão é descartada)
+        """
+        with self._lock:
+            self._remover(sessao_id)
+            if tamanho_bytes > self.max_bytes:
+                return False
+            self._sessoes[sessao_id] = _Sessao(list(ids), camadas, tamanho_bytes)
+            self.bytes_usados += tamanho_bytes
+            while self.bytes_usados > self.max_bytes:
+                antiga, _ = next(iter(self._sessoes.items()))
+                self._remover(antiga)
+                self.removidas += 1
+            return True
+
+    def remover(self, sessao_id: str) -> bool:
+        """Descarta a sessão (ex.: o chat foi apagado)"""
+        with self._lock:
+            return self._remover(sessao_id)
+
+    def _remover(self, sessao_id: str) -> bool:
+        sessao = self._sessoes.pop(sessao_id, None)
+        if sessao is None:
+            return False
+        self.bytes_usados -= sessao.tamanho_bytes
+        return True
+
+    def limpar(self):
+        """Descarta todas as sessões (ex.: ao recarregar o modelo)"""
+        with self._lock:
+            self._sessoes.clear()
+            self.bytes_usados = 0
+
+    def stats(self) -> Dict:
+        with self._lock:
+            buscas = self.acertos + self.acertos_parciais + self.falhas
+            return {
+                "sessoes": len(self._sessoes),
+                "memoria_mb": round(self.bytes_usados / 2**20, 1),
+                "limite_mb": round(self.max_bytes / 2**20, 1),
+                "acertos": self.acertos,
+                "acertos_parciais": self.acertos_parciais,
+                "falhas": self.falhas,
+                "taxa_acerto": round((self.acertos + self.acertos_parciais) / buscas, 3) if buscas else None,
+                "tokens_reaproveitados": self.tokens_reaproveitados,
+                "removidas": self.removidas,
+            }
@@ -0,0 +1,202 @@
+from typing import Dict, List, Optional, Sequence
+
+import torch
+
+from service.kv_cache import cortar_cache
+from service.sampling import SamplingParams, processar_logits
+
+
+class IndiceNgram:
+    """
+    Índice incremental de n-gramas para propor continuações (prompt lookup)
+
+    Para cada n-grama já visto guarda a posição mais recente em que ele
+    apareceu seguido de pelo menos um token. A proposta é a continuação da
+    ocorrência anterior do sufixo atual, procurando do maior n para o menor.
+    """
+
+    def __init__(self, ids: Sequence[int], n_max: int = 3, n_min: int = 1):
+        self.n_max = n_max
+        self.n_min = n_min
+        self.ids: List[int] = []
+        self._posicoes = [dict() for _ in range(n_max + 1)]
+        for token in ids:
+            self.adicionar(token)
+
+    def adicionar(self, token: int):
+        self.ids.append(token)
+        fim = len(self.ids) - 1  # o n-grama termina antes do token recém-chegado
+        for n in range(self.n_min, self.n_max + 1):
+            if fim - n >= 0:
+                self._posicoes[n][tuple(self.ids[fim - n:fim])] = fim - n
+
+    def propor(self, k: int) -> List[int]:
+        """Retorna até k tokens de continuação, ou lista vazia se não houver casamento"""
+        if k <= 0:
+            return []
+        for n in range(self.n_max, self.n_min - 1, -1):
+            if len(self.ids) < n:
+                continue
+            inicio = self._posicoes[n].get(tuple(self.ids[-n:]))
+            if inicio is not None:
+                return self.ids[inicio + n:inicio + n + k]
+        return []
+
+
+def gerar_com_prompt_lookup(
+    model,
+    input_ids: List[int],
+    max_new_tokens: int,
+    sampling: SamplingParams,
+    eos_token_ids: Sequence[int],
+    streamer=None,
+    past_key_values=None,
+    num_tokens_propostos: int = 10,
+    stats: Optional[Dict] = None,
+    cancelamento=None,
+    orcamento=None,
+) -> List[int]:
+    """
+    Decodificação especulativa sem modelo de rascunho
+
+    A cada passo propõe uma continuação copiada de n-gramas do prompt ou do
+    texto já gerado e verifica todos os tokens propostos em uma única
+    passada do modelo. Em modo guloso um token é aceito se for o argmax; com
+    amostragem usa a regra de aceitação da amostragem especulativa (aceita
+    com probabilidade p(token) e, na rejeição, amostra de p sem o token),
+    o que preserva a distribuição de saída.
+
+    Args:
+        model: Modelo causal do transformers
+        input_ids: Tokens do prompt
+        max_new_tokens: Limite de tokens novos
+        sampling: Parâmetros de decodificação
+        eos_token_ids: Tokens que encerram a geração
+        streamer: Streamer opcional (mesmo contrato do model.generate)
+        past_key_values: Cache de um prefixo do prompt (ex.: prompt de sistema)
+        num_tokens_propostos: Máximo de tokens propostos por passo
+        stats: Dict preenchido com propostos/aceitos/passos/taxa_aceitacao
+        cancelamento: CancellationToken consultado a cada passo
+        orcamento: OrcamentoPensamento; o </think> forçado substitui a
+            verificação na posição em que o pensamento esgota o limite
+
+    Returns:
+        Apenas os IDs dos tokens novos
+    """
+    eos = set(eos_token_ids)
+    device = model.device
+    indice = IndiceNgram(input_ids)
+    gerados: List[int] = []
+    propostos = aceitos = passos = 0
+
+    if streamer is not None:
+        streamer.put(torch.tensor([input_ids]))
+
+    def emitir(token: int) -> bool:
+        """Registra um token aceito; retorna True se a geração deve parar"""
+        gerados.append(token)
+        indice.adicionar(token)
+        if streamer is not None:
+            streamer.put(torch.tensor([token]))
+        if orcamento is not None:
+            orcamento.registrar(token)
+            if orcamento.resposta_esgotada:
+                return True
+        return token in eos or len(gerados) >= max_new_tokens
+
+    def forcado() -> Optional[int]:
+        return orcamento.token_forcado() if orcamento is not None else None
+
+    try:
+        with torch.no_grad():
+            # Prefill do que ainda não está no cache
+            ja_em_cache = past_key_values.get_seq_length() if past_key_values is not None else 0
+            saida = model(
+                input_ids=torch.tensor([input_ids[ja_em_cache:]], device=device),
+                past_key_values=past_key_values,
+                use_cache=True,
+            )
+            cache = saida.past_key_values
+            primeiro = forcado()
+            if primeiro is None:
+                primeiro = _amostrar(processar_logits(saida.logits[0, -1], sampling, indice.ids), sampling)
+            terminou = max_new_tokens <= 0 or emitir(primeiro)
+
+            while not terminou:
+                if cancelamento is not None and cancelamento.cancelado:
+                    break
+                # O último token emitido ainda não passou pelo modelo
+                pendente = gerados[-1]
+                rascunho = indice.propor(min(num_tokens_propostos, max_new_tokens - len(gerados) - 1))
+                propostos += len(rascunho)
+                passos += 1
+
+                tamanho_confirmado = len(indice.ids) - 1
+                saida = model(
+                    input_ids=torch.tensor([[pendente] + rascunho], device=device),
+                    past_key_values=cache,
+                    use_cache=True,
+                )
+                cache = saida.past_key_values
+                logits = saida.logits[0]
+
+                aceitos_passo = 0
+                for posicao, proposto in enumerate(rascunho):
+                    escolhido = forcado()
+                    if escolhido is None:
+                        scores = processar_logits(logits[posicao], sampling, indice.ids)
+                        escolhido = _verificar(scores, sampling, proposto)
+                    if escolhido != proposto:
+                        terminou = emitir(escolhido)
+                        break
+                    aceitos_passo += 1
+                    terminou = emitir(proposto)
+                    if terminou:
+                        break
+                else:
+                    # Todos aceitos: o último logit dá um token extra de graça
+                    if not terminou:
+                        extra = forcado()
+                        if extra is None:
+                            scores = processar_logits(logits[len(rascunho)], sampling, indice.ids)
+                            extra = _amostrar(scores, sampling)
+                        terminou = emitir(extra)
+
+                aceitos += aceitos_passo
+                # Mantém no cache apenas o pendente e os tokens aceitos
+                cache = cortar_cache(cache, tamanho_confirmado + 1 + aceitos_passo)
+    finally:
+        if streamer is not None:
+            streamer.end()
+
+    if stats is not None:
+        stats.update({
+            "propostos": propostos,
+            "aceitos": aceitos,
+            "passos": passos + 1,
+            "tokens_gerados": len(gerados),
+            "taxa_aceitacao": round(aceitos / propostos, 4) if propostos else 0.0,
+            "tokens_por_passo": round(len(gerados) / (passos + 1), 3),
+        })
+    return gerados
+
+
+def _amostrar(scores: torch.Tensor, sampling: SamplingParams) -> int:
+    if not sampling.do_sample:
+        return int(torch.argmax(scores).item())
+    return int(torch.multinomial(torch.softmax(scores, dim=-1), num_samples=1).item())
+
+
+def _verificar(scores: torch.Tensor, sampling: SamplingParams, proposto: int) -> int:
+    """Retorna o token proposto se aceito, senão o token de correção"""
+    if not sampling.do_sample:
+        return int(torch.argmax(scores).item())
+
+    probs = torch.softmax(scores, dim=-1)
+    if torch.rand(()) < probs[proposto]:
+        return proposto
+    probs[proposto] = 0.0
+    total = probs.sum()
+    if total <= 0:
+        return proposto
+    return int(torch.multinomial(probs / total, num_samples=1).item())
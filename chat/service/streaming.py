@@ -0,0 +1,182 @@
+import json
+from queue import Queue
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+# Tokens de controle do Qwen3
+THINK_START_TOKEN_ID = 151667
+THINK_END_TOKEN_ID = 151668
+
+_FIM = object()
+
+
+def formatar_sse(evento: Dict) -> str:
+    """Serializa um evento como Server-Sent Event com JSON válido"""
+    return f"data: {json.dumps(evento, ensure_ascii=False)}\n\n"
+
+
+def contar_tokens(output_ids: List[int], eos_token_ids: Iterable[int] = ()) -> Tuple[int, int]:
+    """
+    (tokens de pensamento, tokens de resposta) de uma geração completa
+
+    O pensamento vai até o último </think>, inclusive. Tokens de fim (eos)
+    no final não contam, como no ThinkStreamParser, para que /pergunta e
+    /pergunta-stream informem os mesmos números.
+    """
+    eos = set(eos_token_ids)
+    fim = len(output_ids)
+    while fim and output_ids[fim - 1] in eos:
+        fim -= 1
+    try:
+        index = fim - output_ids[:fim][::-1].index(THINK_END_TOKEN_ID)
+    except ValueError:
+        index = 0
+    return index, fim - index
+
+
+class TokenIteratorStreamer:
+    """
+    Streamer com o mesmo contrato do model.generate (put/end) que entrega IDs
+
+    Diferente do TextIteratorStreamer, não decodifica nada: o consumidor
+    recebe listas de IDs e faz a detokenização incremental.
+    """
+
+    def __init__(self, skip_prompt: bool = True, timeout: Optional[float] = None):
+        self.skip_prompt = skip_prompt
+        self.timeout = timeout
+        self._fila = Queue()
+        self._proximo_e_prompt = True
+
+    def put(self, value):
+        if self.skip_prompt and self._proximo_e_prompt:
+            self._proximo_e_prompt = False
+            return
+        self._proximo_e_prompt = False
+        ids = value.tolist() if hasattr(value, "tolist") else list(value)
+        if ids and isinstance(ids[0], list):
+            ids = ids[0]
+        self._fila.put(ids)
+
+    def end(self):
+        self._fila.put(_FIM)
+
+    def __iter__(self) -> Iterator[List[int]]:
+        while True:
+            item = self._fila.get(timeout=self.timeout)
+            if item is _FIM:
+                return
+            yield item
+
+
+class _Secao:
+    """Detokenização incremental de uma seção (pensamento ou resposta)"""
+
+    def __init__(self, tokenizer):
+        self.tokenizer = tokenizer
+        self.ids: List[int] = []
+        self.prefix_offset = 0
+        self.read_offset = 0
+        self.partes: List[str] = []
+        self.inicio_pendente = True  # ainda não saiu texto além de espaços
+
+    def _decode(self, ids: List[int]) -> str:
+        return self.tokenizer.decode(ids, skip_special_tokens=True)
+
+    def adicionar(self, token_id: int) -> str:
+        """
+        Adiciona um token e retorna o texto novo que já pode ser enviado
+
+        Decodifica só a janela desde o último ponto estável; se o texto
+        termina em um caractere incompleto (\\ufffd, ex.: UTF-8 dividido entre
+        tokens) nada é emitido até o próximo token completá-lo.
+        """
+        self.ids.append(token_id)
+        texto_anterior = self._decode(self.ids[self.prefix_offset:self.read_offset])
+        texto_novo = self._decode(self.ids[self.prefix_offset:])
+        if len(texto_novo) <= len(texto_anterior) or texto_novo.endswith("\ufffd"):
+            return ""
+        delta = texto_novo[len(texto_anterior):]
+        self.prefix_offset = self.read_offset
+        self.read_offset = len(self.ids)
+        return self._registrar(delta)
+
+    def finalizar(self) -> str:
+        """Emite o que restou pendente ao final da seção"""
+        texto_anterior = self._decode(self.ids[self.prefix_offset:self.read_offset])
+        texto_novo = self._decode(self.ids[self.prefix_offset:])
+        self.prefix_offset = self.read_offset = len(self.ids)
+        return self._registrar(texto_novo[len(texto_anterior):])
+
+    def _registrar(self, delta: str) -> str:
+        if self.inicio_pendente:
+            # Remove as quebras de linha que o modelo coloca no início de cada seção
+            delta = delta.lstrip()
+            if not delta:
+                return ""
+            self.inicio_pendente = False
+        self.partes.append(delta)
+        return delta
+
+    @property
+    def texto(self) -> str:
+        return "".join(self.partes).rstrip()
+
+
+class ThinkStreamParser:
+    """
+    Máquina de estados do streaming guiada por IDs de token
+
+    Os tokens <think> e </think> mudam o estado sem nunca passar pelo texto,
+    então tags divididas entre chunks não existem e não há busca de strings
+    por chunk. Tokens de fim (eos) são descartados. Cada token gera no máximo
+    um evento 'thinking_chunk' ou 'response_chunk'.
+    """
+
+    def __init__(self, tokenizer, eos_token_ids: Iterable[int] = (),
+                 think_start_id: int = THINK_START_TOKEN_ID,
+                 think_end_id: int = THINK_END_TOKEN_ID):
+        self.think_start_id = think_start_id
+        self.think_end_id = think_end_id
+        self.ignorar = set(eos_token_ids)
+        self.thinking = _Secao(tokenizer)
+        self.response = _Secao(tokenizer)
+        self.em_pensamento = False
+        self.thinking_tokens = 0
+        self.response_tokens = 0
+
+    def feed(self, ids: Iterable[int]) -> List[Dict]:
+        """Processa novos tokens e retorna os eventos prontos para envio"""
+        eventos = []
+        for token_id in ids:
+            if token_id == self.think_start_id:
+                self.em_pensamento = True
+                self.thinking_tokens += 1
+            elif token_id == self.think_end_id:
+                self._emitir(eventos, "thinking_chunk", self.thinking.finalizar())
+                self.em_pensamento = False
+                self.thinking_tokens += 1
+            elif token_id in self.ignorar:
+                continue
+            elif self.em_pensamento:
+                self.thinking_tokens += 1
+                self._emitir(eventos, "thinking_chunk", self.thinking.adicionar(token_id))
+            else:
+                self.response_tokens += 1
+                self._emitir(eventos, "response_chunk", self.response.adicionar(token_id))
+        return eventos
+
+    def finish(self) -> List[Dict]:
+        """Envia o texto pendente das duas seções"""
+        eventos = []
+        self._emitir(eventos, "thinking_chunk", self.thinking.finalizar())
+        self._emitir(eventos, "response_chunk", self.response.finalizar())
+        return eventos
+
+    @staticmethod
+    def _emitir(eventos: List[Dict], tipo: str, texto: str):
+        if texto:
+            eventos.append({"type": tipo, "content": texto})
+
+    def resultado(self) -> Dict[str, str]:
+        """Texto completo de cada seção"""
+        return {"thinking": self.thinking.texto, "response": self.response.texto}
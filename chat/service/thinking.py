@@ -0,0 +1,53 @@
+from typing import Optional, Sequence
+
+from service.streaming import THINK_END_TOKEN_ID
+
+
+class OrcamentoPensamento:
+    """
+    Limites separados para o pensamento e para a resposta de uma geração
+
+    Os tokens antes do </think> contam como pensamento. Quando eles chegam a
+    max_pensamento sem o modelo ter fechado o bloco, o próximo token é
+    forçado a ser </think> e a geração segue para a resposta, que tem o
+    próprio limite de max_resposta tokens. Assim nenhuma geração passa de
+    max_pensamento + 1 + max_resposta tokens.
+
+    Guarda o estado de uma única sequência: os loops de geração informam
+    cada token emitido com registrar() (ou sincronizar() com a lista
+    completa) e consultam token_forcado() antes de escolher o próximo.
+    """
+
+    def __init__(self, max_pensamento: int, max_resposta: int, think_end_id: int = THINK_END_TOKEN_ID):
+        self.max_pensamento = max_pensamento
+        self.max_resposta = max_resposta
+        self.think_end_id = think_end_id
+        self.total = 0
+        self.fim_pensamento: Optional[int] = None  # posição do </think> nos tokens gerados
+
+    @property
+    def max_new_tokens(self) -> int:
+        return self.max_pensamento + 1 + self.max_resposta
+
+    def registrar(self, token_id: int):
+        if self.fim_pensamento is None and token_id == self.think_end_id:
+            self.fim_pensamento = self.total
+        self.total += 1
+
+    def sincronizar(self, gerados: Sequence[int]):
+        """Registra os tokens de `gerados` (todos os novos da sequência) ainda não vistos"""
+        novos = gerados[self.total:]
+        for token_id in (novos.tolist() if hasattr(novos, "tolist") else novos):
+            self.registrar(int(token_id))
+
+    def token_forcado(self) -> Optional[int]:
+        """</think> se o orçamento de pensamento acabou com o bloco ainda aberto"""
+        if self.fim_pensamento is None and self.total >= self.max_pensamento:
+            return self.think_end_id
+        return None
+
+    @property
+    def resposta_esgotada(self) -> bool:
+        if self.fim_pensamento is None:
+            return False
+        return self.total - self.fim_pensamento - 1 >= self.max_resposta
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Mesmo ajuste de path do application/app.py, para importar o pacote service
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,55 @@
+import pytest
+
+pytest.importorskip("torch")
+pytest.importorskip("transformers")
+
+import torch
+
+from service.backends import CompiledBackend, HFBackend
+from service.sampling import SamplingParams
+
+
+def test_stats_com_batching_continuo():
+    # O batcher só processa o modelo quando há sequências; sem nenhuma, fica ocioso
+    backend = HFBackend(model=None, eos_token_ids=[0], continuous_batching=True)
+
+    assert backend.stats() == {"nome": "hf", "batching_continuo": 0}
+
+
+def test_stats_sem_batching_continuo():
+    backend = HFBackend(model=None, eos_token_ids=[0], continuous_batching=False)
+
+    assert backend.stats()["batching_continuo"] is None
+
+
+def modelo_pequeno():
+    from transformers import Qwen3Config, Qwen3ForCausalLM
+
+    torch.manual_seed(0)
+    config = Qwen3Config(vocab_size=64, hidden_size=32, intermediate_size=64, num_hidden_layers=2,
+                         num_attention_heads=4, num_key_value_heads=2, head_dim=8,
+                         max_position_embeddings=128)
+    return Qwen3ForCausalLM(config).eval()
+
+
+def test_compilado_gera_o_mesmo_que_o_eager(monkeypatch):
+    # backend="eager" passa pelo torch.compile (dynamo) sem exigir compilador C no teste
+    compilar = torch.compile
+    monkeypatch.setattr(torch, "compile", lambda fn, **kwargs: compilar(fn, backend="eager", **kwargs))
+    model = modelo_pequeno()
+    prompt = [1, 5, 9, 13, 2]
+
+    esperado = HFBackend(model, eos_token_ids=[0], continuous_batching=False).gerar(
+        prompt, 8, SamplingParams())
+    backend = CompiledBackend(model, eos_token_ids=[0], max_cache_len=32)
+
+    assert backend.gerar(prompt, 8, SamplingParams()) == esperado
+    # O cache estático é reaproveitado: a segunda geração não herda a primeira
+    assert backend.gerar(prompt, 8, SamplingParams()) == esperado
+
+
+def test_compilado_recusa_prompt_maior_que_o_cache():
+    backend = CompiledBackend(modelo_pequeno(), eos_token_ids=[0], max_cache_len=4)
+
+    with pytest.raises(ValueError):
+        backend.gerar([1, 2, 3, 4], 8, SamplingParams())
@@ -0,0 +1,39 @@
+import io
+
+from benchmark import comparar, ler_sse, percentis, resumir, tipo_do_evento
+
+
+def test_percentis_interpolados():
+    resultado = percentis([float(i) for i in range(1, 101)])
+    assert resultado["p50"] == 50.5
+    assert resultado["p99"] == 99.01
+    assert resultado["max"] == 100.0
+
+
+def test_percentis_vazio():
+    assert percentis([])["p50"] is None
+
+
+def test_ler_sse_dos_dois_alvos():
+    corpo = io.BytesIO(
+        b'data: {"type": "response_chunk", "content": "Ol\xc3\xa1"}\n\n'
+        b'event: response\ndata: {"word": "mundo"}\n\n'
+    )
+    eventos = [tipo_do_evento(nome, dados) for nome, dados in ler_sse(corpo)]
+    assert eventos == ["response_chunk", "response"]
+
+
+def test_resumir_e_comparar():
+    medicoes = [
+        {"ok": True, "erro": None, "ttft_s": 0.1, "latencia_s": 1.1, "tokens": 11, "itl_s": [0.1] * 10},
+        {"ok": False, "erro": "HTTP 503", "ttft_s": None, "latencia_s": 0.01, "tokens": 0, "itl_s": []},
+    ]
+    resumo = resumir(medicoes, tempo_total=2.0)
+    assert resumo["taxa_erro"] == 0.5
+    assert resumo["erros"] == {"HTTP 503": 1}
+    assert resumo["tokens_por_s_requisicao"]["p50"] == 10.0
+
+    pior = dict(resumo, ttft_s=dict(resumo["ttft_s"], p50=0.2))
+    regressoes = comparar(pior, resumo, tolerancia=0.10)
+    assert [r["metrica"] for r in regressoes] == ["ttft_s.p50"]
+    assert comparar(resumo, resumo) == []
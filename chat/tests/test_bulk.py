@@ -0,0 +1,36 @@
+import json
+
+from service.bulk import ItemLote, agrupar_por_tamanho, custo_lote, linha_ndjson
+
+
+def item(indice, tokens_prompt, grupo="a", max_new_tokens=10):
+    return ItemLote(indice=indice, tokens_prompt=tokens_prompt, max_new_tokens=max_new_tokens, grupo=grupo)
+
+
+def test_agrupa_prompts_de_tamanho_parecido():
+    itens = [item(0, 50), item(1, 5), item(2, 48), item(3, 6)]
+    lotes = agrupar_por_tamanho(itens, max_lote=2, max_tokens_lote=10_000)
+    assert [[i.indice for i in lote] for lote in lotes] == [[1, 3], [2, 0]]
+
+
+def test_grupos_diferentes_nao_dividem_lote():
+    itens = [item(0, 5, grupo="guloso"), item(1, 5, grupo="amostrado")]
+    lotes = agrupar_por_tamanho(itens, max_lote=8, max_tokens_lote=10_000)
+    assert sorted(len(lote) for lote in lotes) == [1, 1]
+
+
+def test_respeita_limite_de_tokens_com_padding():
+    itens = [item(i, 20) for i in range(5)]
+    lotes = agrupar_por_tamanho(itens, max_lote=8, max_tokens_lote=90)
+    assert [len(lote) for lote in lotes] == [2, 3]
+    assert all(custo_lote(lote) <= 90 for lote in lotes)
+
+
+def test_item_maior_que_o_limite_fica_sozinho():
+    lotes = agrupar_por_tamanho([item(0, 500), item(1, 4)], max_lote=8, max_tokens_lote=100)
+    assert [[i.indice for i in lote] for lote in lotes] == [[1], [0]]
+
+
+def test_linha_ndjson():
+    linha = linha_ndjson({"index": 3, "response": "Olá"})
+    assert linha.endswith("\n") and json.loads(linha) == {"index": 3, "response": "Olá"}
@@ -0,0 +1,62 @@
+import pytest
+
+from service.metrics import Contador, Histograma, MedicaoGeracao, MetricasInferencia, StreamerMedido
+
+
+def test_histograma_buckets_cumulativos():
+    histograma = Histograma("latencia_seconds", "Latência", ("endpoint",), buckets=(0.1, 1))
+    for valor in (0.05, 0.5, 2):
+        histograma.observe(valor, endpoint="/pergunta")
+
+    linhas = histograma.renderizar()
+    assert 'latencia_seconds_bucket{endpoint="/pergunta",le="0.1"} 1' in linhas
+    assert 'latencia_seconds_bucket{endpoint="/pergunta",le="1"} 2' in linhas
+    assert 'latencia_seconds_bucket{endpoint="/pergunta",le="+Inf"} 3' in linhas
+    assert 'latencia_seconds_count{endpoint="/pergunta"} 3' in linhas
+
+
+def test_contador_exige_rotulos_e_escapa_valores():
+    contador = Contador("erros_total", "Erros", ("type",))
+    with pytest.raises(ValueError):
+        contador.inc(endpoint="/pergunta")
+    contador.inc(type='a"b')
+    assert 'erros_total{type="a\\"b"} 1' in contador.renderizar()
+
+
+def test_medicao_registra_tempos_e_tokens():
+    metricas = MetricasInferencia()
+    medicao = MedicaoGeracao("/pergunta-stream", metricas)
+    assert metricas.em_andamento.valor(endpoint="/pergunta-stream") == 1
+
+    medicao.iniciar(tokens_prompt=40)
+    streamer = StreamerMedido(medicao)
+    streamer.put([1, 2, 3])  # prompt
+    assert medicao.primeiro_token is None
+    streamer.put([4])
+    medicao.concluir("stop", tokens_pensamento=5, tokens_resposta=3)
+
+    assert metricas.em_andamento.valor(endpoint="/pergunta-stream") == 0
+    assert metricas.tokens_prompt.valor(endpoint="/pergunta-stream") == 40
+    assert metricas.tokens_gerados.valor(endpoint="/pergunta-stream", section="thinking") == 5
+    assert metricas.ttft.contagem(endpoint="/pergunta-stream") == 1
+    assert metricas.requisicoes.valor(endpoint="/pergunta-stream", outcome="stop") == 1
+
+
+def test_medicao_cancelada_antes_do_primeiro_token():
+    metricas = MetricasInferencia()
+    medicao = MedicaoGeracao("/pergunta", metricas)
+    medicao.iniciar()
+    medicao.concluir("cancelled", 0, 0)
+    medicao.falhar()  # já finalizada: não conta de novo
+
+    assert metricas.cancelamentos.valor(endpoint="/pergunta", reason="cancelled") == 1
+    assert metricas.prefill.contagem(endpoint="/pergunta") == 0
+    assert metricas.erros.valor(endpoint="/pergunta", type="geracao") == 0
+    assert metricas.em_andamento.valor(endpoint="/pergunta") == 0
+
+
+def test_renderizacao_completa():
+    texto = MetricasInferencia().renderizar()
+    assert "# TYPE llm_time_to_first_token_seconds histogram" in texto
+    assert "# TYPE llm_requests_in_flight gauge" in texto
+    assert texto.endswith("\n")
@@ -0,0 +1,35 @@
+import pytest
+
+from service.modes import resolver
+
+
+def test_fast_desliga_pensamento_e_usa_guloso():
+    geracao = resolver("fast")
+    assert geracao["max_thinking_tokens"] == 0
+    assert geracao["sampling"]["do_sample"] is False
+
+
+def test_requisicao_sobrescreve_o_modo():
+    geracao = resolver("balanced", max_tokens=64, temperature=0.3)
+    assert geracao["max_tokens"] == 64
+    assert geracao["sampling"]["temperature"] == 0.3
+    assert geracao["sampling"]["top_k"] == 20
+
+
+def test_sem_modo_mantem_padroes_do_servico():
+    geracao = resolver(None, do_sample=False)
+    assert geracao["max_tokens"] is None
+    assert geracao["sampling"] == {"do_sample": False, "temperature": None, "top_p": None,
+                                   "top_k": None, "repetition_penalty": None}
+
+
+@pytest.mark.parametrize("modo, valores", [
+    ("turbo", {}),
+    ("fast", {"temperature": 0}),
+    ("deep", {"top_p": 1.5}),
+    (None, {"max_tokens": 2048}),
+    (None, {"seed": 1}),
+])
+def test_valores_invalidos(modo, valores):
+    with pytest.raises(ValueError):
+        resolver(modo, **valores)
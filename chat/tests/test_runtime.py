@@ -0,0 +1,49 @@
+import pytest
+
+from service.runtime import cota_cgroup, cpus_efetivas, planejar
+
+
+def test_cota_cgroup_v2(tmp_path):
+    (tmp_path / "cpu.max").write_text("400000 100000\n")
+    assert cota_cgroup(str(tmp_path)) == 4.0
+
+
+def test_cota_cgroup_v2_sem_limite(tmp_path):
+    (tmp_path / "cpu.max").write_text("max 100000\n")
+    assert cota_cgroup(str(tmp_path)) is None
+
+
+def test_cota_cgroup_v1(tmp_path):
+    (tmp_path / "cpu").mkdir()
+    (tmp_path / "cpu" / "cpu.cfs_quota_us").write_text("150000\n")
+    (tmp_path / "cpu" / "cpu.cfs_period_us").write_text("100000\n")
+    assert cota_cgroup(str(tmp_path)) == 1.5
+
+
+def test_cota_cgroup_ausente(tmp_path):
+    assert cota_cgroup(str(tmp_path)) is None
+
+
+@pytest.mark.parametrize("cota, esperado", [(None, 16), (4.0, 4), (2.5, 2), (0.5, 1), (32.0, 16)])
+def test_cpus_efetivas_respeita_cota(cota, esperado):
+    assert cpus_efetivas(list(range(16)), cota) == esperado
+
+
+def test_planejar_divide_nucleos_disjuntos():
+    cpus = list(range(16))
+    layouts = [planejar(workers=4, indice=i, cpus=cpus, cota=8.0, fixar=True) for i in range(4)]
+
+    assert [l["intra_op"] for l in layouts] == [2, 2, 2, 2]
+    nucleos = [tuple(l["nucleos"]) for l in layouts]
+    assert len(set(sum(nucleos, ()))) == 8
+
+
+def test_planejar_sem_fixar_nao_define_nucleos():
+    layout = planejar(workers=2, indice=1, cpus=list(range(4)))
+    assert layout["nucleos"] is None
+    assert layout["intra_op"] == 2
+
+
+def test_planejar_intra_forcado():
+    layout = planejar(workers=1, cpus=list(range(8)), intra=3)
+    assert layout["intra_op"] == 3
@@ -0,0 +1,87 @@
+import threading
+
+import pytest
+
+from service.executor import InferenceExecutor
+from service.scheduler import Agendamento, FilaAgendada
+
+
+class Relogio:
+    def __init__(self):
+        self.agora = 0.0
+
+    def __call__(self):
+        return self.agora
+
+
+def retirar_todas(fila):
+    ordem = []
+    while fila:
+        tarefa, agendamento = fila.retirar()
+        fila.liberar(agendamento)
+        ordem.append(tarefa)
+    return ordem
+
+
+def test_interativas_e_curtas_saem_primeiro():
+    fila = FilaAgendada(relogio=Relogio())
+    fila.adicionar("lote", Agendamento("batch", custo=100))
+    fila.adicionar("longa", Agendamento("standard", custo=1500))
+    fila.adicionar("curta", Agendamento("standard", custo=80))
+    fila.adicionar("stream", Agendamento("interactive", custo=300))
+
+    assert retirar_todas(fila) == ["curta", "stream", "lote", "longa"]
+
+
+def test_envelhecimento_evita_inanicao():
+    relogio = Relogio()
+    fila = FilaAgendada(envelhecimento=32.0, relogio=relogio)
+    fila.adicionar("longa", Agendamento("standard", custo=1000))
+    relogio.agora = 60.0  # 60 s de espera descontam 1920 tokens
+    fila.adicionar("curta", Agendamento("interactive", custo=50))
+
+    assert retirar_todas(fila) == ["longa", "curta"]
+
+
+def test_justica_entre_clientes():
+    fila = FilaAgendada(penalidade_cliente=256.0, relogio=Relogio())
+    for i in range(3):
+        fila.adicionar(f"a{i}", Agendamento("interactive", custo=100, cliente="a"))
+    fila.adicionar("b0", Agendamento("interactive", custo=100, cliente="b"))
+
+    # Com a0 ainda em execução, b0 passa na frente de a1 e a2
+    assert [fila.retirar()[0] for _ in range(2)] == ["a0", "b0"]
+
+
+def test_posicao_de_uma_nova_tarefa():
+    fila = FilaAgendada(relogio=Relogio())
+    fila.adicionar("lote", Agendamento("batch", custo=500))
+    fila.adicionar("media", Agendamento("standard", custo=200))
+
+    assert fila.posicao(Agendamento("interactive", custo=50)) == 0
+    assert fila.posicao(Agendamento("standard", custo=300)) == 1
+    assert fila.posicao(Agendamento("batch", custo=2000)) == 2
+
+
+def test_classe_invalida():
+    with pytest.raises(ValueError):
+        Agendamento("urgente")
+
+
+def test_executor_respeita_a_ordem_da_fila():
+    executor = InferenceExecutor(max_workers=1, max_queue=8)
+    liberar = threading.Event()
+    executadas = []
+
+    bloqueio = executor.submit(liberar.wait)
+    futuros = [
+        executor.submit(executadas.append, "lote", agendamento=Agendamento("batch", custo=10)),
+        executor.submit(executadas.append, "longa", agendamento=Agendamento("interactive", custo=900)),
+        executor.submit(executadas.append, "curta", agendamento=Agendamento("interactive", custo=20)),
+    ]
+    assert futuros[2].fila["position"] == 0
+    liberar.set()
+    for futuro in [bloqueio] + futuros:
+        futuro.result(timeout=5)
+
+    assert executadas == ["curta", "longa", "lote"]
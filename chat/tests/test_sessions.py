@@ -0,0 +1,62 @@
+import pytest
+
+from service.sessions import SessionStore, prefixo_comum
+
+
+def test_acerto_reaproveita_todo_o_prompt_anterior():
+    store = SessionStore(max_bytes=1000)
+    store.guardar("chat", [1, 2, 3], [], tamanho_bytes=100)
+
+    ids, _ = store.buscar("chat", [1, 2, 3, 4, 5])
+    assert ids == [1, 2, 3]
+    assert store.stats()["acertos"] == 1
+
+
+def test_divergencia_corta_no_prefixo_comum_e_deixa_um_token():
+    store = SessionStore(max_bytes=1000)
+    store.guardar("chat", [1, 2, 3, 4], [], tamanho_bytes=100)
+
+    assert store.buscar("chat", [1, 2, 9])[0] == [1, 2]
+    assert store.buscar("chat", [1, 2, 3, 4])[0] == [1, 2, 3]
+    assert store.buscar("chat", [7, 8]) is None
+    assert store.buscar("outro", [1, 2, 3]) is None
+    stats = store.stats()
+    assert (stats["acertos_parciais"], stats["falhas"]) == (2, 2)
+
+
+def test_lru_respeita_o_limite_de_memoria():
+    store = SessionStore(max_bytes=250)
+    store.guardar("a", [1], [], tamanho_bytes=100)
+    store.guardar("b", [2], [], tamanho_bytes=100)
+    store.buscar("a", [1, 5])  # "a" passa a ser a mais recente
+    store.guardar("c", [3], [], tamanho_bytes=100)
+
+    assert store.buscar("b", [2, 5]) is None
+    assert store.buscar("a", [1, 5]) is not None
+    stats = store.stats()
+    assert stats["sessoes"] == 2 and stats["removidas"] == 1
+    assert store.bytes_usados == 200
+
+
+def test_sessao_maior_que_o_limite_nao_e_guardada():
+    store = SessionStore(max_bytes=50)
+    assert not store.guardar("a", [1], [], tamanho_bytes=100)
+    assert store.stats()["sessoes"] == 0
+
+
+def test_prefixo_comum():
+    assert prefixo_comum([1, 2, 3], [1, 2, 4, 5]) == 2
+    assert prefixo_comum([], [1]) == 0
+
+
+def test_corte_nao_prende_o_cache_inteiro():
+    torch = pytest.importorskip("torch")
+    from service.kv_cache import tamanho_bytes
+    from service.sessions import cortar_camadas
+
+    k = torch.zeros(1, 2, 100, 4)
+    cortadas = cortar_camadas([(k, k.clone())], 10)
+
+    assert tamanho_bytes(cortadas) == 2 * k[:, :, :10, :].numel() * k.element_size()
+    # Uma fatia sem cópia conta a memória inteira que ela mantém viva
+    assert tamanho_bytes([(k[:, :, :10, :], k[:, :, :10, :])]) == k.numel() * k.element_size()
@@ -0,0 +1,139 @@
+import json
+
+import pytest
+
+from service.streaming import (
+    THINK_END_TOKEN_ID,
+    THINK_START_TOKEN_ID,
+    ThinkStreamParser,
+    TokenIteratorStreamer,
+    contar_tokens,
+    formatar_sse,
+)
+
+IM_END_TOKEN_ID = 151645
+ESPECIAIS = {
+    THINK_START_TOKEN_ID: "<think>",
+    THINK_END_TOKEN_ID: "</think>",
+    IM_END_TOKEN_ID: "<|im_end|>",
+}
+
+
+class TokenizerDeBytes:
+    """Tokenizer falso: cada ID < 256 é um byte UTF-8, como num BPE em nível de byte"""
+
+    def decode(self, ids, skip_special_tokens=False):
+        texto = []
+        dados = bytearray()
+        for token_id in ids:
+            if token_id in ESPECIAIS:
+                texto.append(dados.decode("utf-8", errors="replace"))
+                dados = bytearray()
+                if not skip_special_tokens:
+                    texto.append(ESPECIAIS[token_id])
+            else:
+                dados.append(token_id)
+        texto.append(dados.decode("utf-8", errors="replace"))
+        return "".join(texto)
+
+
+def codificar(texto):
+    return list(texto.encode("utf-8"))
+
+
+def sequencia(pensamento, resposta):
+    return (
+        [THINK_START_TOKEN_ID]
+        + codificar(pensamento)
+        + [THINK_END_TOKEN_ID]
+        + codificar(resposta)
+        + [IM_END_TOKEN_ID]
+    )
+
+
+def processar(ids, tamanho_chunk):
+    parser = ThinkStreamParser(TokenizerDeBytes(), eos_token_ids=[IM_END_TOKEN_ID])
+    eventos = []
+    for inicio in range(0, len(ids), tamanho_chunk):
+        eventos.extend(parser.feed(ids[inicio:inicio + tamanho_chunk]))
+    eventos.extend(parser.finish())
+    return parser, eventos
+
+
+def juntar(eventos, tipo):
+    return "".join(e["content"] for e in eventos if e["type"] == tipo)
+
+
+@pytest.mark.parametrize("tamanho_chunk", [1, 2, 3, 7, 1000])
+def test_separa_pensamento_e_resposta_em_qualquer_divisao(tamanho_chunk):
+    ids = sequencia("\nO usuário quer saber sobre o espaço.\n", "\n\nYuri Gagarin, em 1961.")
+    parser, eventos = processar(ids, tamanho_chunk)
+
+    assert juntar(eventos, "thinking_chunk") == "O usuário quer saber sobre o espaço.\n"
+    assert juntar(eventos, "response_chunk") == "Yuri Gagarin, em 1961."
+    assert parser.resultado() == {
+        "thinking": "O usuário quer saber sobre o espaço.",
+        "response": "Yuri Gagarin, em 1961.",
+    }
+
+
+def test_caractere_multibyte_dividido_entre_tokens_nao_vaza_substituto():
+    # "ção" ocupa 5 bytes; cada byte chega em um chunk separado
+    _, eventos = processar(sequencia("Atenção", "Informação"), 1)
+
+    for evento in eventos:
+        assert "�" not in evento["content"]
+    assert juntar(eventos, "thinking_chunk") == "Atenção"
+    assert juntar(eventos, "response_chunk") == "Informação"
+
+
+def test_tokens_de_fim_sao_descartados():
+    _, eventos = processar(sequencia("ok", "Brasília") + [IM_END_TOKEN_ID], 4)
+
+    assert juntar(eventos, "response_chunk") == "Brasília"
+    assert all("<|im_end|>" not in e["content"] for e in eventos)
+
+
+@pytest.mark.parametrize("ids", [
+    sequencia("Pensando.", "Brasília"),
+    sequencia("", "ok") + [IM_END_TOKEN_ID],
+    codificar("Resposta direta.") + [IM_END_TOKEN_ID],
+    sequencia("Cortado", "no limite")[:-1],
+])
+def test_contagem_igual_no_streaming_e_na_geracao_completa(ids):
+    parser, _ = processar(ids, 3)
+
+    assert contar_tokens(ids, [IM_END_TOKEN_ID]) == (parser.thinking_tokens, parser.response_tokens)
+
+
+def test_sem_tags_de_pensamento_tudo_e_resposta():
+    _, eventos = processar(codificar("Resposta direta.") + [IM_END_TOKEN_ID], 3)
+
+    assert juntar(eventos, "thinking_chunk") == ""
+    assert juntar(eventos, "response_chunk") == "Resposta direta."
+
+
+def test_conta_tokens_de_pensamento_e_resposta():
+    parser, _ = processar(sequencia("abc", "de"), 2)
+
+    # <think> + 3 bytes + </think>
+    assert parser.thinking_tokens == 5
+    assert parser.response_tokens == 2
+
+
+def test_formatar_sse_gera_json_valido():
+    evento = {"type": "response_chunk", "content": "aspas \" e 'apóstrofo'\nnova linha"}
+    linha = formatar_sse(evento)
+
+    assert linha.startswith("data: ") and linha.endswith("\n\n")
+    assert json.loads(linha[len("data: "):]) == evento
+
+
+def test_streamer_ignora_prompt_e_entrega_ids():
+    streamer = TokenIteratorStreamer(skip_prompt=True)
+    streamer.put([[1, 2, 3]])
+    streamer.put([4])
+    streamer.put([5])
+    streamer.end()
+
+    assert list(streamer) == [[4], [5]]
@@ -0,0 +1,41 @@
+from service.streaming import THINK_END_TOKEN_ID, THINK_START_TOKEN_ID
+from service.thinking import OrcamentoPensamento
+
+
+def gerar(orcamento: OrcamentoPensamento, escolhas):
+    """Simula um loop de geração: usa o token forçado quando houver, senão a próxima escolha"""
+    gerados = []
+    escolhas = iter(escolhas)
+    while len(gerados) < orcamento.max_new_tokens and not orcamento.resposta_esgotada:
+        token = orcamento.token_forcado()
+        if token is None:
+            token = next(escolhas)
+        gerados.append(token)
+        orcamento.registrar(token)
+    return gerados
+
+
+def test_forca_fim_do_pensamento_e_limita_resposta():
+    orcamento = OrcamentoPensamento(max_pensamento=4, max_resposta=3)
+    # O modelo nunca fecharia o pensamento sozinho
+    gerados = gerar(orcamento, [THINK_START_TOKEN_ID] + [7] * 100)
+
+    assert gerados[:5] == [THINK_START_TOKEN_ID, 7, 7, 7, THINK_END_TOKEN_ID]
+    assert len(gerados) == 4 + 1 + 3
+    assert orcamento.resposta_esgotada
+
+
+def test_pensamento_curto_nao_e_forcado():
+    orcamento = OrcamentoPensamento(max_pensamento=10, max_resposta=2)
+    gerados = gerar(orcamento, [THINK_START_TOKEN_ID, 5, THINK_END_TOKEN_ID, 8, 9, 10])
+
+    assert gerados == [THINK_START_TOKEN_ID, 5, THINK_END_TOKEN_ID, 8, 9]
+    assert orcamento.fim_pensamento == 2
+
+
+def test_sincronizar_registra_so_os_novos():
+    orcamento = OrcamentoPensamento(max_pensamento=2, max_resposta=5)
+    orcamento.sincronizar([THINK_START_TOKEN_ID])
+    orcamento.sincronizar([THINK_START_TOKEN_ID, 3])
+    assert orcamento.total == 2
+    assert orcamento.token_forcado() == THINK_END_TOKEN_ID
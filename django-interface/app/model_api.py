@@ -0,0 +1,195 @@
+"""
+Cliente HTTP assíncrono da API do modelo (FastAPI), compartilhado pelo processo
+
+Um único httpx.AsyncClient com pool de conexões keep-alive: as perguntas
+não pagam a abertura de uma conexão TCP cada uma e nenhuma thread fica
+presa esperando o modelo. URLs, tamanho do pool, timeouts e novas
+tentativas vêm do settings (MODEL_API_*).
+"""
+import asyncio
+import itertools
+import os
+import weakref
+import zlib
+from contextlib import asynccontextmanager
+
+import httpx
+from django.conf import settings
+
+# Métodos que podem ser repetidos mesmo se a API já recebeu a requisição
+METODOS_IDEMPOTENTES = frozenset({"GET", "HEAD", "PUT", "DELETE", "OPTIONS"})
+STATUS_REPETIVEIS = frozenset({502, 503, 504})
+
+
+class ModelAPIClient:
+    """
+    Cliente da API do modelo com pool de conexões, timeouts e novas tentativas
+
+    Falhas de conexão são repetidas com backoff para qualquer método (a
+    requisição não chegou a ser enviada); erros de leitura e respostas
+    502/503/504 só nos métodos idempotentes (GET, PUT, DELETE...). Com várias
+    URLs, uma instância fora do ar é pulada em favor da próxima.
+
+    Um httpx.AsyncClient pertence ao event loop em que foi usado: use
+    cliente_api_modelo() para obter o cliente do loop atual.
+    """
+
+    def __init__(self, urls, pool_size=32, connect_timeout=3.0, read_timeout=120.0,
+                 retries=2, backoff=0.2, transport=None):
+        if not urls:
+            raise ValueError("Informe ao menos uma URL da API do modelo")
+        self.urls = list(urls)
+        self.pool_size = pool_size
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.retries = retries
+        self.backoff = backoff
+        self._proxima = itertools.cycle(range(len(self.urls)))
+        self.requisicoes = 0
+        self.falhas = 0
+        self.novas_tentativas = 0
+        self.trocas_de_instancia = 0
+
+        self.http = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=pool_size * len(self.urls),
+                                max_keepalive_connections=pool_size * len(self.urls)),
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            transport=transport,
+        )
+
+    def _ordem_das_urls(self, sessao=None):
+        """
+        URLs na ordem em que serão tentadas
+
+        Um chat (sessao) fica sempre na mesma instância, onde está o cache KV
+        da conversa; sem sessão as instâncias se revezam.
+        """
+        if sessao:
+            inicio = zlib.crc32(str(sessao).encode("utf-8")) % len(self.urls)
+        else:
+            inicio = next(self._proxima)
+        return self.urls[inicio:] + self.urls[:inicio]
+
+    def _pode_repetir(self, metodo, erro=None, status=None):
+        if isinstance(erro, (httpx.ConnectError, httpx.ConnectTimeout)):
+            return True
+        if metodo not in METODOS_IDEMPOTENTES:
+            return False
+        return isinstance(erro, (httpx.ReadError, httpx.RemoteProtocolError)) or status in STATUS_REPETIVEIS
+
+    async def _enviar(self, metodo, caminho, sessao=None, timeout=None, stream=False, **kwargs):
+        """Envia com novas tentativas (backoff exponencial) e troca de instância"""
+        timeout = httpx.Timeout(timeout if timeout is not None else self.read_timeout,
+                                connect=self.connect_timeout)
+        urls = self._ordem_das_urls(sessao)
+        self.requisicoes += 1
+        for indice, url in enumerate(urls):
+            ultima_instancia = indice == len(urls) - 1
+            for tentativa in range(self.retries + 1):
+                if tentativa:
+                    self.novas_tentativas += 1
+                    await asyncio.sleep(self.backoff * 2 ** (tentativa - 1))
+                requisicao = self.http.build_request(metodo, url + caminho, timeout=timeout, **kwargs)
+                try:
+                    resposta = await self.http.send(requisicao, stream=stream)
+                except httpx.TransportError as erro:
+                    if not self._pode_repetir(metodo, erro=erro):
+                        self.falhas += 1
+                        raise
+                    if tentativa < self.retries:
+                        continue
+                    if ultima_instancia or not isinstance(erro, (httpx.ConnectError, httpx.ConnectTimeout)):
+                        self.falhas += 1
+                        raise
+                    print(f"[MODEL API] {url} fora do ar, tentando a próxima instância: {erro}")
+                    self.trocas_de_instancia += 1
+                    break
+                if tentativa < self.retries and self._pode_repetir(metodo, status=resposta.status_code):
+                    await resposta.aclose()
+                    continue
+                return resposta
+
+    async def request(self, metodo, caminho, **kwargs):
+        """
+        Requisição à API do modelo (ex.: await request("POST", "/pergunta", json=...))
+
+        Args:
+            sessao: Id do chat, para manter a conversa na mesma instância
+            timeout: Timeout de leitura em segundos (padrão MODEL_API_READ_TIMEOUT_S)
+        """
+        return await self._enviar(metodo, caminho, **kwargs)
+
+    async def post(self, caminho, **kwargs):
+        return await self.request("POST", caminho, **kwargs)
+
+    async def delete(self, caminho, **kwargs):
+        return await self.request("DELETE", caminho, **kwargs)
+
+    @asynccontextmanager
+    async def stream(self, metodo, caminho, **kwargs):
+        """Resposta em streaming (ex.: SSE); a conexão volta ao pool ao sair do bloco"""
+        resposta = await self._enviar(metodo, caminho, stream=True, **kwargs)
+        try:
+            yield resposta
+        finally:
+            await resposta.aclose()
+
+    def _conexoes(self):
+        """
+        Conexões abertas e ociosas do pool, ou (None, None)
+
+        Lê atributos internos do httpx/httpcore, que podem mudar entre
+        versões ou não existir num transporte próprio.
+        """
+        try:
+            conexoes = list(self.http._transport._pool.connections)
+            return len(conexoes), sum(1 for conexao in conexoes if conexao.is_idle())
+        except (AttributeError, TypeError):
+            return None, None
+
+    def stats(self):
+        """Uso do pool de conexões com a API do modelo"""
+        abertas, ociosas = self._conexoes()
+        return {
+            'urls': self.urls,
+            'pool_size': self.pool_size,
+            'conexoes_abertas': abertas,
+            'conexoes_ociosas': ociosas,
+            'requisicoes': self.requisicoes,
+            'novas_tentativas': self.novas_tentativas,
+            'falhas': self.falhas,
+            'trocas_de_instancia': self.trocas_de_instancia,
+        }
+
+    async def aclose(self):
+        await self.http.aclose()
+
+
+_clientes = weakref.WeakKeyDictionary()
+_pid = None
+
+
+def cliente_api_modelo():
+    """
+    Cliente do event loop atual, criado no primeiro uso
+
+    Sob ASGI há um loop por processo, então o cliente (e o pool) é único no
+    processo. Um processo criado por fork não herda as conexões do pai.
+    """
+    global _pid
+    if _pid != os.getpid():
+        _clientes.clear()
+        _pid = os.getpid()
+    loop = asyncio.get_running_loop()
+    cliente = _clientes.get(loop)
+    if cliente is None:
+        cliente = ModelAPIClient(
+            settings.MODEL_API_URLS,
+            pool_size=settings.MODEL_API_POOL_SIZE,
+            connect_timeout=settings.MODEL_API_CONNECT_TIMEOUT_S,
+            read_timeout=settings.MODEL_API_READ_TIMEOUT_S,
+            retries=settings.MODEL_API_RETRIES,
+            backoff=settings.MODEL_API_BACKOFF_S,
+        )
+        _clientes[loop] = cliente
+    return cliente
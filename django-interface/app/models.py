@@ -1,37 +1,240 @@
 from django.db import models
-from pymongo import MongoClient
+from django.conf import settings
+from pymongo import AsyncMongoClient, DESCENDING
+from pymongo.errors import PyMongoError
+from pymongo.monitoring import ConnectionPoolListener
 from datetime import datetime
 from bson import ObjectId
+from bson.errors import InvalidId
+import asyncio
+import base64
+import os
+import threading
+import time
+import weakref
 
-# Conexão com MongoDB
-def get_db():
-    client = MongoClient(
-        host='localhost',
-        port=27017,
-        username='admin',
-        password='admin',
-        authSource='admin'
+
+class MonitorDoPool(ConnectionPoolListener):
+    """Conta as conexões do pool a partir dos eventos do driver (CMAP)"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.abertas = 0
+        self.em_uso = 0
+        self.criadas = 0
+        self.falhas_de_checkout = 0
+        self.limpezas = 0
+    
+    def _somar(self, **deltas):
+        with self._lock:
+            for nome, delta in deltas.items():
+                setattr(self, nome, getattr(self, nome) + delta)
+    
+    def pool_created(self, event):
+        pass
+    
+    def pool_ready(self, event):
+        pass
+    
+    def pool_cleared(self, event):
+        self._somar(limpezas=1)
+    
+    def pool_closed(self, event):
+        pass
+    
+    def connection_created(self, event):
+        self._somar(abertas=1, criadas=1)
+    
+    def connection_ready(self, event):
+        pass
+    
+    def connection_closed(self, event):
+        self._somar(abertas=-1)
+    
+    def connection_check_out_started(self, event):
+        pass
+    
+    def connection_check_out_failed(self, event):
+        self._somar(falhas_de_checkout=1)
+    
+    def connection_checked_out(self, event):
+        self._somar(em_uso=1)
+    
+    def connection_checked_in(self, event):
+        self._somar(em_uso=-1)
+    
+    def stats(self):
+        with self._lock:
+            return {
+                'conexoes_abertas': self.abertas,
+                'conexoes_em_uso': self.em_uso,
+                'conexoes_criadas': self.criadas,
+                'falhas_de_checkout': self.falhas_de_checkout,
+                'limpezas_do_pool': self.limpezas,
+            }
+
+
+def _configuracao():
+    """Argumentos do cliente MongoDB a partir do settings (MONGO_*)"""
+    opcoes = dict(
+        maxPoolSize=settings.MONGO_MAX_POOL_SIZE,
+        minPoolSize=settings.MONGO_MIN_POOL_SIZE,
+        maxIdleTimeMS=settings.MONGO_MAX_IDLE_TIME_MS,
+        connectTimeoutMS=settings.MONGO_CONNECT_TIMEOUT_MS,
+        serverSelectionTimeoutMS=settings.MONGO_SERVER_SELECTION_TIMEOUT_MS,
+    )
+    if settings.MONGO_URI:
+        # Credenciais e opções extras vêm na própria URI
+        return dict(host=settings.MONGO_URI, **opcoes)
+    return dict(
+        host=settings.MONGO_HOST,
+        port=settings.MONGO_PORT,
+        username=settings.MONGO_USERNAME,
+        password=settings.MONGO_PASSWORD,
+        authSource=settings.MONGO_AUTH_SOURCE,
+        **opcoes
     )
-    return client['chat_database']
 
-# Funções para gerenciar Chats
+
+def _criar_cliente(monitor):
+    """AsyncMongoClient configurado pelo settings (MONGO_*)"""
+    return AsyncMongoClient(event_listeners=[monitor], **_configuracao())
+
+
+# Um cliente (e um pool) por event loop: sob ASGI, um por processo
+_clientes = weakref.WeakKeyDictionary()
+_pid = None
+
+
+def _cliente_e_monitor():
+    global _pid
+    if _pid != os.getpid():
+        # Processo criado por fork: as conexões do pai não podem ser reaproveitadas
+        _clientes.clear()
+        _pid = os.getpid()
+    loop = asyncio.get_running_loop()
+    if loop not in _clientes:
+        monitor = MonitorDoPool()
+        _clientes[loop] = (_criar_cliente(monitor), monitor)
+    return _clientes[loop]
+
+
+def get_client():
+    """
+    Cliente MongoDB compartilhado, criado no primeiro uso
+    
+    Um AsyncMongoClient pertence ao event loop em que é usado, então há um
+    por loop; sob ASGI há um loop por processo. A autenticação e o pool são
+    feitos uma vez só, não a cada requisição.
+    """
+    return _cliente_e_monitor()[0]
+
+
+# Conexão com MongoDB (driver assíncrono: as views não bloqueiam threads)
+def get_db():
+    return get_client()[settings.MONGO_DB_NAME]
+
+
+async def saude_mongo():
+    """Ping no MongoDB e estado do pool de conexões deste processo"""
+    cliente, monitor = _cliente_e_monitor()
+    inicio = time.perf_counter()
+    try:
+        await cliente.admin.command('ping')
+        erro = None
+    except PyMongoError as e:
+        erro = str(e)
+    pool = cliente.options.pool_options
+    return {
+        'ok': erro is None,
+        'erro': erro,
+        'ping_ms': round((time.perf_counter() - inicio) * 1000, 1),
+        'max_pool_size': pool.max_pool_size,
+        'min_pool_size': pool.min_pool_size,
+        **monitor.stats(),
+    }
+
+
+# Listagem de chats: mais recentes primeiro, com _id para desempatar
+ORDEM_CHATS = [('atualizado_em', DESCENDING), ('_id', DESCENDING)]
+
+# Só o que a barra lateral mostra; as mensagens ficam no banco
+PROJECAO_RESUMO = {
+    'titulo': 1,
+    'modo': 1,
+    'criado_em': 1,
+    'atualizado_em': 1,
+    'total_mensagens': {'$size': {'$ifNull': ['$mensagens', []]}},
+}
+
+
+# Os índices são criados uma vez por processo, na primeira listagem
+_indices_criados = False
+
+
+async def criar_indices():
+    """
+    Cria os índices da coleção de chats, se ainda não existirem
+    
+    Usa o cliente compartilhado do loop, sem abrir conexão no startup do
+    Django. Uma falha é só avisada e a criação é tentada de novo na próxima
+    chamada.
+    """
+    global _indices_criados
+    if _indices_criados:
+        return
+    try:
+        await get_db()['chats'].create_index(ORDEM_CHATS, name='atualizado_em_id')
+        _indices_criados = True
+    except PyMongoError as e:
+        print(f"[WARN] Não foi possível criar os índices do MongoDB: {e}")
+
+
+def codificar_cursor(chat):
+    """Cursor opaco da listagem: a posição (atualizado_em, _id) de um chat"""
+    bruto = f"{chat['atualizado_em'].isoformat()}|{chat['_id']}"
+    return base64.urlsafe_b64encode(bruto.encode('utf-8')).decode('ascii')
+
+
+def decodificar_cursor(cursor):
+    """Posição (atualizado_em, ObjectId) de um cursor; lança ValueError se for inválido"""
+    try:
+        data, chat_id = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8').split('|')
+        return datetime.fromisoformat(data), ObjectId(chat_id)
+    except (ValueError, InvalidId) as e:
+        raise ValueError("Cursor inválido") from e
+
+
+# Funções para gerenciar Chats (todas as operações são corrotinas)
 class ChatManager:
-    def __init__(self):
-        self.db = get_db()
-        self.collection = self.db['chats']
+    """
+    Operações sobre a coleção de chats
     
-    def criar_chat(self, titulo="Novo Chat"):
-        """Cria um novo chat"""
+    Criar um ChatManager não abre conexão: a coleção usa o cliente
+    compartilhado do event loop em que a operação roda.
+    """
+    
+    @property
+    def db(self):
+        return get_db()
+    
+    @property
+    def collection(self):
+        return self.db['chats']
+    
+    async def criar_chat(self, titulo="Novo Chat", modo=None):
+        """Cria um novo chat (modo: fast, balanced ou deep; None usa o padrão da API)"""
         chat = {
             'titulo': titulo,
+            'modo': modo,
             'criado_em': datetime.now(),
             'atualizado_em': datetime.now(),
             'mensagens': []
         }
-        resultado = self.collection.insert_one(chat)
+        resultado = await self.collection.insert_one(chat)
         return str(resultado.inserted_id)
     
-    def adicionar_mensagem(self, chat_id, pergunta, resposta):
+    async def adicionar_mensagem(self, chat_id, pergunta, resposta):
         """Adiciona uma mensagem (pergunta e resposta) a um chat"""
         mensagem = {
             'pergunta': pergunta,
@@ -39,7 +242,7 @@ class ChatManager:
             'timestamp': datetime.now()
         }
         
-        self.collection.update_one(
+        await self.collection.update_one(
             {'_id': ObjectId(chat_id)},
             {
                 '$push': {'mensagens': mensagem},
@@ -48,29 +251,63 @@ class ChatManager:
         )
         return mensagem
     
-    def obter_chat(self, chat_id):
+    async def obter_chat(self, chat_id):
         """Obtém um chat específico"""
-        chat = self.collection.find_one({'_id': ObjectId(chat_id)})
+        chat = await self.collection.find_one({'_id': ObjectId(chat_id)})
         if chat:
             chat['_id'] = str(chat['_id'])
         return chat
     
-    def listar_chats(self):
-        """Lista todos os chats"""
-        chats = list(self.collection.find().sort('atualizado_em', -1))
+    async def obter_historico(self, chat_id, limite):
+        """Retorna as últimas `limite` mensagens de um chat (lista vazia se não existir)"""
+        chat = await self.collection.find_one(
+            {'_id': ObjectId(chat_id)},
+            {'mensagens': {'$slice': -limite}}
+        )
+        return chat.get('mensagens', []) if chat else []
+    
+    async def listar_chats(self, limite=None, cursor=None):
+        """
+        Lista os chats, mais recentes primeiro, sem as mensagens
+        
+        Cada chat traz título, modo, datas e 'total_mensagens'. A paginação é
+        por posição (keyset), servida pelo índice (atualizado_em, _id): com
+        cursor, a lista começa logo depois do chat que gerou o cursor
+        (codificar_cursor). Lança ValueError se o cursor for inválido.
+        """
+        filtro = {}
+        if cursor:
+            atualizado_em, chat_id = decodificar_cursor(cursor)
+            filtro = {'$or': [
+                {'atualizado_em': {'$lt': atualizado_em}},
+                {'atualizado_em': atualizado_em, '_id': {'$lt': chat_id}},
+            ]}
+        await criar_indices()
+        busca = self.collection.find(filtro, PROJECAO_RESUMO).sort(ORDEM_CHATS)
+        if limite:
+            busca = busca.limit(limite)
+        chats = await busca.to_list()
         for chat in chats:
             chat['_id'] = str(chat['_id'])
         return chats
     
-    def deletar_chat(self, chat_id):
+    async def deletar_chat(self, chat_id):
         """Deleta um chat"""
-        resultado = self.collection.delete_one({'_id': ObjectId(chat_id)})
+        resultado = await self.collection.delete_one({'_id': ObjectId(chat_id)})
         return resultado.deleted_count > 0
     
-    def atualizar_titulo(self, chat_id, novo_titulo):
+    async def atualizar_titulo(self, chat_id, novo_titulo):
         """Atualiza o título de um chat"""
-        self.collection.update_one(
+        await self.collection.update_one(
             {'_id': ObjectId(chat_id)},
             {'$set': {'titulo': novo_titulo, 'atualizado_em': datetime.now()}}
         )
         return True
+    
+    async def atualizar_modo(self, chat_id, modo):
+        """Atualiza o modo de geração usado nas próximas perguntas do chat"""
+        await self.collection.update_one(
+            {'_id': ObjectId(chat_id)},
+            {'$set': {'modo': modo, 'atualizado_em': datetime.now()}}
+        )
+        return True
@@ -197,21 +197,40 @@ async function criarNovoChat() {
   inputBox.focus();
 }
 
-async function carregarChats() {
+// Cursor da próxima página da lista de chats (null = não há mais)
+let proximoCursorChats = null;
+
+async function carregarChats(cursor = null) {
   try {
-    const res = await fetch("http://localhost:8001/chats/");
+    const url = cursor
+      ? `http://localhost:8001/chats/?cursor=${encodeURIComponent(cursor)}`
+      : "http://localhost:8001/chats/";
+    const res = await fetch(url);
     const data = await res.json();
 
-    chatList.innerHTML = "";
+    // Primeira página substitui a lista; as seguintes são acrescentadas
+    if (!cursor) chatList.innerHTML = "";
+    const botaoMais = document.getElementById("carregarMaisChats");
+    if (botaoMais) botaoMais.remove();
 
     if (data.chats && data.chats.length > 0) {
       data.chats.forEach((chat) => {
         adicionarChatNaLista(chat);
       });
-    } else {
+    } else if (!cursor) {
       chatList.innerHTML =
         '<div style="padding: 15px; text-align: center; color: #9ca3af; font-size: 13px;">Nenhum chat ainda</div>';
     }
+
+    proximoCursorChats = data.next_cursor || null;
+    if (proximoCursorChats) {
+      const botao = document.createElement("button");
+      botao.id = "carregarMaisChats";
+      botao.className = "load-more-chats";
+      botao.textContent = "Carregar mais";
+      botao.onclick = () => carregarChats(proximoCursorChats);
+      chatList.appendChild(botao);
+    }
   } catch (err) {
     console.error("Erro ao carregar chats:", err);
   }
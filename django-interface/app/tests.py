@@ -1,10 +1,37 @@
-from django.test import TestCase, Client
+from django.test import TestCase, SimpleTestCase, Client
 from django.urls import reverse
-from unittest.mock import patch, MagicMock, Mock
+from unittest.mock import patch, AsyncMock
+from asgiref.sync import async_to_sync
+import httpx
 import json
 from datetime import datetime
 from bson import ObjectId
-from .models import ChatManager
+from .models import ChatManager, get_client
+from .model_api import ModelAPIClient
+
+
+
+def limpar_chats():
+    """Esvazia a coleção de chats (setUp/tearDown são síncronos e o ChatManager é assíncrono)"""
+    async def limpar():
+        await ChatManager().collection.delete_many({})
+    async_to_sync(limpar)()
+
+
+def resposta_da_api(dados=None, linhas=None, status=200):
+    """Resposta simulada da API do modelo: JSON ou as linhas de um streaming SSE"""
+    if linhas is not None:
+        return httpx.Response(status, content="\n".join(linhas).encode('utf-8') + b"\n")
+    return httpx.Response(status, json=dados)
+
+
+def corpo_enviado(mock_send):
+    """JSON da última requisição enviada à API do modelo"""
+    return json.loads(mock_send.call_args.args[0].content)
+
+
+async def ler_streaming(response):
+    return b''.join([parte async for parte in response.streaming_content]).decode('utf-8')
 
 
 class ChatManagerTestCase(TestCase):
@@ -14,16 +41,16 @@ class ChatManagerTestCase(TestCase):
         """Configuração inicial para cada teste"""
         self.chat_manager = ChatManager()
         # Limpa a coleção antes de cada teste
-        self.chat_manager.collection.delete_many({})
+        limpar_chats()
     
     def tearDown(self):
         """Limpeza após cada teste"""
         # Limpa a coleção após cada teste
-        self.chat_manager.collection.delete_many({})
+        limpar_chats()
     
-    def test_criar_chat_retorna_id_valido(self):
+    async def test_criar_chat_retorna_id_valido(self):
         """Testa se criar_chat retorna um ID válido"""
-        chat_id = self.chat_manager.criar_chat(titulo="Teste Chat")
+        chat_id = await self.chat_manager.criar_chat(titulo="Teste Chat")
         
         # Verifica se o ID não é None
         self.assertIsNotNone(chat_id)
@@ -32,35 +59,35 @@ class ChatManagerTestCase(TestCase):
         # Verifica se tem o formato de ObjectId
         self.assertTrue(len(chat_id) == 24)
     
-    def test_criar_chat_com_titulo_customizado(self):
+    async def test_criar_chat_com_titulo_customizado(self):
         """Testa se o chat é criado com o título correto"""
         titulo = "Meu Chat Personalizado"
-        chat_id = self.chat_manager.criar_chat(titulo=titulo)
+        chat_id = await self.chat_manager.criar_chat(titulo=titulo)
         
         # Busca o chat criado
-        chat = self.chat_manager.obter_chat(chat_id)
+        chat = await self.chat_manager.obter_chat(chat_id)
         
         # Verifica se o título está correto
         self.assertEqual(chat['titulo'], titulo)
         # Verifica se mensagens está vazio
         self.assertEqual(len(chat['mensagens']), 0)
     
-    def test_criar_chat_com_titulo_padrao(self):
+    async def test_criar_chat_com_titulo_padrao(self):
         """Testa se o chat usa título padrão quando não fornecido"""
-        chat_id = self.chat_manager.criar_chat()
-        chat = self.chat_manager.obter_chat(chat_id)
+        chat_id = await self.chat_manager.criar_chat()
+        chat = await self.chat_manager.obter_chat(chat_id)
         
         self.assertEqual(chat['titulo'], "Novo Chat")
     
-    def test_adicionar_mensagem_ao_chat(self):
+    async def test_adicionar_mensagem_ao_chat(self):
         """Testa adicionar mensagem a um chat"""
         # Cria um chat
-        chat_id = self.chat_manager.criar_chat(titulo="Chat Teste")
+        chat_id = await self.chat_manager.criar_chat(titulo="Chat Teste")
         
         # Adiciona mensagem
         pergunta = "Qual é a capital do Brasil?"
         resposta = "A capital do Brasil é Brasília."
-        mensagem = self.chat_manager.adicionar_mensagem(chat_id, pergunta, resposta)
+        mensagem = await self.chat_manager.adicionar_mensagem(chat_id, pergunta, resposta)
         
         # Verifica se a mensagem foi retornada
         self.assertIsNotNone(mensagem)
@@ -69,24 +96,24 @@ class ChatManagerTestCase(TestCase):
         self.assertIsNotNone(mensagem['timestamp'])
         
         # Busca o chat e verifica se a mensagem está lá
-        chat = self.chat_manager.obter_chat(chat_id)
+        chat = await self.chat_manager.obter_chat(chat_id)
         self.assertEqual(len(chat['mensagens']), 1)
         self.assertEqual(chat['mensagens'][0]['pergunta'], pergunta)
     
-    def test_adicionar_multiplas_mensagens(self):
+    async def test_adicionar_multiplas_mensagens(self):
         """Testa adicionar várias mensagens ao mesmo chat"""
-        chat_id = self.chat_manager.criar_chat(titulo="Chat Múltiplas Mensagens")
+        chat_id = await self.chat_manager.criar_chat(titulo="Chat Múltiplas Mensagens")
         
         # Adiciona 5 mensagens
         for i in range(5):
-            self.chat_manager.adicionar_mensagem(
+            await self.chat_manager.adicionar_mensagem(
                 chat_id, 
                 f"Pergunta {i+1}",
                 f"Resposta {i+1}"
             )
         
         # Verifica se todas foram adicionadas
-        chat = self.chat_manager.obter_chat(chat_id)
+        chat = await self.chat_manager.obter_chat(chat_id)
         self.assertEqual(len(chat['mensagens']), 5)
         
         # Verifica se estão na ordem correta
@@ -94,75 +121,99 @@ class ChatManagerTestCase(TestCase):
             self.assertEqual(msg['pergunta'], f"Pergunta {i+1}")
             self.assertEqual(msg['resposta'], f"Resposta {i+1}")
     
-    def test_obter_chat_inexistente_retorna_none(self):
+    async def test_obter_chat_inexistente_retorna_none(self):
         """Testa buscar um chat que não existe"""
         # Cria um ObjectId falso
         chat_id_fake = str(ObjectId())
         
-        chat = self.chat_manager.obter_chat(chat_id_fake)
+        chat = await self.chat_manager.obter_chat(chat_id_fake)
         self.assertIsNone(chat)
     
-    def test_listar_chats_vazio(self):
+    async def test_listar_chats_vazio(self):
         """Testa listar chats quando não há nenhum"""
-        chats = self.chat_manager.listar_chats()
+        chats = await self.chat_manager.listar_chats()
         self.assertEqual(len(chats), 0)
         self.assertTrue(isinstance(chats, list))
     
-    def test_listar_chats_com_multiplos_chats(self):
+    async def test_listar_chats_com_multiplos_chats(self):
         """Testa listar vários chats"""
         # Cria 3 chats
         titulos = ["Chat 1", "Chat 2", "Chat 3"]
         for titulo in titulos:
-            self.chat_manager.criar_chat(titulo=titulo)
+            await self.chat_manager.criar_chat(titulo=titulo)
         
         # Lista todos
-        chats = self.chat_manager.listar_chats()
+        chats = await self.chat_manager.listar_chats()
         
         self.assertEqual(len(chats), 3)
         # Verifica se todos têm _id convertido para string
         for chat in chats:
             self.assertTrue(isinstance(chat['_id'], str))
     
-    def test_deletar_chat_existente(self):
+    async def test_listar_chats_traz_resumo_sem_mensagens(self):
+        """Testa se a listagem traz a contagem de mensagens em vez das mensagens"""
+        chat_id = await self.chat_manager.criar_chat(titulo="Chat Resumo")
+        await self.chat_manager.adicionar_mensagem(chat_id, "Pergunta 1", "Resposta 1")
+        await self.chat_manager.adicionar_mensagem(chat_id, "Pergunta 2", "Resposta 2")
+        
+        chats = await self.chat_manager.listar_chats()
+        
+        self.assertNotIn('mensagens', chats[0])
+        self.assertEqual(chats[0]['total_mensagens'], 2)
+        self.assertEqual(chats[0]['titulo'], "Chat Resumo")
+    
+    async def test_listar_chats_cria_indice_da_ordem(self):
+        """Testa se a primeira listagem cria o índice (atualizado_em, _id) que serve a paginação"""
+        await self.chat_manager.listar_chats()
+        
+        indices = await self.chat_manager.collection.index_information()
+        self.assertIn('atualizado_em_id', indices)
+    
+    async def test_deletar_chat_existente(self):
         """Testa deletar um chat que existe"""
         # Cria um chat
-        chat_id = self.chat_manager.criar_chat(titulo="Chat para Deletar")
+        chat_id = await self.chat_manager.criar_chat(titulo="Chat para Deletar")
         
         # Deleta o chat
-        sucesso = self.chat_manager.deletar_chat(chat_id)
+        sucesso = await self.chat_manager.deletar_chat(chat_id)
         
         self.assertTrue(sucesso)
         
         # Verifica se realmente foi deletado
-        chat = self.chat_manager.obter_chat(chat_id)
+        chat = await self.chat_manager.obter_chat(chat_id)
         self.assertIsNone(chat)
     
-    def test_deletar_chat_inexistente(self):
+    async def test_deletar_chat_inexistente(self):
         """Testa deletar um chat que não existe"""
         chat_id_fake = str(ObjectId())
         
-        sucesso = self.chat_manager.deletar_chat(chat_id_fake)
+        sucesso = await self.chat_manager.deletar_chat(chat_id_fake)
         self.assertFalse(sucesso)
     
-    def test_atualizar_titulo_chat(self):
+    async def test_atualizar_titulo_chat(self):
         """Testa atualizar o título de um chat"""
         # Cria um chat
-        chat_id = self.chat_manager.criar_chat(titulo="Título Original")
+        chat_id = await self.chat_manager.criar_chat(titulo="Título Original")
         
         # Atualiza o título
         novo_titulo = "Título Atualizado"
-        resultado = self.chat_manager.atualizar_titulo(chat_id, novo_titulo)
+        resultado = await self.chat_manager.atualizar_titulo(chat_id, novo_titulo)
         
         self.assertTrue(resultado)
         
         # Verifica se foi atualizado
-        chat = self.chat_manager.obter_chat(chat_id)
+        chat = await self.chat_manager.obter_chat(chat_id)
         self.assertEqual(chat['titulo'], novo_titulo)
     
-    def test_chat_tem_timestamps_validos(self):
+    async def test_gerenciadores_compartilham_o_cliente(self):
+        """Testa se cada ChatManager usa o mesmo cliente (e pool) em vez de abrir conexões novas"""
+        self.assertIs(ChatManager().collection.database.client, self.chat_manager.collection.database.client)
+        self.assertIs(get_client(), get_client())
+    
+    async def test_chat_tem_timestamps_validos(self):
         """Testa se os timestamps são criados corretamente"""
-        chat_id = self.chat_manager.criar_chat(titulo="Chat com Timestamps")
-        chat = self.chat_manager.obter_chat(chat_id)
+        chat_id = await self.chat_manager.criar_chat(titulo="Chat com Timestamps")
+        chat = await self.chat_manager.obter_chat(chat_id)
         
         # Verifica se criado_em existe e é datetime
         self.assertIsNotNone(chat['criado_em'])
@@ -181,11 +232,11 @@ class ViewsTestCase(TestCase):
         self.client = Client()
         self.chat_manager = ChatManager()
         # Limpa a coleção antes de cada teste
-        self.chat_manager.collection.delete_many({})
+        limpar_chats()
     
     def tearDown(self):
         """Limpeza após cada teste"""
-        self.chat_manager.collection.delete_many({})
+        limpar_chats()
     
     def test_index_retorna_200(self):
         """Testa se a página inicial carrega com sucesso"""
@@ -194,19 +245,16 @@ class ViewsTestCase(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertTemplateUsed(response, 'index.html')
     
-    @patch('requests.post')
-    def test_pergunta_endpoint_com_nova_pergunta(self, mock_post):
+    @patch('httpx.AsyncClient.send', new_callable=AsyncMock)
+    async def test_pergunta_endpoint_com_nova_pergunta(self, mock_send):
         """Testa o endpoint de pergunta criando novo chat"""
         # Mock da resposta da API externa
-        mock_response = MagicMock()
-        mock_response.status_code = 200
-        mock_response.json.return_value = {
+        mock_send.return_value = resposta_da_api({
             'response': 'Esta é uma resposta de teste'
-        }
-        mock_post.return_value = mock_response
+        })
         
         # Faz a requisição
-        response = self.client.post(
+        response = await self.async_client.post(
             reverse('app:pergunta'),
             data=json.dumps({
                 'question': 'Qual é a capital da França?'
@@ -224,9 +272,136 @@ class ViewsTestCase(TestCase):
         self.assertIsNotNone(data['chat_id'])
         self.assertEqual(data['response'], 'Esta é uma resposta de teste')
     
-    def test_pergunta_endpoint_sem_pergunta(self):
+    @patch('httpx.AsyncClient.send', new_callable=AsyncMock)
+    async def test_pergunta_com_modo_salva_no_chat(self, mock_send):
+        """Testa se o modo enviado vai para a API e fica salvo no chat"""
+        mock_send.return_value = resposta_da_api({'response': 'Paris'})
+        
+        response = await self.async_client.post(
+            reverse('app:pergunta'),
+            data=json.dumps({'question': 'Qual é a capital da França?', 'mode': 'fast'}),
+            content_type='application/json'
+        )
+        
+        self.assertEqual(response.status_code, 200)
+        chat_id = response.json()['chat_id']
+        self.assertEqual(corpo_enviado(mock_send)['mode'], 'fast')
+        self.assertEqual((await self.chat_manager.obter_chat(chat_id))['modo'], 'fast')
+        
+        # Próxima pergunta do mesmo chat usa o modo salvo
+        await self.async_client.post(
+            reverse('app:pergunta'),
+            data=json.dumps({'question': 'E da Itália?', 'chat_id': chat_id}),
+            content_type='application/json'
+        )
+        self.assertEqual(corpo_enviado(mock_send)['mode'], 'fast')
+    
+    @patch('httpx.AsyncClient.send', new_callable=AsyncMock)
+    async def test_pergunta_envia_historico_do_chat(self, mock_send):
+        """Testa se as perguntas seguintes de um chat levam o histórico e o session_id"""
+        mock_send.return_value = resposta_da_api({'response': 'Paris'})
+        
+        response = await self.async_client.post(
+            reverse('app:pergunta'),
+            data=json.dumps({'question': 'Qual é a capital da França?'}),
+            content_type='application/json'
+        )
+        chat_id = response.json()['chat_id']
+        self.assertNotIn('history', corpo_enviado(mock_send))
+        
+        await self.async_client.post(
+            reverse('app:pergunta'),
+            data=json.dumps({'question': 'E a população?', 'chat_id': chat_id}),
+            content_type='application/json'
+        )
+        corpo = corpo_enviado(mock_send)
+        self.assertEqual(corpo['session_id'], chat_id)
+        self.assertEqual(corpo['history'], [{'question': 'Qual é a capital da França?', 'response': 'Paris'}])
+    
+    @patch('httpx.AsyncClient.send', new_callable=AsyncMock)
+    async def test_pergunta_stream_repassa_tokens_e_salva_no_fim(self, mock_send):
+        """Testa se o streaming repassa os pedaços da API como palavras e salva a resposta ao final"""
+        eventos = [
+            {'type': 'queue', 'position': 0, 'estimated_wait_s': 0.0},
+            {'type': 'thinking_chunk', 'content': 'Capital da Fr'},
+            {'type': 'thinking_chunk', 'content': 'ança'},
+            {'type': 'response_chunk', 'content': 'Pa'},
+            {'type': 'response_chunk', 'content': 'ris.'},
+            {'type': 'done', 'stop_reason': 'stop'},
+        ]
+        mock_send.return_value = resposta_da_api(linhas=[f"data: {json.dumps(e)}\n" for e in eventos])
+        
+        response = await self.async_client.post(
+            reverse('app:pergunta_stream'),
+            data=json.dumps({'question': 'Qual é a capital da França?'}),
+            content_type='application/json'
+        )
+        conteudo = await ler_streaming(response)
+        
+        self.assertTrue(str(mock_send.call_args.args[0].url).endswith('/pergunta-stream'))
+        self.assertTrue(mock_send.call_args.kwargs['stream'])
+        self.assertIn('event: thinking\ndata: {"word": "Fran\\u00e7a", "index": 2}', conteudo)
+        self.assertIn('event: response\ndata: {"word": "Paris.", "index": 0}', conteudo)
+        self.assertIn('event: complete', conteudo)
+        
+        chats = await self.chat_manager.listar_chats()
+        self.assertEqual(len(chats), 1)
+        chat = await self.chat_manager.obter_chat(chats[0]['_id'])
+        self.assertEqual(chat['mensagens'][0]['resposta'], 'Paris.')
+    
+    @patch('httpx.AsyncClient.send', new_callable=AsyncMock)
+    async def test_pergunta_stream_interrompido_nao_salva(self, mock_send):
+        """Testa se um streaming que termina sem 'done' gera erro e não salva a mensagem"""
+        mock_send.return_value = resposta_da_api(linhas=['data: {"type": "response_chunk", "content": "Par"}'])
+        
+        response = await self.async_client.post(
+            reverse('app:pergunta_stream'),
+            data=json.dumps({'question': 'Qual é a capital da França?'}),
+            content_type='application/json'
+        )
+        conteudo = await ler_streaming(response)
+        
+        self.assertIn('event: error', conteudo)
+        self.assertNotIn('event: complete', conteudo)
+        self.assertEqual(len(await self.chat_manager.listar_chats()), 0)
+    
+    async def test_estatisticas_mongo(self):
+        """Testa se a saúde do pool do MongoDB responde com ping e contagem de conexões"""
+        await self.chat_manager.listar_chats()
+        response = await self.async_client.get(reverse('app:estatisticas_mongo'))
+        
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertTrue(data['ok'])
+        self.assertGreaterEqual(data['conexoes_abertas'], 1)
+    
+    async def test_pergunta_com_modo_invalido(self):
+        """Testa se um modo desconhecido é recusado"""
+        response = await self.async_client.post(
+            reverse('app:pergunta'),
+            data=json.dumps({'question': 'Qual é a capital da França?', 'mode': 'turbo'}),
+            content_type='application/json'
+        )
+        
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('error', response.json())
+    
+    async def test_atualizar_modo_endpoint(self):
+        """Testa trocar o modo de um chat via endpoint"""
+        chat_id = await self.chat_manager.criar_chat(titulo="Chat Modo")
+        
+        response = await self.async_client.put(
+            reverse('app:atualizar_modo_chat', kwargs={'chat_id': chat_id}),
+            data=json.dumps({'mode': 'deep'}),
+            content_type='application/json'
+        )
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((await self.chat_manager.obter_chat(chat_id))['modo'], 'deep')
+    
+    async def test_pergunta_endpoint_sem_pergunta(self):
         """Testa o endpoint de pergunta sem enviar pergunta"""
-        response = self.client.post(
+        response = await self.async_client.post(
             reverse('app:pergunta'),
             data=json.dumps({'question': ''}),
             content_type='application/json'
@@ -237,9 +412,9 @@ class ViewsTestCase(TestCase):
         self.assertIn('error', data)
         self.assertEqual(data['error'], 'Pergunta não fornecida')
     
-    def test_criar_chat_endpoint(self):
+    async def test_criar_chat_endpoint(self):
         """Testa o endpoint de criar chat"""
-        response = self.client.post(
+        response = await self.async_client.post(
             reverse('app:criar_chat'),
             data=json.dumps({'titulo': 'Novo Chat Teste'}),
             content_type='application/json'
@@ -252,9 +427,9 @@ class ViewsTestCase(TestCase):
         self.assertEqual(data['titulo'], 'Novo Chat Teste')
         self.assertIn('mensagem', data)
     
-    def test_listar_chats_endpoint_vazio(self):
+    async def test_listar_chats_endpoint_vazio(self):
         """Testa listar chats quando não há nenhum"""
-        response = self.client.get(reverse('app:listar_chats'))
+        response = await self.async_client.get(reverse('app:listar_chats'))
         
         self.assertEqual(response.status_code, 200)
         data = response.json()
@@ -263,31 +438,57 @@ class ViewsTestCase(TestCase):
         self.assertEqual(len(data['chats']), 0)
         self.assertTrue(isinstance(data['chats'], list))
     
-    def test_listar_chats_endpoint_com_chats(self):
+    async def test_listar_chats_endpoint_com_chats(self):
         """Testa listar chats quando há chats criados"""
         # Cria alguns chats
-        self.chat_manager.criar_chat(titulo="Chat 1")
-        self.chat_manager.criar_chat(titulo="Chat 2")
+        await self.chat_manager.criar_chat(titulo="Chat 1")
+        await self.chat_manager.criar_chat(titulo="Chat 2")
         
-        response = self.client.get(reverse('app:listar_chats'))
+        response = await self.async_client.get(reverse('app:listar_chats'))
         
         self.assertEqual(response.status_code, 200)
         data = response.json()
         
         self.assertEqual(len(data['chats']), 2)
+        self.assertIsNone(data['next_cursor'])
+    
+    async def test_listar_chats_endpoint_paginado(self):
+        """Testa se as páginas seguem o cursor sem repetir nem pular chats"""
+        for i in range(5):
+            await self.chat_manager.criar_chat(titulo=f"Chat {i}")
+        
+        titulos, cursor = [], None
+        for _ in range(3):
+            parametros = {'limit': 2, **({'cursor': cursor} if cursor else {})}
+            response = await self.async_client.get(reverse('app:listar_chats'), parametros)
+            self.assertEqual(response.status_code, 200)
+            data = response.json()
+            titulos += [chat['titulo'] for chat in data['chats']]
+            cursor = data['next_cursor']
+        
+        # Mais recentes primeiro
+        self.assertEqual(titulos, [f"Chat {i}" for i in reversed(range(5))])
+        self.assertIsNone(cursor)
+    
+    async def test_listar_chats_endpoint_cursor_invalido(self):
+        """Testa se um cursor inválido é recusado"""
+        response = await self.async_client.get(reverse('app:listar_chats'), {'cursor': 'invalido'})
+        
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('error', response.json())
     
-    def test_obter_chat_existente(self):
+    async def test_obter_chat_existente(self):
         """Testa obter um chat específico que existe"""
         # Cria um chat
-        chat_id = self.chat_manager.criar_chat(titulo="Chat Específico")
-        self.chat_manager.adicionar_mensagem(
+        chat_id = await self.chat_manager.criar_chat(titulo="Chat Específico")
+        await self.chat_manager.adicionar_mensagem(
             chat_id, 
             "Pergunta teste", 
             "Resposta teste"
         )
         
         # Busca o chat
-        response = self.client.get(
+        response = await self.async_client.get(
             reverse('app:obter_chat', kwargs={'chat_id': chat_id})
         )
         
@@ -298,11 +499,11 @@ class ViewsTestCase(TestCase):
         self.assertEqual(data['chat']['titulo'], "Chat Específico")
         self.assertEqual(len(data['chat']['mensagens']), 1)
     
-    def test_obter_chat_inexistente(self):
+    async def test_obter_chat_inexistente(self):
         """Testa obter um chat que não existe"""
         chat_id_fake = str(ObjectId())
         
-        response = self.client.get(
+        response = await self.async_client.get(
             reverse('app:obter_chat', kwargs={'chat_id': chat_id_fake})
         )
         
@@ -310,13 +511,13 @@ class ViewsTestCase(TestCase):
         data = response.json()
         self.assertIn('error', data)
     
-    def test_deletar_chat_endpoint(self):
+    async def test_deletar_chat_endpoint(self):
         """Testa deletar um chat via endpoint"""
         # Cria um chat
-        chat_id = self.chat_manager.criar_chat(titulo="Chat para Deletar")
+        chat_id = await self.chat_manager.criar_chat(titulo="Chat para Deletar")
         
         # Deleta via endpoint
-        response = self.client.delete(
+        response = await self.async_client.delete(
             reverse('app:deletar_chat', kwargs={'chat_id': chat_id})
         )
         
@@ -325,14 +526,14 @@ class ViewsTestCase(TestCase):
         self.assertIn('mensagem', data)
         
         # Verifica se foi realmente deletado
-        chat = self.chat_manager.obter_chat(chat_id)
+        chat = await self.chat_manager.obter_chat(chat_id)
         self.assertIsNone(chat)
     
-    def test_deletar_chat_inexistente_endpoint(self):
+    async def test_deletar_chat_inexistente_endpoint(self):
         """Testa deletar um chat que não existe via endpoint"""
         chat_id_fake = str(ObjectId())
         
-        response = self.client.delete(
+        response = await self.async_client.delete(
             reverse('app:deletar_chat', kwargs={'chat_id': chat_id_fake})
         )
         
@@ -340,13 +541,13 @@ class ViewsTestCase(TestCase):
         data = response.json()
         self.assertIn('error', data)
     
-    def test_atualizar_titulo_endpoint(self):
+    async def test_atualizar_titulo_endpoint(self):
         """Testa atualizar título via endpoint"""
         # Cria um chat
-        chat_id = self.chat_manager.criar_chat(titulo="Título Original")
+        chat_id = await self.chat_manager.criar_chat(titulo="Título Original")
         
         # Atualiza o título
-        response = self.client.put(
+        response = await self.async_client.put(
             reverse('app:atualizar_titulo_chat', kwargs={'chat_id': chat_id}),
             data=json.dumps({'titulo': 'Título Novo'}),
             content_type='application/json'
@@ -357,14 +558,14 @@ class ViewsTestCase(TestCase):
         self.assertIn('mensagem', data)
         
         # Verifica se foi atualizado
-        chat = self.chat_manager.obter_chat(chat_id)
+        chat = await self.chat_manager.obter_chat(chat_id)
         self.assertEqual(chat['titulo'], 'Título Novo')
     
-    def test_atualizar_titulo_sem_titulo(self):
+    async def test_atualizar_titulo_sem_titulo(self):
         """Testa atualizar título sem fornecer título"""
-        chat_id = self.chat_manager.criar_chat(titulo="Chat Teste")
+        chat_id = await self.chat_manager.criar_chat(titulo="Chat Teste")
         
-        response = self.client.put(
+        response = await self.async_client.put(
             reverse('app:atualizar_titulo_chat', kwargs={'chat_id': chat_id}),
             data=json.dumps({}),
             content_type='application/json'
@@ -374,18 +575,18 @@ class ViewsTestCase(TestCase):
         data = response.json()
         self.assertIn('error', data)
     
-    def test_download_json_endpoint(self):
+    async def test_download_json_endpoint(self):
         """Testa download de chat em formato JSON"""
         # Cria um chat com mensagens
-        chat_id = self.chat_manager.criar_chat(titulo="Chat Download JSON")
-        self.chat_manager.adicionar_mensagem(
+        chat_id = await self.chat_manager.criar_chat(titulo="Chat Download JSON")
+        await self.chat_manager.adicionar_mensagem(
             chat_id,
             "Pergunta 1",
             "Resposta 1"
         )
         
         # Faz o download
-        response = self.client.get(
+        response = await self.async_client.get(
             reverse('app:download-json', kwargs={'chat_id': chat_id})
         )
         
@@ -399,18 +600,18 @@ class ViewsTestCase(TestCase):
         self.assertEqual(data['titulo'], "Chat Download JSON")
         self.assertEqual(len(data['mensagens']), 1)
     
-    def test_download_csv_endpoint(self):
+    async def test_download_csv_endpoint(self):
         """Testa download de chat em formato CSV"""
         # Cria um chat com mensagens
-        chat_id = self.chat_manager.criar_chat(titulo="Chat Download CSV")
-        self.chat_manager.adicionar_mensagem(
+        chat_id = await self.chat_manager.criar_chat(titulo="Chat Download CSV")
+        await self.chat_manager.adicionar_mensagem(
             chat_id,
             "Pergunta CSV",
             "Resposta CSV"
         )
         
         # Faz o download
-        response = self.client.get(
+        response = await self.async_client.get(
             reverse('app:download-csv', kwargs={'chat_id': chat_id})
         )
         
@@ -424,11 +625,11 @@ class ViewsTestCase(TestCase):
         self.assertIn('Resposta', content)
         self.assertIn('Pergunta CSV', content)
     
-    def test_download_json_chat_inexistente(self):
+    async def test_download_json_chat_inexistente(self):
         """Testa download JSON de chat que não existe"""
         chat_id_fake = str(ObjectId())
         
-        response = self.client.get(
+        response = await self.async_client.get(
             reverse('app:download-json', kwargs={'chat_id': chat_id_fake})
         )
         
@@ -437,6 +638,76 @@ class ViewsTestCase(TestCase):
         self.assertIn('error', data)
 
 
+class ModelAPIClientTestCase(SimpleTestCase):
+    """Testes para o cliente HTTP da API do modelo"""
+    
+    def criar_cliente(self, urls, responder, **kwargs):
+        """Cliente cujas requisições são respondidas por `responder` (sem rede); guarda as requisições"""
+        self.requisicoes = []
+        
+        def handler(request):
+            self.requisicoes.append(request)
+            return responder(request)
+        
+        return ModelAPIClient(urls, backoff=0, transport=httpx.MockTransport(handler), **kwargs)
+    
+    def test_mesmo_chat_vai_sempre_para_a_mesma_instancia(self):
+        """Testa se as perguntas de um chat ficam na instância que tem o cache KV da conversa"""
+        cliente = ModelAPIClient(["http://a:8000", "http://b:8000", "http://c:8000"])
+        
+        primeiras = {cliente._ordem_das_urls(sessao="chat-1")[0] for _ in range(5)}
+        self.assertEqual(len(primeiras), 1)
+        # Sem sessão as instâncias se revezam
+        sem_sessao = [cliente._ordem_das_urls()[0] for _ in range(3)]
+        self.assertEqual(sorted(sem_sessao), cliente.urls)
+    
+    async def test_usa_url_base_e_timeouts_configurados(self):
+        """Testa se o caminho é montado sobre a URL base com timeouts de conexão e leitura"""
+        cliente = self.criar_cliente(["http://modelo:9000"], lambda r: httpx.Response(200, json={}),
+                                     connect_timeout=1.5, read_timeout=30)
+        await cliente.post("/pergunta", json={'question': 'Oi'})
+        
+        self.assertEqual(str(self.requisicoes[0].url), "http://modelo:9000/pergunta")
+        timeout = self.requisicoes[0].extensions['timeout']
+        self.assertEqual((timeout['connect'], timeout['read']), (1.5, 30))
+        self.assertEqual(cliente.stats()['requisicoes'], 1)
+    
+    async def test_503_so_e_repetido_em_metodo_idempotente(self):
+        """Testa se DELETE é repetido após 503 e POST não (a API pode já ter gerado a resposta)"""
+        cliente = self.criar_cliente(["http://modelo:9000"], lambda r: httpx.Response(503), retries=2)
+        
+        resposta = await cliente.delete("/sessoes/abc")
+        self.assertEqual((resposta.status_code, len(self.requisicoes)), (503, 3))
+        
+        self.requisicoes.clear()
+        await cliente.post("/pergunta", json={'question': 'Oi'})
+        self.assertEqual(len(self.requisicoes), 1)
+    
+    async def test_instancia_fora_do_ar_e_pulada(self):
+        """Testa se uma falha de conexão passa a pergunta para a próxima instância"""
+        def responder(request):
+            if request.url.host == "a":
+                raise httpx.ConnectError("conexão recusada", request=request)
+            return httpx.Response(200, json={'response': 'ok'})
+        
+        cliente = self.criar_cliente(["http://a:8000", "http://b:8000"], responder, retries=1)
+        cliente._ordem_das_urls = lambda sessao=None: cliente.urls
+        
+        resposta = await cliente.post("/pergunta", json={'question': 'Oi'})
+        self.assertEqual(resposta.json(), {'response': 'ok'})
+        self.assertEqual([r.url.host for r in self.requisicoes], ["a", "a", "b"])
+        self.assertEqual(cliente.stats()['trocas_de_instancia'], 1)
+    
+    async def test_stats_sem_pool_interno(self):
+        """Testa se as estatísticas funcionam com um transporte que não expõe o pool do httpcore"""
+        cliente = self.criar_cliente(["http://modelo:9000"], lambda r: httpx.Response(200, json={}))
+        await cliente.post("/pergunta", json={'question': 'Oi'})
+        
+        stats = cliente.stats()
+        self.assertIsNone(stats['conexoes_abertas'])
+        self.assertEqual((stats['requisicoes'], stats['falhas']), (1, 0))
+
+
 class IntegrationTestCase(TestCase):
     """Testes de integração completos"""
     
@@ -444,16 +715,16 @@ class IntegrationTestCase(TestCase):
         """Configuração inicial"""
         self.client = Client()
         self.chat_manager = ChatManager()
-        self.chat_manager.collection.delete_many({})
+        limpar_chats()
     
     def tearDown(self):
         """Limpeza"""
-        self.chat_manager.collection.delete_many({})
+        limpar_chats()
     
-    def test_fluxo_completo_criar_chat_adicionar_mensagens_deletar(self):
+    async def test_fluxo_completo_criar_chat_adicionar_mensagens_deletar(self):
         """Testa um fluxo completo de uso da aplicação"""
         # 1. Cria um chat
-        response_criar = self.client.post(
+        response_criar = await self.async_client.post(
             reverse('app:criar_chat'),
             data=json.dumps({'titulo': 'Chat Integração'}),
             content_type='application/json'
@@ -463,14 +734,14 @@ class IntegrationTestCase(TestCase):
         
         # 2. Adiciona mensagens
         for i in range(3):
-            self.chat_manager.adicionar_mensagem(
+            await self.chat_manager.adicionar_mensagem(
                 chat_id,
                 f"Pergunta {i+1}",
                 f"Resposta {i+1}"
             )
         
         # 3. Busca o chat e verifica
-        response_obter = self.client.get(
+        response_obter = await self.async_client.get(
             reverse('app:obter_chat', kwargs={'chat_id': chat_id})
         )
         self.assertEqual(response_obter.status_code, 200)
@@ -478,7 +749,7 @@ class IntegrationTestCase(TestCase):
         self.assertEqual(len(chat_data['mensagens']), 3)
         
         # 4. Atualiza o título
-        response_atualizar = self.client.put(
+        response_atualizar = await self.async_client.put(
             reverse('app:atualizar_titulo_chat', kwargs={'chat_id': chat_id}),
             data=json.dumps({'titulo': 'Chat Atualizado'}),
             content_type='application/json'
@@ -486,19 +757,19 @@ class IntegrationTestCase(TestCase):
         self.assertEqual(response_atualizar.status_code, 200)
         
         # 5. Verifica atualização
-        chat = self.chat_manager.obter_chat(chat_id)
+        chat = await self.chat_manager.obter_chat(chat_id)
         self.assertEqual(chat['titulo'], 'Chat Atualizado')
         
         # 6. Deleta o chat
-        response_deletar = self.client.delete(
+        response_deletar = await self.async_client.delete(
             reverse('app:deletar_chat', kwargs={'chat_id': chat_id})
         )
         self.assertEqual(response_deletar.status_code, 200)
         
         # 7. Verifica que foi deletado
-        chat_deletado = self.chat_manager.obter_chat(chat_id)
+        chat_deletado = await self.chat_manager.obter_chat(chat_id)
         self.assertIsNone(chat_deletado)
         
         # 8. Lista chats e verifica que está vazio
-        response_listar = self.client.get(reverse('app:listar_chats'))
+        response_listar = await self.async_client.get(reverse('app:listar_chats'))
         self.assertEqual(len(response_listar.json()['chats']), 0)
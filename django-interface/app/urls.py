@@ -7,11 +7,14 @@ urlpatterns = [
     path('', views.index, name='index'),
     path('pergunta', views.pergunta, name='pergunta'),
     path('pergunta-stream', views.pergunta_stream, name='pergunta_stream'),
+    path('api-modelo/stats', views.estatisticas_api_modelo, name='estatisticas_api_modelo'),
+    path('mongo/stats', views.estatisticas_mongo, name='estatisticas_mongo'),
     path('chats/', views.listar_chats, name='listar_chats'),
     path('chats/criar', views.criar_chat, name='criar_chat'),
     path('chats/<str:chat_id>', views.obter_chat, name='obter_chat'),
     path('chats/<str:chat_id>/deletar', views.deletar_chat, name='deletar_chat'),
     path('chats/<str:chat_id>/titulo', views.atualizar_titulo_chat, name='atualizar_titulo_chat'),
+    path('chats/<str:chat_id>/modo', views.atualizar_modo_chat, name='atualizar_modo_chat'),
     path('download-json/<str:chat_id>/', views.download_chat_json, name='download-json'),
     path('download-csv/<str:chat_id>/', views.download_chat_csv, name='download-csv'),
 ]
\ No newline at end of file
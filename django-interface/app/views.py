@@ -2,21 +2,143 @@ from django.shortcuts import render
 from django.http import JsonResponse, HttpResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
+from django.conf import settings
 import json
 import csv
-import time
-from .models import ChatManager
+import httpx
+from .models import ChatManager, codificar_cursor, saude_mongo
+from .model_api import cliente_api_modelo
 import io
+
+# Tempo máximo de espera pela API do modelo; o prazo enviado é um pouco menor
+# para que a API devolva a resposta parcial antes de o cliente desistir
+TIMEOUT_API_S = settings.MODEL_API_READ_TIMEOUT_S
+PRAZO_GERACAO_S = max(1.0, TIMEOUT_API_S - 10)
+
+# Modos de geração aceitos pela API do modelo (fast não usa raciocínio)
+MODOS_VALIDOS = ("fast", "balanced", "deep")
+
+# Turnos anteriores do chat enviados como contexto para a API do modelo
+HISTORICO_MAX_TURNOS = 8
+
+# Chats por página na listagem da barra lateral
+CHATS_POR_PAGINA = 50
+CHATS_MAX_POR_PAGINA = 200
+
+async def modo_da_pergunta(chat_manager, chat_id, modo):
+    """
+    Modo de geração de uma pergunta: o enviado na requisição ou o salvo no chat
+    
+    Lança ValueError se o modo enviado não for aceito pela API do modelo.
+    """
+    if modo is not None:
+        if modo not in MODOS_VALIDOS:
+            raise ValueError(f"Modo inválido: {modo}. Opções: {', '.join(MODOS_VALIDOS)}")
+        return modo
+    if chat_id:
+        chat = await chat_manager.obter_chat(chat_id)
+        if chat:
+            return chat.get('modo')
+    return None
+
+async def historico_do_chat(chat_manager, chat_id):
+    """Últimos turnos do chat no formato da API do modelo ({'question', 'response'})"""
+    if not chat_id:
+        return []
+    mensagens = await chat_manager.obter_historico(chat_id, HISTORICO_MAX_TURNOS)
+    return [{"question": m['pergunta'], "response": m['resposta']} for m in mensagens]
+
+def corpo_da_api(pergunta_usuario, modo, chat_id=None, historico=None):
+    """
+    JSON enviado para a API do modelo
+    
+    Com chat_id a pergunta vai como um turno da conversa: o histórico entra no
+    prompt e a API reaproveita o cache KV dos turnos anteriores (session_id).
+    """
+    corpo = {"question": pergunta_usuario, "timeout_s": PRAZO_GERACAO_S}
+    if modo:
+        corpo["mode"] = modo
+    if chat_id:
+        corpo["session_id"] = chat_id
+        corpo["history"] = historico or []
+    return corpo
+
+async def salvar_mensagem(chat_manager, chat_id, pergunta_usuario, resposta, modo, modo_enviado):
+    """Salva a mensagem, criando o chat se preciso, e guarda o modo escolhido; retorna o chat_id"""
+    if not chat_id:
+        chat_id = await chat_manager.criar_chat(titulo=f"Chat - {pergunta_usuario[:30]}", modo=modo)
+    elif modo_enviado:
+        await chat_manager.atualizar_modo(chat_id, modo)
+    await chat_manager.adicionar_mensagem(chat_id, pergunta_usuario, resposta)
+    return chat_id
+
+def evento_sse(nome, dados):
+    """Evento SSE nomeado no formato consumido pelo frontend (static/js/script.js)"""
+    return f"event: {nome}\ndata: {json.dumps(dados)}\n\n"
+
+async def eventos_da_api(api_response):
+    """Eventos JSON ('data: {...}') do streaming SSE da API do modelo, conforme chegam"""
+    async for linha in api_response.aiter_lines():
+        if linha.startswith('data:'):
+            yield json.loads(linha[5:].strip())
+
+class SecaoDoStream:
+    """
+    Texto de uma seção (pensamento ou resposta) recebido em pedaços da API
+    
+    A API envia pedaços de tokens, que podem cortar uma palavra ao meio; o
+    frontend recebe uma palavra inteira por evento, então o fim de cada
+    pedaço fica pendente até chegar o espaço seguinte.
+    """
+    
+    def __init__(self):
+        self.partes = []
+        self.pendente = ""
+        self.indice = 0
+        self.iniciada = False
+    
+    @property
+    def texto(self):
+        return "".join(self.partes).strip()
+    
+    def _numerar(self, palavras):
+        numeradas = list(enumerate(palavras, start=self.indice))
+        self.indice += len(palavras)
+        return numeradas
+    
+    def adicionar(self, pedaco):
+        """Adiciona um pedaço e retorna as palavras completas como (índice, palavra)"""
+        self.iniciada = True
+        self.partes.append(pedaco)
+        self.pendente += pedaco
+        palavras = self.pendente.split()
+        if palavras and not self.pendente[-1].isspace():
+            self.pendente = palavras.pop()
+        else:
+            self.pendente = ""
+        return self._numerar(palavras)
+    
+    def finalizar(self):
+        """Palavra que ficou pendente no fim da seção"""
+        palavras = self.pendente.split()
+        self.pendente = ""
+        return self._numerar(palavras)
+
 # Create your views here.
-def index(request):
+# Todas as views são assíncronas: sob ASGI uma pergunta esperando o modelo
+# (ou o MongoDB) não ocupa uma thread
+async def index(request):
     return render(request, 'index.html')
 
 @csrf_exempt
 @require_http_methods(["POST"])
-def pergunta(request):
+async def pergunta(request):
     """
     Endpoint para processar perguntas do usuário
-    Recebe: { "question": "...", "chat_id": "...", "max_tokens": 256 }
+    Recebe: { "question": "...", "chat_id": "...", "mode": "fast" }
+    
+    O modo (fast, balanced ou deep) fica salvo no chat e vale para as
+    próximas perguntas dele até ser trocado.
     """
     try:
         print(f"[DEBUG] Recebida requisição: {request.body}")
@@ -30,15 +152,24 @@ def pergunta(request):
         if not pergunta_usuario:
             return JsonResponse({'error': 'Pergunta não fornecida'}, status=400)
         
+        # Gerenciador de chat
+        chat_manager = ChatManager()
+        
+        try:
+            modo = await modo_da_pergunta(chat_manager, chat_id, data.get('mode'))
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+        
+        historico = await historico_do_chat(chat_manager, chat_id)
+        
         # Integração com API FastAPI do modelo
         try:
-            import requests
-            print(f"[DEBUG] Chamando API do modelo: http://localhost:8000/pergunta")
+            print(f"[DEBUG] Chamando API do modelo: /pergunta")
             
-            api_response = requests.post(
-                "http://localhost:8000/pergunta",
-                json={"question": pergunta_usuario},
-                timeout=120
+            api_response = await cliente_api_modelo().post(
+                "/pergunta",
+                json=corpo_da_api(pergunta_usuario, modo, chat_id, historico),
+                sessao=chat_id
             )
             
             print(f"[DEBUG] Status da API: {api_response.status_code}")
@@ -50,27 +181,20 @@ def pergunta(request):
             else:
                 resposta_modelo = f"Erro na API do modelo: {api_response.status_code} - {api_response.text}"
                 
-        except requests.exceptions.RequestException as e:
+        except httpx.HTTPError as e:
             print(f"[ERROR] Erro ao conectar com API do modelo: {e}")
             resposta_modelo = "Erro ao conectar com o modelo de IA. Tente novamente."
         
-        # Gerenciador de chat
-        chat_manager = ChatManager()
-        
-        # Se não existe chat_id, cria um novo chat
-        if not chat_id:
-            print("[DEBUG] Criando novo chat...")
-            chat_id = chat_manager.criar_chat(titulo=f"Chat - {pergunta_usuario[:30]}")
-            print(f"[DEBUG] Novo chat criado: {chat_id}")
-        
-        # Adiciona a mensagem ao chat
-        print(f"[DEBUG] Adicionando mensagem ao chat {chat_id}...")
-        chat_manager.adicionar_mensagem(chat_id, pergunta_usuario, resposta_modelo)
+        # Adiciona a mensagem ao chat (cria um novo se não existe chat_id)
+        print(f"[DEBUG] Adicionando mensagem ao chat {chat_id or '(novo)'}...")
+        chat_id = await salvar_mensagem(chat_manager, chat_id, pergunta_usuario, resposta_modelo,
+                                        modo, data.get('mode') is not None)
         print("[DEBUG] Mensagem adicionada com sucesso!")
         
         return JsonResponse({
             'response': resposta_modelo,
-            'chat_id': chat_id
+            'chat_id': chat_id,
+            'mode': modo
         })
     
     except Exception as e:
@@ -80,9 +204,15 @@ def pergunta(request):
         return JsonResponse({'error': str(e)}, status=500)
 
 @csrf_exempt
-def pergunta_stream(request):
+async def pergunta_stream(request):
     """
     Endpoint para streaming em tempo real usando SSE
+    Recebe: { "question": "...", "chat_id": "...", "mode": "fast", "show_thinking": true }
+    
+    Repassa o streaming /pergunta-stream da API do modelo: cada palavra é
+    enviada assim que gerada (eventos start, queue, thinking_start, thinking,
+    thinking_end, response_start, response, complete e error). A mensagem é
+    salva no MongoDB quando a API termina a geração.
     """
     # Tratar OPTIONS request (preflight CORS)
     if request.method == 'OPTIONS':
@@ -104,68 +234,103 @@ def pergunta_stream(request):
         if not pergunta_usuario:
             return JsonResponse({'error': 'Pergunta não fornecida'}, status=400)
         
-        def event_stream():
-            """Gerador para Server-Sent Events"""
+        chat_manager = ChatManager()
+        try:
+            modo = await modo_da_pergunta(chat_manager, chat_id, data.get('mode'))
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+        historico = await historico_do_chat(chat_manager, chat_id)
+        
+        async def event_stream():
+            """
+            Gerador para Server-Sent Events
+            
+            Repassa o streaming da API do modelo conforme os tokens chegam,
+            agrupados em palavras inteiras como o frontend espera.
+            """
             nonlocal chat_id  # Permitir modificar chat_id da função externa
             
             try:
-                import requests
-                
                 # 1. Enviar evento de início
-                yield f"event: start\ndata: {json.dumps({'message': 'Processando...'})}\n\n"
+                yield evento_sse('start', {'message': 'Processando...'})
                 
-                # 2. Chamar API do modelo
+                # 2. Abrir o streaming da API do modelo
                 print(f"[STREAM] Chamando API para: {pergunta_usuario}")
-                api_response = requests.post(
-                    "http://localhost:8000/pergunta",
-                    json={"question": pergunta_usuario},
-                    timeout=120
-                )
-                
-                if api_response.status_code == 200:
-                    api_data = api_response.json()
-                    thinking_text = api_data.get('thinking', '')
-                    response_text = api_data.get('response', '')
-                    
-                    # 3. Streaming do THINKING (se habilitado)
-                    if show_thinking and thinking_text:
-                        yield f"event: thinking_start\ndata: {json.dumps({'message': 'Pensando...'})}\n\n"
-                        
-                        # Enviar thinking palavra por palavra (mais rápido)
-                        words = thinking_text.split()
-                        for i, word in enumerate(words):
-                            yield f"event: thinking\ndata: {json.dumps({'word': word, 'index': i})}\n\n"
-                            time.sleep(0.01)  # 10ms entre palavras (5x mais rápido)
-                        
-                        yield f"event: thinking_end\ndata: {json.dumps({'message': 'Pensamento concluído'})}\n\n"
-                    
-                    # 4. Streaming da RESPOSTA
-                    yield f"event: response_start\ndata: {json.dumps({'message': 'Respondendo...'})}\n\n"
+                async with cliente_api_modelo().stream(
+                    "POST",
+                    "/pergunta-stream",
+                    json=corpo_da_api(pergunta_usuario, modo, chat_id, historico),
+                    sessao=chat_id
+                ) as api_response:
+                    if api_response.status_code != 200:
+                        yield evento_sse('error', {'message': f'Erro na API: {api_response.status_code}'})
+                        return
                     
-                    # Enviar resposta palavra por palavra (mais rápido)
-                    words = response_text.split()
-                    for i, word in enumerate(words):
-                        yield f"event: response\ndata: {json.dumps({'word': word, 'index': i, 'total': len(words)})}\n\n"
-                        time.sleep(0.02)  # 20ms entre palavras (4x mais rápido)
+                    pensamento = SecaoDoStream()
+                    resposta = SecaoDoStream()
+                    concluido = False
                     
-                    # 5. Salvar no MongoDB
-                    chat_manager = ChatManager()
-                    if not chat_id:
-                        chat_id = chat_manager.criar_chat(titulo=f"Chat - {pergunta_usuario[:30]}")
+                    def fim_do_pensamento():
+                        # Palavra pendente do pensamento e evento de fim (se foi exibido)
+                        if not (show_thinking and pensamento.iniciada):
+                            return []
+                        eventos = [evento_sse('thinking', {'word': word, 'index': i})
+                                   for i, word in pensamento.finalizar()]
+                        return eventos + [evento_sse('thinking_end', {'message': 'Pensamento concluído'})]
                     
-                    chat_manager.adicionar_mensagem(chat_id, pergunta_usuario, response_text)
+                    async for evento in eventos_da_api(api_response):
+                        tipo = evento.get('type')
+                        
+                        # 3. Pensamento, à medida que é gerado (se habilitado)
+                        if tipo == 'thinking_chunk' and not resposta.iniciada:
+                            if show_thinking and not pensamento.iniciada:
+                                yield evento_sse('thinking_start', {'message': 'Pensando...'})
+                            palavras = pensamento.adicionar(evento.get('content', ''))
+                            if show_thinking:
+                                for i, word in palavras:
+                                    yield evento_sse('thinking', {'word': word, 'index': i})
+                        
+                        # 4. Resposta, à medida que é gerada
+                        elif tipo == 'response_chunk':
+                            if not resposta.iniciada:
+                                for evento_fim in fim_do_pensamento():
+                                    yield evento_fim
+                                yield evento_sse('response_start', {'message': 'Respondendo...'})
+                            for i, word in resposta.adicionar(evento.get('content', '')):
+                                yield evento_sse('response', {'word': word, 'index': i})
+                        
+                        elif tipo == 'queue':
+                            yield evento_sse('queue', {'position': evento.get('position'),
+                                                       'estimated_wait_s': evento.get('estimated_wait_s')})
+                        
+                        elif tipo == 'done':
+                            concluido = True
+                            break
                     
-                    # 6. Evento de finalização
-                    yield f"event: complete\ndata: {json.dumps({'chat_id': chat_id, 'message': 'Concluído!'})}\n\n"
+                    if not concluido:
+                        # A API caiu no meio da geração: nada é salvo
+                        yield evento_sse('error', {'message': 'A API do modelo encerrou o streaming antes do fim'})
+                        return
                     
-                else:
-                    yield f"event: error\ndata: {json.dumps({'message': f'Erro na API: {api_response.status_code}'})}\n\n"
+                    if not resposta.iniciada:
+                        for evento_fim in fim_do_pensamento():
+                            yield evento_fim
+                        yield evento_sse('response_start', {'message': 'Respondendo...'})
+                    for i, word in resposta.finalizar():
+                        yield evento_sse('response', {'word': word, 'index': i})
+                
+                # 5. Salvar no MongoDB quando o streaming termina
+                chat_id = await salvar_mensagem(chat_manager, chat_id, pergunta_usuario, resposta.texto,
+                                                modo, data.get('mode') is not None)
+                
+                # 6. Evento de finalização
+                yield evento_sse('complete', {'chat_id': chat_id, 'message': 'Concluído!'})
                 
             except Exception as e:
                 print(f"[STREAM ERROR] {e}")
                 import traceback
                 traceback.print_exc()
-                yield f"event: error\ndata: {json.dumps({'message': f'Erro: {str(e)}'})}\n\n"
+                yield evento_sse('error', {'message': f'Erro: {str(e)}'})
         
         response = StreamingHttpResponse(
             event_stream(),
@@ -183,16 +348,27 @@ def pergunta_stream(request):
         return JsonResponse({'error': str(e)}, status=500)
 
 
+@require_http_methods(["GET"])
+async def estatisticas_api_modelo(request):
+    """Estado do pool de conexões com a API do modelo neste processo"""
+    return JsonResponse(cliente_api_modelo().stats())
+
+@require_http_methods(["GET"])
+async def estatisticas_mongo(request):
+    """Ping e estado do pool de conexões com o MongoDB neste processo (503 se o ping falhar)"""
+    saude = await saude_mongo()
+    return JsonResponse(saude, status=200 if saude['ok'] else 503)
+
 @csrf_exempt
 @require_http_methods(["POST"])
-def criar_chat(request):
+async def criar_chat(request):
     """Cria um novo chat"""
     try:
         data = json.loads(request.body)
         titulo = data.get('titulo', 'Novo Chat')
         
         chat_manager = ChatManager()
-        chat_id = chat_manager.criar_chat(titulo)
+        chat_id = await chat_manager.criar_chat(titulo)
         
         return JsonResponse({
             'chat_id': chat_id,
@@ -204,30 +380,48 @@ def criar_chat(request):
         return JsonResponse({'error': str(e)}, status=500)
 
 @require_http_methods(["GET"])
-def listar_chats(request):
-    """Lista todos os chats"""
+async def listar_chats(request):
+    """
+    Lista os chats, mais recentes primeiro, uma página por vez
+    Parâmetros: ?limit=50&cursor=...
+    
+    Cada chat traz só título, modo, datas e total_mensagens (as mensagens
+    vêm em /chats/<chat_id>). Se houver mais chats, next_cursor leva à
+    próxima página; senão é null.
+    """
     try:
+        try:
+            limite = int(request.GET.get('limit', CHATS_POR_PAGINA))
+        except ValueError:
+            return JsonResponse({'error': 'limit deve ser um número inteiro'}, status=400)
+        if not 1 <= limite <= CHATS_MAX_POR_PAGINA:
+            return JsonResponse({'error': f'limit deve estar entre 1 e {CHATS_MAX_POR_PAGINA}'}, status=400)
+        
         chat_manager = ChatManager()
-        chats = chat_manager.listar_chats()
+        try:
+            # Um chat a mais só para saber se existe próxima página
+            chats = await chat_manager.listar_chats(limite + 1, request.GET.get('cursor'))
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+        proximo_cursor = codificar_cursor(chats[limite - 1]) if len(chats) > limite else None
+        chats = chats[:limite]
         
         # Converte datetime para string
         for chat in chats:
             chat['criado_em'] = chat['criado_em'].isoformat()
             chat['atualizado_em'] = chat['atualizado_em'].isoformat()
-            for msg in chat['mensagens']:
-                msg['timestamp'] = msg['timestamp'].isoformat()
         
-        return JsonResponse({'chats': chats})
+        return JsonResponse({'chats': chats, 'next_cursor': proximo_cursor})
     
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=500)
 
 @require_http_methods(["GET"])
-def obter_chat(request, chat_id):
+async def obter_chat(request, chat_id):
     """Obtém um chat específico"""
     try:
         chat_manager = ChatManager()
-        chat = chat_manager.obter_chat(chat_id)
+        chat = await chat_manager.obter_chat(chat_id)
         
         if not chat:
             return JsonResponse({'error': 'Chat não encontrado'}, status=404)
@@ -245,13 +439,18 @@ def obter_chat(request, chat_id):
 
 @csrf_exempt
 @require_http_methods(["DELETE"])
-def deletar_chat(request, chat_id):
+async def deletar_chat(request, chat_id):
     """Deleta um chat"""
     try:
         chat_manager = ChatManager()
-        sucesso = chat_manager.deletar_chat(chat_id)
+        sucesso = await chat_manager.deletar_chat(chat_id)
         
         if sucesso:
+            # Libera o cache KV da conversa na API do modelo (se ela estiver fora, expira por LRU)
+            try:
+                await cliente_api_modelo().delete(f"/sessoes/{chat_id}", sessao=chat_id, timeout=2)
+            except httpx.HTTPError:
+                pass
             return JsonResponse({'mensagem': 'Chat deletado com sucesso'})
         else:
             return JsonResponse({'error': 'Chat não encontrado'}, status=404)
@@ -261,7 +460,7 @@ def deletar_chat(request, chat_id):
 
 @csrf_exempt
 @require_http_methods(["PUT"])
-def atualizar_titulo_chat(request, chat_id):
+async def atualizar_titulo_chat(request, chat_id):
     """Atualiza o título de um chat"""
     try:
         data = json.loads(request.body)
@@ -271,7 +470,7 @@ def atualizar_titulo_chat(request, chat_id):
             return JsonResponse({'error': 'Título não fornecido'}, status=400)
         
         chat_manager = ChatManager()
-        chat_manager.atualizar_titulo(chat_id, novo_titulo)
+        await chat_manager.atualizar_titulo(chat_id, novo_titulo)
         
         return JsonResponse({'mensagem': 'Título atualizado com sucesso'})
     
@@ -280,12 +479,31 @@ def atualizar_titulo_chat(request, chat_id):
 
 
 
+@csrf_exempt
+@require_http_methods(["PUT"])
+async def atualizar_modo_chat(request, chat_id):
+    """Troca o modo de geração (fast, balanced ou deep) usado nas próximas perguntas do chat"""
+    try:
+        data = json.loads(request.body)
+        modo = data.get('mode')
+        
+        if modo not in MODOS_VALIDOS:
+            return JsonResponse({'error': f"Modo inválido. Opções: {', '.join(MODOS_VALIDOS)}"}, status=400)
+        
+        chat_manager = ChatManager()
+        await chat_manager.atualizar_modo(chat_id, modo)
+        
+        return JsonResponse({'mensagem': 'Modo atualizado com sucesso', 'mode': modo})
+    
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
+
 @require_http_methods(["GET"])
-def download_chat_json(request, chat_id):
+async def download_chat_json(request, chat_id):
     """Download do chat em formato JSON"""
     try:
         chat_manager = ChatManager()
-        chat = chat_manager.obter_chat(chat_id)
+        chat = await chat_manager.obter_chat(chat_id)
 
         if not chat:
             return JsonResponse({'error': 'Chat não encontrado'}, status=404)
@@ -316,12 +534,12 @@ def download_chat_json(request, chat_id):
         return JsonResponse({'error': str(e)}, status=500)
     
 @require_http_methods(["GET"])
-def download_chat_csv(request, chat_id):
+async def download_chat_csv(request, chat_id):
     """Download do chat em formato CSV"""
     try:
         # Buscar chat do MongoDB
         chat_manager = ChatManager()
-        chat = chat_manager.obter_chat(chat_id)
+        chat = await chat_manager.obter_chat(chat_id)
 
         if not chat:
             return JsonResponse({'error': 'Chat não encontrado'}, status=404)
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -31,6 +32,8 @@ ALLOWED_HOSTS = []
 # Application definition
 
 INSTALLED_APPS = [
+    # Servidor ASGI: o runserver passa a servir as views assíncronas com streaming
+    "daphne",
     "django.contrib.admin",
     "django.contrib.auth",
     "django.contrib.contenttypes",
@@ -70,6 +73,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = "chat.wsgi.application"
+ASGI_APPLICATION = "chat.asgi.application"
 
 
 # Database
@@ -155,4 +159,33 @@ STATIC_ROOT = BASE_DIR / "static"
 
 STATICFILES_DIRS = [
     BASE_DIR / "app/static",
-]
\ No newline at end of file
+]
+
+# API do modelo (FastAPI): uma ou mais URLs base separadas por vírgula.
+# Com várias URLs, as perguntas de um mesmo chat vão sempre para a mesma
+# instância (o cache KV da conversa fica nela) e as demais são distribuídas
+MODEL_API_URLS = [url.strip().rstrip("/") for url in
+                  os.getenv("MODEL_API_URLS", "http://localhost:8000").split(",") if url.strip()]
+# Conexões keep-alive mantidas por instância da API
+MODEL_API_POOL_SIZE = int(os.getenv("MODEL_API_POOL_SIZE", "32"))
+MODEL_API_CONNECT_TIMEOUT_S = float(os.getenv("MODEL_API_CONNECT_TIMEOUT_S", "3"))
+MODEL_API_READ_TIMEOUT_S = float(os.getenv("MODEL_API_READ_TIMEOUT_S", "120"))
+# Novas tentativas (com backoff exponencial) para falhas de conexão e, em
+# métodos idempotentes, para erros de leitura e respostas 502/503/504
+MODEL_API_RETRIES = int(os.getenv("MODEL_API_RETRIES", "2"))
+MODEL_API_BACKOFF_S = float(os.getenv("MODEL_API_BACKOFF_S", "0.2"))
+
+# MongoDB (chats): um cliente compartilhado por processo, com pool de conexões.
+# MONGO_URI, se definida, substitui host, porta e credenciais
+MONGO_URI = os.getenv("MONGO_URI", "")
+MONGO_HOST = os.getenv("MONGO_HOST", "localhost")
+MONGO_PORT = int(os.getenv("MONGO_PORT", "27017"))
+MONGO_USERNAME = os.getenv("MONGO_USERNAME", "admin")
+MONGO_PASSWORD = os.getenv("MONGO_PASSWORD", "admin")
+MONGO_AUTH_SOURCE = os.getenv("MONGO_AUTH_SOURCE", "admin")
+MONGO_DB_NAME = os.getenv("MONGO_DB_NAME", "chat_database")
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "100"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+MONGO_MAX_IDLE_TIME_MS = int(os.getenv("MONGO_MAX_IDLE_TIME_MS", "300000"))
+MONGO_CONNECT_TIMEOUT_MS = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "5000"))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000"))